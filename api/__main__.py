@@ -0,0 +1,73 @@
+import argparse
+import importlib
+import os
+import sys
+import tempfile
+import time
+
+# python -m api                   run the app with uvicorn
+# python -m api --workers 4       run 4 worker processes that keep their caches in step
+# python -m api --check-startup   report import and init time per component
+
+# Imported in dependency order, so each line is the cost that module adds on top of the previous ones
+STARTUP_MODULES = [
+    "api.settings",
+    "api.database",
+    "api.models",
+    "api.schemas",
+    "api.crud",
+    "api.auth",
+    "api.main",
+]
+
+
+def check_startup(max_total_ms: float | None):
+    rows = []
+    for name in STARTUP_MODULES:
+        started = time.perf_counter()
+        importlib.import_module(name)
+        rows.append((f"import {name}", time.perf_counter() - started))
+
+    from .services import services
+
+    services.startup()
+    rows.extend((f"init {name}", seconds) for name, seconds in services.init_seconds.items())
+
+    total_ms = sum(seconds for _, seconds in rows) * 1000
+    width = max(len(label) for label, _ in rows)
+    for label, seconds in rows:
+        print(f"{label:<{width}}  {seconds * 1000:8.1f} ms")
+    print(f"{'total':<{width}}  {total_ms:8.1f} ms")
+
+    if max_total_ms is not None and total_ms > max_total_ms:
+        print(f"Startup took {total_ms:.1f} ms, over the {max_total_ms:.1f} ms budget")
+        return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m api")
+    parser.add_argument("--check-startup", action="store_true", help="report import and init time per component and exit")
+    parser.add_argument("--max-startup-ms", type=float, default=None, help="with --check-startup, exit 1 when the total is over this")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes")
+    args = parser.parse_args()
+
+    if args.check_startup:
+        return check_startup(args.max_startup_ms)
+
+    # An explicitly empty WORKER_BUS_DIR turns the bus off
+    if args.workers > 1 and "WORKER_BUS_DIR" not in os.environ:
+        # In-process caches are only correct across workers when they share a bus
+        os.environ["WORKER_BUS_DIR"] = tempfile.mkdtemp(prefix=f"api-bus-{args.port}-")
+        print(f"WORKER_BUS_DIR not set, using {os.environ['WORKER_BUS_DIR']}")
+
+    import uvicorn
+
+    uvicorn.run("api.main:app", host=args.host, port=args.port, workers=args.workers)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+import asyncio
+import json
+import time
+from collections import deque
+
+from . import metrics
+from .settings import get_settings
+
+# Admission control in front of the threadpool.
+#
+# Sync routes run on anyio's threadpool (THREADPOOL_SIZE threads). When every thread is busy,
+# new requests wait in anyio's queue where nothing sees them and nothing gives up. Instead each
+# request is put in a class (auth: bcrypt and token exchange, write, read) and has to get one of
+# that class's slots first. The per-class limits add up to the pool size by default, so slow
+# logins can't take the threads reads need and the pool itself never has a queue.
+#
+# A slot only bounds work that runs in the threadpool. Routes in the auth class are plain def
+# (or hand their blocking calls to run_in_threadpool): bcrypt in an async def would run on the
+# event loop and stall every request on the worker, whatever the auth limit.
+#
+# A request that finds no free slot waits in its class's queue, up to QUEUE_TIMEOUT_MS. If the
+# queue is full, or the wait runs out, it gets a 503 with Retry-After at once. The timeout adapts
+# (the CoDel idea): when the queue hasn't been empty for CODEL_INTERVAL_MS, it is a standing queue
+# that won't drain by waiting, and the timeout drops to CODEL_TARGET_MS until the queue empties.
+#
+# Queue waits go to the admission_wait_seconds metric and a "queue" Server-Timing entry.
+# Streams, static files, metrics and CORS preflights are not limited.
+
+settings = get_settings()
+
+THREADPOOL_SIZE = settings.threadpool_size
+QUEUE_TIMEOUT_MS = settings.admission_queue_timeout_ms
+CODEL_TARGET_MS = settings.admission_codel_target_ms
+CODEL_INTERVAL_MS = settings.admission_codel_interval_ms
+RETRY_AFTER_SECONDS = 1
+
+# class -> (concurrent requests, queued requests)
+LIMITS = {
+    "auth": (settings.admission_auth_limit, settings.admission_auth_queue),
+    "write": (settings.admission_write_limit, settings.admission_write_queue),
+    "read": (settings.admission_read_limit, settings.admission_read_queue),
+}
+
+EXEMPT_PREFIXES = ("/static/", "/storage/", "/metrics", "/docs", "/redoc", "/openapi.json")
+
+
+def configure_threadpool():
+    from anyio import to_thread
+
+    to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+
+
+def route_class(method: str, path: str):
+    if method == "OPTIONS" or path.startswith(EXEMPT_PREFIXES) or path.endswith("/stream"):
+        return None
+    if path.startswith("/auth/") or (method == "POST" and path.rstrip("/") == "/users"):
+        return "auth"
+    if method in ("GET", "HEAD"):
+        return "read"
+    return "write"
+
+
+class Shed(Exception):
+    def __init__(self, reason: str):
+        self.reason = reason
+
+
+class Gate:
+    """A counting semaphore with a bounded FIFO queue and an adaptive wait limit. Event loop only."""
+
+    def __init__(self, limit: int, max_queue: int):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.active = 0
+        self._waiters = deque()
+        self._queue_empty_at = time.monotonic()
+
+    def _timeout(self, now: float) -> float:
+        if self._waiters and (now - self._queue_empty_at) * 1000 > CODEL_INTERVAL_MS:
+            return CODEL_TARGET_MS / 1000
+        return QUEUE_TIMEOUT_MS / 1000
+
+    async def acquire(self):
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            raise Shed("queue_full")
+        now = time.monotonic()
+        timeout = self._timeout(now)
+        if not self._waiters:
+            self._queue_empty_at = now
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            raise Shed("timeout")
+        except asyncio.CancelledError:
+            # Handed a slot just as the client went away: pass it on
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            if not self._waiters:
+                self._queue_empty_at = time.monotonic()
+
+    def release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # The slot moves straight to the waiter; active stays the same
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+
+def _shed_response(reason: str):
+    body = json.dumps({"detail": "Server is busy, try again shortly"}).encode()
+    return body, [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode()),
+        (b"retry-after", str(RETRY_AFTER_SECONDS).encode()),
+    ]
+
+
+class AdmissionMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self.gates = {name: Gate(limit, queue) for name, (limit, queue) in LIMITS.items()}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        name = route_class(scope["method"], scope["path"])
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+
+        gate = self.gates[name]
+        started = time.perf_counter()
+        try:
+            await gate.acquire()
+        except Shed as shed:
+            waited = time.perf_counter() - started
+            metrics.increment("admission_shed", route_class=name, reason=shed.reason)
+            metrics.increment("admission_wait_seconds", waited, route_class=name)
+            body, headers = _shed_response(shed.reason)
+            await send({"type": "http.response.start", "status": 503, "headers": headers})
+            await send({"type": "http.response.body", "body": body})
+            return
+        waited = time.perf_counter() - started
+        metrics.increment("admission_admitted", route_class=name)
+        metrics.increment("admission_wait_seconds", waited, route_class=name)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", f"queue;dur={waited * 1000:.1f}".encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            gate.release()
@@ -1,26 +1,29 @@
-import os
-from pathlib import Path
+import hashlib
+import secrets
+import uuid
 from datetime import datetime, timedelta
-from dotenv import load_dotenv
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, Request, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import RedirectResponse
 from sqlalchemy.orm import Session
 import httpx
 from jose import jwt, JWTError
 from .database import get_db
+from .settings import get_settings
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm 
 from passlib.context import CryptContext
 from . import crud
+from . import entities
 from . import models
 from . import schemas
+from . import rate_limit
+from . import metrics
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
 # --- Configuration ---
-# Load .env file from the backend directory
-dotenv_path = Path(__file__).resolve().parent / '.env'
-load_dotenv(dotenv_path=dotenv_path)
+settings = get_settings()
 
 router = APIRouter(
     prefix='/auth',
@@ -28,14 +31,15 @@ router = APIRouter(
 )
 
 # Google OAuth Credentials
-GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
-GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
-GOOGLE_REDIRECT_URI = os.getenv("GOOGLE_REDIRECT_URI")
+GOOGLE_CLIENT_ID = settings.google_client_id
+GOOGLE_CLIENT_SECRET = settings.google_client_secret
+GOOGLE_REDIRECT_URI = settings.google_redirect_uri
 
 # JWT Settings
-JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY")
+JWT_SECRET_KEY = settings.jwt_secret_key
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+REFRESH_TOKEN_EXPIRE_DAYS = settings.refresh_token_expire_days
 
 def verify_password(plain_password, hashed_password):
     # Truncate to 72 characters to stay well under bcrypt's 72-byte limit
@@ -70,7 +74,32 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
     encoded_jwt = jwt.encode(to_encode, JWT_SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def hash_refresh_token(token: str) -> str:
+    """Refresh tokens are stored as sha256 digests so a leaked table cannot be replayed."""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def create_refresh_token(db: Session, user_id: int, family_id: str | None = None) -> str:
+    """Creates an opaque refresh token, stores its hash and returns the raw token."""
+    token = secrets.token_urlsafe(32)
+    crud.create_refresh_token(
+        db,
+        user_id=user_id,
+        token_hash=hash_refresh_token(token),
+        family_id=family_id or uuid.uuid4().hex,
+        expires_at=datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    )
+    return token
+
+def issue_tokens(db: Session, user: models.User):
+    """Access + refresh token pair for a freshly authenticated user."""
+    access_token = create_access_token(
+        data={"sub": user.email}, expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+    refresh_token = create_refresh_token(db, user_id=user.id)
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token", auto_error=False)
 
 async def get_current_user(token = Depends(oauth2_scheme), db: Session = Depends(get_db)):
     credentials_exception = HTTPException(
@@ -94,10 +123,33 @@ async def get_current_user(token = Depends(oauth2_scheme), db: Session = Depends
     if user is None:
         raise credentials_exception
     return user 
+
+async def get_optional_user(token = Depends(optional_oauth2_scheme), db: Session = Depends(get_db)):
+    # Anonymous requests get None; a token that is sent must still be valid
+    if token is None:
+        return None
+    return await get_current_user(token, db)
  
     
 
 
+def google_user_tokens(db: Session, user_email: str):
+    user = crud.get_user_by_email(db, email=user_email)
+    if not user:
+        user_in = schemas.UserCreate(email=user_email, password="google_oauth_user")
+        user = crud.create_user(db=db, user=user_in)
+        user.is_verified = True
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+        entities.invalidate("user", user.id)
+        print(f"New user created: {user.email}")
+    else:
+        print(f"Existing user logged in: {user.email}")
+
+    return issue_tokens(db, user)
+
+
 # --- Authentication Routes ---
 @router.get("/google/login")
 async def google_login():
@@ -186,24 +238,8 @@ async def google_callback(code: str, db: Session = Depends(get_db)):
         if not user_email:
             raise HTTPException(status_code=400, detail="Email not found in ID token.")
         
-        user = crud.get_user_by_email(db, email=user_email)
-        if not user:
-            user_in = schemas.UserCreate(email=user_email, password="google_oauth_user")
-            user = crud.create_user(db=db, user=user_in)
-            user.is_verified = True
-            db.add(user)
-            db.commit()
-            db.refresh(user)
-            print(f"New user created: {user.email}")
-        else:
-            print(f"Existing user logged in: {user.email}")
-        
-        access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-        access_token = create_access_token(
-            data={"sub": user.email}, expires_delta=access_token_expires
-        )
-        
-        return {"access_token": access_token, "token_type": "bearer"}
+        # The database work is blocking; keep it off the event loop like the password login
+        return await run_in_threadpool(google_user_tokens, db, user_email)
     
     except JWTError as e:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=f"Invalid ID token: {e}")
@@ -215,8 +251,10 @@ async def google_callback(code: str, db: Session = Depends(get_db)):
     
 
 
+# Plain def: the rate limit check and bcrypt are blocking, so they run in the threadpool
 @router.post("/token", response_model = schemas.Token)
-async def login_for_acess_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+def login_for_acess_token(request: Request, form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+    rate_limit.check_login(request, form_data.username)
     user = authenticate_user(db, form_data.username , form_data.password)    
     if not user:
         raise HTTPException(
@@ -224,8 +262,66 @@ async def login_for_acess_token(form_data: OAuth2PasswordRequestForm = Depends()
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token_expire = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    return issue_tokens(db, user)
+
+
+@router.post("/refresh", response_model=schemas.Token)
+def refresh_access_token(body: schemas.RefreshTokenRequest, db: Session = Depends(get_db)):
+    """
+    Exchanges a refresh token for a new access token and a new refresh token.
+    The presented token is single use; presenting it again revokes its whole family.
+    """
+    invalid_token = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    db_token = crud.get_refresh_token_by_hash(db, hash_refresh_token(body.refresh_token))
+    if db_token is None:
+        raise invalid_token
+    if db_token.revoked_at is not None:
+        if db_token.replaced_by_id is not None:
+            # An already rotated token came back: someone else holds a copy of it
+            metrics.increment("refresh_token_reuse_detected")
+            crud.revoke_refresh_token_family(db, family_id=db_token.family_id)
+        raise invalid_token
+    if db_token.expires_at < datetime.utcnow():
+        raise invalid_token
+
+    user = crud.get_cached_user(db, user_id=db_token.user_id)
+    if user is None or not user["is_active"]:
+        raise invalid_token
+
+    refresh_token = secrets.token_urlsafe(32)
+    rotated = crud.rotate_refresh_token(
+        db,
+        db_token=db_token,
+        token_hash=hash_refresh_token(refresh_token),
+        expires_at=datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    )
+    if rotated is None:
+        # Lost a race with another refresh of the same token
+        metrics.increment("refresh_token_reuse_detected")
+        crud.revoke_refresh_token_family(db, family_id=db_token.family_id)
+        raise invalid_token
+
     access_token = create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expire
+        data={"sub": user["email"]}, expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     )
-    return {"access_token": access_token, "token_type":"bearer"}
\ No newline at end of file
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
+
+
+@router.post("/logout")
+def logout(body: schemas.RefreshTokenRequest, db: Session = Depends(get_db)):
+    """Revokes the session the refresh token belongs to."""
+    db_token = crud.get_refresh_token_by_hash(db, hash_refresh_token(body.refresh_token))
+    if db_token is not None:
+        crud.revoke_refresh_token_family(db, family_id=db_token.family_id)
+    return {"message": "Logged out"}
+
+
+@router.post("/logout-all")
+def logout_everywhere(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+    """Revokes every refresh token of the current user, signing out all devices."""
+    revoked = crud.revoke_user_refresh_tokens(db, user_id=current_user.id)
+    return {"message": "Logged out of all sessions", "revoked": revoked}
\ No newline at end of file
@@ -0,0 +1,87 @@
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends
+from sqlalchemy.orm import Session
+
+from . import auth, crud, facets, models, schemas, sections
+from .database import get_db
+
+# One request per page load for the blog, resources and clubs views: the first page of
+# the list, its categories, the total for the current filters and, for the blog, what the
+# signed-in viewer has bookmarked. Everything is read in the request's single session
+# with the same crud queries the individual endpoints use.
+#
+# Categories are cached as sections (see sections.py), dropped whenever one is created;
+# the total comes from the facets cache. The list page and the viewer's bookmarks are
+# always read fresh, since they change with every bookmark and comment.
+
+router = APIRouter(prefix="/bootstrap", tags=["bootstrap"])
+
+
+def _categories(db: Session, kind: str):
+    query, schema = {
+        "post": (crud.get_post_categories, schemas.PostCategory),
+        "resource": (crud.get_resource_categories, schemas.ResourceCategory),
+        "club": (crud.get_club_categories, schemas.ClubCategory),
+    }[kind]
+    return sections.cache.get(
+        f"{kind}_categories", lambda: [schema.model_validate(c).model_dump() for c in query(db)]
+    )
+
+
+@router.get("/blog", response_model=schemas.BlogBootstrap)
+def bootstrap_blog(
+    skip: int = 0,
+    limit: int = 100,
+    category_id: Optional[int] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    search: Optional[str] = None,
+    db: Session = Depends(get_db),
+    viewer: Optional[models.User] = Depends(auth.get_optional_user),
+):
+    filters = {"category_id": category_id, "start_date": start_date, "end_date": end_date, "search": search}
+    return {
+        "posts": crud.get_posts(db, skip=skip, limit=limit, **filters),
+        "categories": _categories(db, "post"),
+        "total": facets.get_total(db, "posts", **filters),
+        "viewer": viewer,
+        "bookmarks": crud.get_bookmarks_by_user(db, viewer.id) if viewer else [],
+    }
+
+
+@router.get("/resources", response_model=schemas.ResourcesBootstrap)
+def bootstrap_resources(
+    skip: int = 0,
+    limit: int = 100,
+    category_id: Optional[int] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    search: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    filters = {"category_id": category_id, "start_date": start_date, "end_date": end_date, "search": search}
+    return {
+        "resources": crud.get_resources(db, skip=skip, limit=limit, **filters),
+        "categories": _categories(db, "resource"),
+        "total": facets.get_total(db, "resources", **filters),
+    }
+
+
+@router.get("/clubs", response_model=schemas.ClubsBootstrap)
+def bootstrap_clubs(
+    skip: int = 0,
+    limit: int = 100,
+    category_id: Optional[int] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    search: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    filters = {"category_id": category_id, "start_date": start_date, "end_date": end_date, "search": search}
+    return {
+        "clubs": crud.get_clubs(db, skip=skip, limit=limit, **filters),
+        "categories": _categories(db, "club"),
+        "total": facets.get_total(db, "clubs", **filters),
+    }
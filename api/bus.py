@@ -0,0 +1,109 @@
+import json
+import os
+import socket
+import threading
+import uuid
+from collections import defaultdict
+from pathlib import Path
+
+from . import metrics
+from .settings import get_settings
+
+# Local message bus between uvicorn workers on the same host.
+#
+# Every worker binds a Unix datagram socket in WORKER_BUS_DIR and publishing sends the
+# message to every other socket in that directory. Sockets of dead workers are removed
+# the first time a send to them is refused. When WORKER_BUS_DIR is not set (single
+# worker, Windows) publish() is a no-op and everything stays in-process.
+#
+# Delivery is best effort. Every message that is not delivered (too large, a peer's socket
+# buffer full, a handler that failed) is counted in `dropped` and the bus_dropped metric;
+# /metrics/caches reports it per worker.
+
+MAX_MESSAGE_BYTES = 64 * 1024
+
+
+class LocalBus:
+    def __init__(self, directory: str | None):
+        self.directory = Path(directory) if directory else None
+        self.path = None
+        self._handlers = defaultdict(list)
+        self._sock = None
+        self._sender = None
+        self._send_lock = threading.Lock()
+        self._loop = None
+        self.dropped = 0
+
+    @property
+    def enabled(self):
+        return self._sock is not None
+
+    def subscribe(self, topic: str, handler):
+        """handler(payload) is called on the event loop for messages from other workers."""
+        self._handlers[topic].append(handler)
+
+    def start(self, loop):
+        if self.directory is None or self._sock is not None:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.path = self.directory / f"{os.getpid()}-{uuid.uuid4().hex[:8]}.sock"
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.bind(str(self.path))
+        self._sock.setblocking(False)
+        self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sender.setblocking(False)
+        self._loop = loop
+        loop.add_reader(self._sock.fileno(), self._on_readable)
+
+    def stop(self):
+        if self._sock is None:
+            return
+        self._loop.remove_reader(self._sock.fileno())
+        self._sock.close()
+        self._sender.close()
+        self._sock = self._sender = None
+        self.path.unlink(missing_ok=True)
+
+    def _on_readable(self):
+        while True:
+            try:
+                data = self._sock.recv(MAX_MESSAGE_BYTES)
+            except (BlockingIOError, InterruptedError):
+                return
+            try:
+                message = json.loads(data)
+                for handler in self._handlers.get(message["topic"], ()):
+                    handler(message["payload"])
+            except Exception as e:
+                print(f"ERROR handling bus message: {e}")
+                self._drop("handler_error", "unknown")
+
+    def _drop(self, reason: str, topic: str):
+        self.dropped += 1
+        metrics.increment("bus_dropped", reason=reason, topic=topic)
+
+    def publish(self, topic: str, payload):
+        """Sends payload to every other worker. Safe to call from any thread."""
+        if self._sock is None:
+            return
+        data = json.dumps({"topic": topic, "payload": payload}, default=str).encode()
+        if len(data) > MAX_MESSAGE_BYTES:
+            self._drop("too_large", topic)
+            return
+        with self._send_lock:
+            for peer in self.directory.glob("*.sock"):
+                if peer == self.path:
+                    continue
+                try:
+                    self._sender.sendto(data, str(peer))
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # Worker is gone but left its socket file behind
+                    peer.unlink(missing_ok=True)
+                except BlockingIOError:
+                    self._drop("peer_busy", topic)
+                except OSError as e:
+                    print(f"WARNING: bus message to {peer.name} not sent: {e}")
+                    self._drop("error", topic)
+
+
+local_bus = LocalBus(get_settings().worker_bus_dir)
@@ -0,0 +1,50 @@
+import os
+import threading
+
+from . import metrics
+from .bus import local_bus
+
+# Registry of the in-process caches that have to follow writes made by other workers.
+#
+# Each cache registers a name and a handler. After a write, the code that changed the
+# cache locally calls broadcast(name, payload), and every other worker runs
+# handler(payload) on its event loop. Messages travel over the local bus (Unix datagram
+# sockets in WORKER_BUS_DIR). With a single worker broadcast() only counts the call.
+
+
+class CacheRegistry:
+    def __init__(self):
+        self._caches = {}
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, handler, size=None):
+        """size() is optional and only used for stats()."""
+        self._caches[name] = (handler, size)
+        self._counts[name] = {"sent": 0, "received": 0}
+
+    def broadcast(self, name: str, payload):
+        with self._lock:
+            self._counts[name]["sent"] += 1
+        local_bus.publish("cache", {"name": name, "payload": payload})
+
+    def _on_message(self, message):
+        entry = self._caches.get(message["name"])
+        if entry is None:
+            return
+        with self._lock:
+            self._counts[message["name"]]["received"] += 1
+        metrics.increment("cache_invalidations_received", cache=message["name"])
+        entry[0](message["payload"])
+
+    def stats(self):
+        with self._lock:
+            counts = {name: dict(count) for name, count in self._counts.items()}
+        for name, (_, size) in self._caches.items():
+            if size is not None:
+                counts[name]["size"] = size()
+        return {"pid": os.getpid(), "bus": local_bus.enabled, "bus_dropped": local_bus.dropped, "caches": counts}
+
+
+registry = CacheRegistry()
+local_bus.subscribe("cache", registry._on_message)
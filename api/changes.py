@@ -0,0 +1,153 @@
+import base64
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import delete, insert, literal, select, tuple_
+from sqlalchemy.orm import Session, joinedload, selectinload
+
+from . import metrics, models
+from .settings import get_settings
+
+# Delta sync: GET /changes?since=<token> returns the posts, resources, clubs and comments
+# written since the token was issued, plus tombstones for the ones deleted, and a new token.
+#
+# Every row carries change_seq, a number taken from a counter row by the transaction that
+# wrote it (models.next_change_seq); deletes leave a row in tombstones, numbered the same way.
+# A writer keeps the counter row locked from its first write until it commits, so the numbers
+# are committed in order: once a reader has seen number n, nothing numbered n or lower can
+# still appear. updated_at is not used here: a clock says when a row was stamped, not when it
+# became visible. The token is opaque to clients: per table it holds the (change_seq, id) of
+# the last row sent, and reads continue strictly after it, so paging never repeats or skips.
+#
+# Tombstones are kept TOMBSTONE_DAYS; a token older than that, or from before change_seq,
+# gets a 410 and the client starts over without one.
+
+settings = get_settings()
+
+DEFAULT_LIMIT = 200
+MAX_LIMIT = settings.changes_max_limit
+TOMBSTONE_DAYS = settings.changes_tombstone_days
+PRUNE_INTERVAL_SECONDS = settings.changes_prune_interval_seconds
+
+ENTITIES = {
+    "posts": (models.Post, [joinedload(models.Post.owner), joinedload(models.Post.category), selectinload(models.Post.bookmarks)]),
+    "resources": (models.Resource, [joinedload(models.Resource.category)]),
+    "clubs": (models.Club, [joinedload(models.Club.category)]),
+    "comments": (models.Comment, [joinedload(models.Comment.user)]),
+}
+
+
+class InvalidToken(ValueError):
+    pass
+
+
+class TokenExpired(Exception):
+    pass
+
+
+def record_deletion(db: Session, entity: str, entity_id: int):
+    """Adds the tombstone to the caller's transaction."""
+    db.add(models.Tombstone(entity=entity, entity_id=entity_id))
+
+
+def record_deletions(db: Session, entity: str, id_column, *criteria):
+    """Tombstones for every row matching criteria, in one INSERT ... SELECT, before the rows go."""
+    now = literal(datetime.utcnow(), models.Tombstone.deleted_at.type)
+    db.execute(insert(models.Tombstone).from_select(
+        ["entity", "entity_id", "deleted_at"],
+        select(literal(entity), id_column, now).where(*criteria),
+    ))
+
+
+TOKEN_VERSION = 2
+
+
+def _naive_utc(value: datetime) -> datetime:
+    # Postgres hands back aware datetimes, SQLite naive ones; keep everything naive UTC
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def encode_token(issued_at: datetime, cursors: dict) -> str:
+    data = {"v": TOKEN_VERSION, "at": issued_at.isoformat(), **{name: list(cursor) if cursor else None for name, cursor in cursors.items()}}
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip("=")
+
+
+def decode_token(token: str):
+    """Returns (issued_at, {name: (change_seq, id) or None})."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        data = json.loads(raw)
+        if data.get("v") != TOKEN_VERSION:
+            # Issued before change_seq: its positions mean nothing now
+            raise TokenExpired()
+        issued_at = _naive_utc(datetime.fromisoformat(data["at"]))
+        cursors = {
+            name: (int(data[name][0]), int(data[name][1])) if data[name] is not None else None
+            for name in (*ENTITIES, "deleted")
+        }
+    except (ValueError, TypeError, AttributeError, KeyError, IndexError) as e:
+        raise InvalidToken("Malformed change token") from e
+    return issued_at, cursors
+
+
+def _read(db: Session, model, options, after, limit: int):
+    stmt = select(model).options(*options).order_by(model.change_seq, model.id).limit(limit + 1)
+    if after is not None:
+        stmt = stmt.where(tuple_(model.change_seq, model.id) > tuple_(*after))
+    rows = db.execute(stmt).scalars().all()
+    return rows[:limit], len(rows) > limit
+
+
+def get_changes(db: Session, since: Optional[str] = None, limit: int = DEFAULT_LIMIT):
+    now = datetime.utcnow()
+    issued_at, cursors = decode_token(since) if since else (now, {})
+    if issued_at < now - timedelta(days=TOMBSTONE_DAYS):
+        raise TokenExpired()
+
+    result = {"deleted": []}
+    next_cursors = {}
+    has_more = False
+    for name, (model, options) in ENTITIES.items():
+        cursor = cursors.get(name)
+        rows, truncated = _read(db, model, options, cursor, limit)
+        next_cursors[name] = (rows[-1].change_seq, rows[-1].id) if rows else cursor
+        has_more |= truncated
+        result[name] = rows
+        metrics.increment("changes_rows", len(rows), entity=name)
+
+    if since is None:
+        # Without a token the client has nothing to delete, so tombstones start from the newest one
+        newest = db.execute(
+            select(models.Tombstone.change_seq, models.Tombstone.id)
+            .order_by(models.Tombstone.change_seq.desc(), models.Tombstone.id.desc()).limit(1)
+        ).first()
+        next_cursors["deleted"] = tuple(newest) if newest else (0, 0)
+    else:
+        cursor = cursors["deleted"] or (0, 0)
+        stmt = select(models.Tombstone).where(
+            tuple_(models.Tombstone.change_seq, models.Tombstone.id) > tuple_(*cursor)
+        ).order_by(models.Tombstone.change_seq, models.Tombstone.id).limit(limit + 1)
+        tombstones = db.execute(stmt).scalars().all()
+        truncated = len(tombstones) > limit
+        tombstones = tombstones[:limit]
+        next_cursors["deleted"] = (tombstones[-1].change_seq, tombstones[-1].id) if tombstones else cursor
+        has_more |= truncated
+        result["deleted"] = [
+            {"type": t.entity, "id": t.entity_id, "deleted_at": t.deleted_at} for t in tombstones
+        ]
+        metrics.increment("changes_rows", len(tombstones), entity="deleted")
+
+    # A token is as old as the first one in its chain: that is what retention is measured against
+    result["next"] = encode_token(issued_at if has_more else now, next_cursors)
+    result["has_more"] = has_more
+    return result
+
+
+def prune_tombstones(db: Session) -> int:
+    cutoff = datetime.utcnow() - timedelta(days=TOMBSTONE_DAYS)
+    removed = db.execute(delete(models.Tombstone).where(models.Tombstone.deleted_at < cutoff)).rowcount
+    db.commit()
+    return removed
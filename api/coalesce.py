@@ -0,0 +1,99 @@
+import asyncio
+import re
+
+from . import metrics
+from .settings import get_settings
+
+# Single-flight for hot reads. When a post is shared, hundreds of clients ask for the same
+# /posts/{id} and its comments at the same moment. The first request for a given key runs
+# as usual and its response messages are recorded; identical requests that arrive while it
+# is still running wait for it and get a replay of the same response. Nothing is kept
+# after the leader finishes, so this never serves anything older than an in-flight read.
+#
+# The key is method, path, query string, If-None-Match and the viewer class (anonymous or
+# signed in), so a request can only share a response it could have produced itself. Only
+# routes in ROUTES take part, and those must not depend on who the viewer is beyond that.
+# A follower of a leader that failed runs the request itself.
+#
+# It sits outside admission control, so followers don't take a slot. Replays count in
+# coalesced_requests. Code that has to see every request, not just the leader's (view
+# counting), registers an on_replay hook for the route.
+
+settings = get_settings()
+
+ENABLED = settings.coalesce_reads
+
+ROUTES = {
+    "/posts/{post_id}": re.compile(r"^/posts/\d+/?$"),
+    "/posts/{post_id}/comments/": re.compile(r"^/posts/\d+/comments/?$"),
+    "/posts/{post_id}/related": re.compile(r"^/posts/\d+/related/?$"),
+}
+
+
+_replay_hooks = {}
+
+
+def on_replay(route: str, hook):
+    """hook(path, status) runs for every follower that got a replay of the route."""
+    _replay_hooks.setdefault(route, []).append(hook)
+
+
+def _route(path: str):
+    for name, pattern in ROUTES.items():
+        if pattern.match(path):
+            return name
+    return None
+
+
+def _key(scope):
+    headers = dict(scope["headers"])
+    signed_in = b"authorization" in headers or b"cookie" in headers
+    return (
+        scope["method"], scope["path"], scope["query_string"],
+        headers.get(b"if-none-match"), "user" if signed_in else "anonymous",
+    )
+
+
+class CoalescingMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self._flights = {}
+
+    async def __call__(self, scope, receive, send):
+        if not ENABLED or scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            await self.app(scope, receive, send)
+            return
+        route = _route(scope["path"])
+        if route is None:
+            await self.app(scope, receive, send)
+            return
+
+        key = _key(scope)
+        flight = self._flights.get(key)
+        if flight is not None:
+            # shield: a follower that goes away must not cancel the leader's result for the rest
+            messages = await asyncio.shield(flight)
+            if messages is not None:
+                metrics.increment("coalesced_requests", route=route)
+                for message in messages:
+                    await send({**message})
+                for hook in _replay_hooks.get(route, ()):
+                    hook(scope["path"], messages[0]["status"])
+                return
+            await self.app(scope, receive, send)
+            return
+
+        flight = self._flights[key] = asyncio.get_running_loop().create_future()
+        messages = []
+
+        async def recording_send(message):
+            messages.append({**message})
+            await send(message)
+
+        try:
+            await self.app(scope, receive, recording_send)
+        finally:
+            del self._flights[key]
+            # None tells the followers to run the request themselves
+            complete = messages and messages[-1]["type"] == "http.response.body" and not messages[-1].get("more_body")
+            flight.set_result(messages if complete else None)
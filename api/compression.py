@@ -0,0 +1,279 @@
+import hashlib
+import threading
+import zlib
+from collections import OrderedDict
+
+from . import metrics
+from .settings import get_settings
+
+# Response compression negotiated from Accept-Encoding: zstd, then br, then gzip.
+# zstd and br come from `zstandard` / `brotli` (pinned in requirements.txt); an install
+# without one of them still works and just stops offering that encoding.
+#
+# Whole bodies (the usual JSON response) are compressed in one go and the result is kept in
+# a small LRU keyed by a hash of the body, so a list that hasn't changed is compressed once,
+# not on every hit. Streaming bodies are compressed chunk by chunk and flushed after each
+# chunk. Event streams, ranges, already-encoded and non-text responses pass through unencoded.
+# Everything but ranges gets Vary: Accept-Encoding, encoded or not, since the same URL may be
+# encoded for another request and a shared cache must not mix the variants.
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+settings = get_settings()
+
+MIN_SIZE = settings.compression_min_size
+CACHE_MAX_BYTES = settings.compression_cache_max_bytes
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+ZSTD_LEVEL = 3
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "image/svg+xml")
+
+
+class _GzipStream:
+    def __init__(self):
+        self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, chunk: bytes) -> bytes:
+        return self._compressor.compress(chunk) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _BrotliStream:
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, chunk: bytes) -> bytes:
+        return self._compressor.process(chunk) + self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class _ZstdStream:
+    def __init__(self):
+        self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+
+    def compress(self, chunk: bytes) -> bytes:
+        return self._compressor.compress(chunk) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+def _compress_whole(encoding: str, body: bytes) -> bytes:
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return zlib.compress(body, GZIP_LEVEL, wbits=31)
+
+
+STREAMS = {"gzip": _GzipStream}
+if brotli is not None:
+    STREAMS["br"] = _BrotliStream
+if zstandard is not None:
+    STREAMS["zstd"] = _ZstdStream
+PREFERENCE = [encoding for encoding in ("zstd", "br", "gzip") if encoding in STREAMS]
+
+
+def negotiate(accept_encoding: str) -> str | None:
+    accepted = {}
+    for token in accept_encoding.split(","):
+        name, _, params = token.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    for encoding in PREFERENCE:
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+
+class CompressedBodyCache:
+    """LRU of compressed bodies keyed by (body hash, encoding), bounded by total bytes."""
+
+    def __init__(self, max_bytes: int = CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get_or_compress(self, encoding: str, body: bytes) -> bytes:
+        key = (hashlib.blake2b(body, digest_size=16).digest(), encoding)
+        with self._lock:
+            compressed = self._entries.get(key)
+            if compressed is not None:
+                self._entries.move_to_end(key)
+                metrics.increment("compression_cache", result="hit")
+                return compressed
+        compressed = _compress_whole(encoding, body)
+        metrics.increment("compression_cache", result="miss")
+        if len(compressed) > self.max_bytes:
+            return compressed
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = compressed
+                self._size += len(compressed)
+                while self._size > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self._size -= len(evicted)
+        return compressed
+
+
+cache = CompressedBodyCache()
+
+
+def _header(headers, name: bytes):
+    for key, value in headers:
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return None
+
+
+def _vary_accept_encoding(message):
+    """The response start message with Accept-Encoding in Vary."""
+    headers = list(message.get("headers", []))
+    vary = _header(headers, b"vary")
+    if vary is None:
+        headers.append((b"vary", b"Accept-Encoding"))
+    elif "accept-encoding" not in vary.lower() and vary.strip() != "*":
+        headers = [(k, v) for k, v in headers if k.lower() != b"vary"]
+        headers.append((b"vary", f"{vary}, Accept-Encoding".encode("latin-1")))
+    return {**message, "headers": headers}
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_headers = scope.get("headers", [])
+        encoding = negotiate(_header(request_headers, b"accept-encoding") or "")
+        if _header(request_headers, b"range") is not None:
+            await self.app(scope, receive, send)
+            return
+        if encoding is None:
+            # Not encoded for this client, but another one may get the same URL encoded
+            async def send_with_vary(message):
+                if message["type"] == "http.response.start":
+                    message = _vary_accept_encoding(message)
+                await send(message)
+
+            await self.app(scope, receive, send_with_vary)
+            return
+        responder = _Responder(self.app, scope, encoding, self.minimum_size)
+        await responder(receive, send)
+
+
+class _Responder:
+    def __init__(self, app, scope, encoding: str, minimum_size: int):
+        self.app = app
+        self.scope = scope
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start_message = None
+        self.passthrough = False
+        self.stream = None
+
+    def _route(self):
+        route = self.scope.get("route")
+        return getattr(route, "path", None) or "unmatched"
+
+    def _record(self, raw: int, compressed: int):
+        route = self._route()
+        metrics.increment("compression_bytes_in", raw, route=route, encoding=self.encoding)
+        metrics.increment("compression_bytes_out", compressed, route=route, encoding=self.encoding)
+        metrics.increment("compression_bytes_saved", raw - compressed, route=route)
+
+    def _should_compress(self, headers) -> bool:
+        if self.start_message["status"] in (204, 206, 304):
+            return False
+        if _header(headers, b"content-encoding") is not None:
+            return False
+        content_type = _header(headers, b"content-type") or ""
+        if content_type.startswith("text/event-stream"):
+            return False
+        return content_type.startswith(COMPRESSIBLE_TYPES)
+
+    def _start_headers(self, content_length: int | None):
+        headers = [
+            (k, v) for k, v in self.start_message["headers"]
+            if k.lower() not in (b"content-length", b"etag")
+        ]
+        # Strong ETags describe the identity body; keep a weak one for the encoded variant
+        etag = _header(self.start_message["headers"], b"etag")
+        if etag:
+            headers.append((b"etag", (etag if etag.startswith("W/") else "W/" + etag).encode("latin-1")))
+        headers.append((b"content-encoding", self.encoding.encode("latin-1")))
+        if content_length is not None:
+            headers.append((b"content-length", str(content_length).encode("latin-1")))
+        return _vary_accept_encoding({**self.start_message, "headers": headers})
+
+    async def __call__(self, receive, send):
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                self.start_message = message
+                self.passthrough = not self._should_compress(message.get("headers", []))
+                if self.passthrough:
+                    # Sent as is for this request, but the encoding was still negotiated
+                    await send(_vary_accept_encoding(message))
+                return
+            if self.passthrough:
+                await send(message)
+                return
+            if message["type"] != "http.response.body":
+                # e.g. http.response.pathsend: the server sends the file, we cannot encode it
+                self.passthrough = True
+                await send(_vary_accept_encoding(self.start_message))
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if self.stream is None and not more_body:
+                # Whole body in one message
+                if len(body) < self.minimum_size:
+                    self.passthrough = True
+                    await send(_vary_accept_encoding(self.start_message))
+                    await send(message)
+                    return
+                compressed = cache.get_or_compress(self.encoding, body)
+                self._record(len(body), len(compressed))
+                await send(self._start_headers(len(compressed)))
+                await send({"type": "http.response.body", "body": compressed})
+                return
+
+            if self.stream is None:
+                self.stream = STREAMS[self.encoding]()
+                self.raw_bytes = self.compressed_bytes = 0
+                await send(self._start_headers(None))
+            chunk = self.stream.compress(body) if body else b""
+            if not more_body:
+                chunk += self.stream.finish()
+            self.raw_bytes += len(body)
+            self.compressed_bytes += len(chunk)
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+            if not more_body:
+                self._record(self.raw_bytes, self.compressed_bytes)
+
+        await self.app(self.scope, receive, send_wrapper)
@@ -0,0 +1,113 @@
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from . import entities, models
+
+# Reconciliation for the denormalized Post.bookmark_count / Post.comment_count and
+# User.unread_notifications columns. crud and notifications.py keep them exact; this catches
+# drift from manual SQL, old rows and crashes mid-write.
+
+COUNTERS = (
+    (models.Post.bookmark_count, models.Bookmark),
+    (models.Post.comment_count, models.Comment),
+)
+
+
+def _actual_counts(db: Session, child, post_ids):
+    rows = db.query(child.post_id, func.count(child.id)).filter(
+        child.post_id.in_(post_ids)
+    ).group_by(child.post_id).all()
+    return dict(rows)
+
+
+def _reconcile_unread(db: Session, report: dict, batch_size: int, fix: bool):
+    unread = (models.Notification.read_at.is_(None),)
+    last_id = 0
+    while True:
+        users = db.query(models.User.id, models.User.unread_notifications).filter(
+            models.User.id > last_id
+        ).order_by(models.User.id).limit(batch_size).all()
+        if not users:
+            break
+        user_ids = [u.id for u in users]
+        last_id = user_ids[-1]
+        report["users_checked"] += len(users)
+
+        actual = dict(db.query(models.Notification.user_id, func.count(models.Notification.id)).filter(
+            models.Notification.user_id.in_(user_ids), *unread
+        ).group_by(models.Notification.user_id).all())
+        for user in users:
+            expected = actual.get(user.id, 0)
+            if user.unread_notifications == expected:
+                continue
+            report["drifted"].append(
+                {"user_id": user.id, "column": "unread_notifications", "stored": user.unread_notifications, "actual": expected}
+            )
+            if fix:
+                recount = db.query(func.count(models.Notification.id)).filter(
+                    models.Notification.user_id == models.User.id, *unread
+                ).correlate(models.User).scalar_subquery()
+                db.query(models.User).filter(models.User.id == user.id).update(
+                    {models.User.unread_notifications: recount}, synchronize_session=False
+                )
+        if fix:
+            db.commit()
+
+
+def reconcile(db: Session, batch_size: int = 500, fix: bool = True):
+    """
+    Recomputes the counters batch by batch (keyset over post id, then user id) and reports drift.
+    Returns {"checked": posts, "users_checked": users, "drifted": [{"post_id" or "user_id",
+    "column", "stored", "actual"}, ...]}.
+    """
+    report = {"checked": 0, "users_checked": 0, "drifted": []}
+    last_id = 0
+    while True:
+        posts = db.query(
+            models.Post.id, models.Post.bookmark_count, models.Post.comment_count
+        ).filter(models.Post.id > last_id).order_by(models.Post.id).limit(batch_size).all()
+        if not posts:
+            break
+        post_ids = [p.id for p in posts]
+        last_id = post_ids[-1]
+        report["checked"] += len(posts)
+
+        for column, child in COUNTERS:
+            actual = _actual_counts(db, child, post_ids)
+            for post in posts:
+                stored = getattr(post, column.key)
+                expected = actual.get(post.id, 0)
+                if stored == expected:
+                    continue
+                report["drifted"].append(
+                    {"post_id": post.id, "column": column.key, "stored": stored, "actual": expected}
+                )
+                if fix:
+                    # Recount inside the UPDATE so a concurrent bookmark/comment is not overwritten
+                    recount = db.query(func.count(child.id)).filter(
+                        child.post_id == models.Post.id
+                    ).correlate(models.Post).scalar_subquery()
+                    db.query(models.Post).filter(models.Post.id == post.id).update(
+                        {column: recount}, synchronize_session=False
+                    )
+        if fix:
+            db.commit()
+    if fix and any("post_id" in drift for drift in report["drifted"]):
+        entities.invalidate_kind("post")
+    _reconcile_unread(db, report, batch_size, fix)
+    return report
+
+
+if __name__ == "__main__":
+    import sys
+    from .database import SessionLocal
+
+    session = SessionLocal()
+    try:
+        result = reconcile(session, fix="--dry-run" not in sys.argv)
+        for drift in result["drifted"]:
+            row = f"Post {drift['post_id']}" if "post_id" in drift else f"User {drift['user_id']}"
+            print(f"{row} {drift['column']}: stored {drift['stored']}, actual {drift['actual']}")
+        print(f"Checked {result['checked']} posts and {result['users_checked']} users, {len(result['drifted'])} counters drifted")
+    finally:
+        session.close()
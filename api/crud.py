@@ -1,13 +1,38 @@
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import delete, exists, lambda_stmt, or_, select, update
+from sqlalchemy.orm import Session, joinedload, selectinload
 from typing import Optional
 from datetime import datetime 
-from . import models, schemas
+from . import models, schemas, trending, events, suggest, related, facets, sections, changes, entities, notifications, threads
+
+# Hot lookups are built with lambda_stmt: the statement is constructed and its cache key
+# computed once per call site, later calls only swap in the bound values.
+# Primary key lookups use Session.get, which skips SQL entirely when the row is already
+# in the session's identity map.
 
 def get_user_by_email(db: Session, email: str):
-    return db.query(models.User).filter(models.User.email == email).first()
+    stmt = lambda_stmt(lambda: select(models.User).where(models.User.email == email))
+    return db.execute(stmt).scalars().first()
 
 def get_user_by_id(db: Session, user_id: int):
-    return db.query(models.User).filter(models.User.id == user_id).first()
+    return db.get(models.User, user_id)
+
+def load_public_profile(db: Session, user_id: int):
+    # schemas.UserProfileDisplay: the user's posts with their bookmarks
+    stmt = select(models.User).where(models.User.id == user_id).options(
+        selectinload(models.User.posts).selectinload(models.Post.bookmarks)
+    )
+    return db.execute(stmt).scalars().first()
+
+def get_cached_user(db: Session, user_id: int):
+    return entities.lookup(db, "user", user_id)
+
+def load_user_profile(db: Session, user_id: int):
+    # Everything schemas.User serializes, in a fixed number of queries however many posts and bookmarks
+    stmt = select(models.User).where(models.User.id == user_id).options(
+        selectinload(models.User.posts).selectinload(models.Post.bookmarks),
+        selectinload(models.User.bookmarks).joinedload(models.Bookmark.post)
+    )
+    return db.execute(stmt).scalars().first()
 
 def create_user(db: Session, user: schemas.UserCreate):
     # Note: Password hashing should be handled in auth.py or main.py
@@ -20,34 +45,73 @@ def create_user(db: Session, user: schemas.UserCreate):
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
+    # The id may be negatively cached from a lookup before the row existed
+    entities.invalidate("user", db_user.id)
     return db_user
 
-def get_posts(db: Session, skip: int = 0, limit: int = 100, category_id: Optional[int] = None, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, search: Optional[str] = None):
-    query = db.query(models.Post).options(joinedload(models.Post.owner), joinedload(models.Post.category))
+def _bump_post_counter(db: Session, post_id: int, column, delta: int):
+    # Single UPDATE so concurrent writers never lose an increment
+    db.execute(
+        update(models.Post).where(models.Post.id == post_id).values({column: column + delta}),
+        execution_options={"synchronize_session": False}
+    )
+    entities.invalidate_on_commit(db, "post", post_id)
+
+POST_SORTS = {
+    "newest": models.Post.created_at.desc(),
+    "bookmarks": models.Post.bookmark_count.desc(),
+    "comments": models.Post.comment_count.desc(),
+}
+
+def get_posts(db: Session, skip: int = 0, limit: int = 100, category_id: Optional[int] = None, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, search: Optional[str] = None, sort: Optional[str] = None):
+    # Each combination of filters gets its own cached statement
+    stmt = lambda_stmt(lambda: select(models.Post).options(
+        joinedload(models.Post.owner), joinedload(models.Post.category), selectinload(models.Post.bookmarks)
+    ))
     if category_id is not None:
-        query = query.filter(models.Post.category_id == category_id)
+        stmt += lambda s: s.where(models.Post.category_id == category_id)
     if start_date is not None:
-        query = query.filter(models.Post.created_at >= start_date)
+        stmt += lambda s: s.where(models.Post.created_at >= start_date)
     if end_date is not None:
         # To include the entire end_date, set it to the end of the day
         end_of_day = end_date.replace(hour=23, minute=59, second=59, microsecond=999999)
-        query = query.filter(models.Post.created_at <= end_of_day)
+        stmt += lambda s: s.where(models.Post.created_at <= end_of_day)
     if search is not None:
-        query = query.filter(models.Post.title.ilike(f"%{search}%"))
-    return query.offset(skip).limit(limit).all()
+        pattern = f"%{search}%"
+        stmt += lambda s: s.where(models.Post.title.ilike(pattern))
+    if sort is not None:
+        order = POST_SORTS[sort]
+        stmt = stmt.add_criteria(lambda s: s.order_by(order, models.Post.id.desc()), track_on=[sort])
+    stmt += lambda s: s.offset(skip).limit(limit)
+    return db.execute(stmt).scalars().all()
 
 def create_user_post(db: Session, post: schemas.PostCreate, user_id: int):
     db_post = models.Post(**post.model_dump(), owner_id=user_id)
     db.add(db_post)
+    db.flush()
+    trending.add_event(db, db_post.id, trending.POST_WEIGHT)
     db.commit()
     db.refresh(db_post)
+    entities.invalidate("post", db_post.id)
+    suggest.put("post", db_post.id, db_post.title)
+    facets.invalidate("posts")
+    related.put("post", db_post.id, related.post_text(db_post), db_post.updated_at)
+    events.hub.publish("posts", "post_created", schemas.Post.model_validate(db_post).model_dump(mode="json"))
     return db_post
 
 def get_post(db: Session, post_id: int):
-    return db.query(models.Post).filter(models.Post.id == post_id).first()
+    return db.get(models.Post, post_id)
+
+# Cached snapshots (see entities.py): dicts shaped like the response schema, or None.
+# For reads and checks only; writes load the row with get_post and friends.
+def get_cached_post(db: Session, post_id: int):
+    return entities.lookup(db, "post", post_id)
+
+def post_exists(db: Session, post_id: int) -> bool:
+    return entities.lookup(db, "post", post_id) is not None
 
 def update_post(db: Session, post_id: int, post: schemas.PostCreate):
-    db_post = db.query(models.Post).filter(models.Post.id == post_id).first()
+    db_post = db.get(models.Post, post_id)
     if db_post:
         db_post.title = post.title
         db_post.content = post.content
@@ -56,100 +120,160 @@ def update_post(db: Session, post_id: int, post: schemas.PostCreate):
         db.add(db_post)
         db.commit()
         db.refresh(db_post)
+        entities.invalidate("post", post_id)
+        suggest.put("post", db_post.id, db_post.title)
+        facets.invalidate("posts")
+        related.put("post", db_post.id, related.post_text(db_post), db_post.updated_at)
     return db_post
 
 def update_user_username(db: Session, user_id: int, username: Optional[str]):
-    db_user = db.query(models.User).filter(models.User.id == user_id).first()
+    db_user = db.get(models.User, user_id)
     if db_user:
         db_user.username = username
         db.add(db_user)
         db.commit()
         db.refresh(db_user)
+        entities.invalidate("user", user_id)
+        # Every post embeds its owner
+        entities.invalidate_kind("post")
     return db_user
 
-def delete_post(db: Session, post_id: int):
-    db_post = db.query(models.Post).filter(models.Post.id == post_id).first()
-    if db_post:
-        db.delete(db_post)
-        db.commit()
-    return db_post
+def _delete_by_id(db: Session, model, row_id: int) -> bool:
+    # One DELETE; bookmarks, comments and scores go with it through ON DELETE CASCADE
+    return db.execute(
+        delete(model).where(model.id == row_id), execution_options={"synchronize_session": False}
+    ).rowcount > 0
+
+def delete_post(db: Session, post_id: int) -> bool:
+    # Locked first: a notification fan-out for the post now waits for this and then fails its
+    # foreign key, rather than adding to unread counters between the discount and the delete
+    db.execute(select(models.Post.id).where(models.Post.id == post_id).with_for_update())
+    # The cascade removes the comments without us seeing them, so tombstone them first
+    changes.record_deletions(db, "comments", models.Comment.id, models.Comment.post_id == post_id)
+    notifications.discount_unread(db, models.Notification.post_id == post_id)
+    deleted = _delete_by_id(db, models.Post, post_id)
+    if not deleted:
+        db.rollback()
+        return False
+    changes.record_deletion(db, "posts", post_id)
+    db.commit()
+    entities.invalidate("post", post_id)
+    suggest.remove("post", post_id)
+    facets.invalidate("posts")
+    related.remove("post", post_id)
+    return True
 
 def get_post_category_by_name(db: Session, name: str):
-    return db.query(models.PostCategory).filter(models.PostCategory.name == name).first()
+    return db.execute(select(models.PostCategory).where(models.PostCategory.name == name)).scalars().first()
 
 def create_post_category(db: Session, category: schemas.PostCategoryCreate):
     db_category = models.PostCategory(name=category.name)
     db.add(db_category)
     db.commit()
     db.refresh(db_category)
+    suggest.put("post_category", db_category.id, db_category.name)
+    sections.invalidate("post_categories")
     return db_category
 
 def get_post_categories(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.PostCategory).offset(skip).limit(limit).all()
+    stmt = lambda_stmt(lambda: select(models.PostCategory).offset(skip).limit(limit))
+    return db.execute(stmt).scalars().all()
 
 def get_bookmark_by_user_and_post(db: Session, user_id: int, post_id: int):
-    return db.query(models.Bookmark).filter(
+    stmt = lambda_stmt(lambda: select(models.Bookmark).where(
         models.Bookmark.user_id == user_id,
         models.Bookmark.post_id == post_id
-    ).first()
+    ))
+    return db.execute(stmt).scalars().first()
 
 def create_bookmark(db: Session, user_id: int, post_id: int):
     db_bookmark = models.Bookmark(user_id=user_id, post_id=post_id)
     db.add(db_bookmark)
+    db.flush()
+    _bump_post_counter(db, post_id, models.Post.bookmark_count, 1)
+    # At created_at, so delete_bookmark takes back exactly this amount
+    trending.add_event(db, post_id, trending.BOOKMARK_WEIGHT, db_bookmark.created_at)
     db.commit()
     db.refresh(db_bookmark)
     return db_bookmark
 
 def get_bookmark(db: Session, bookmark_id: int):
-    return db.query(models.Bookmark).filter(models.Bookmark.id == bookmark_id).first()
+    return db.get(models.Bookmark, bookmark_id)
 
 def delete_bookmark(db: Session, bookmark_id: int):
-    db_bookmark = db.query(models.Bookmark).filter(models.Bookmark.id == bookmark_id).first()
+    db_bookmark = db.get(models.Bookmark, bookmark_id)
     if db_bookmark:
         db.delete(db_bookmark)
+        _bump_post_counter(db, db_bookmark.post_id, models.Post.bookmark_count, -1)
+        trending.remove_event(db, db_bookmark.post_id, trending.BOOKMARK_WEIGHT, db_bookmark.created_at)
         db.commit()
     return db_bookmark
 
+def delete_orphan_bookmarks(db: Session):
+    # Bookmarks without a post, or pointing at a post that no longer exists
+    deleted = db.execute(
+        delete(models.Bookmark).where(or_(
+            models.Bookmark.post_id.is_(None),
+            ~exists().where(models.Post.id == models.Bookmark.post_id)
+        )),
+        execution_options={"synchronize_session": False}
+    ).rowcount
+    db.commit()
+    return deleted
+
 def get_bookmarks_by_user(db: Session, user_id: int):
-    return db.query(models.Bookmark).join(models.Post).filter(models.Bookmark.user_id == user_id).options(joinedload(models.Bookmark.post)).all()
+    stmt = lambda_stmt(lambda: select(models.Bookmark).join(models.Post).where(models.Bookmark.user_id == user_id).options(joinedload(models.Bookmark.post)))
+    return db.execute(stmt).scalars().all()
 
 def create_resource(db: Session, resource: schemas.ResourceCreate):
     db_resource = models.Resource(**resource.model_dump())
     db.add(db_resource)
     db.commit()
     db.refresh(db_resource)
+    entities.invalidate("resource", db_resource.id)
+    suggest.put("resource", db_resource.id, db_resource.title)
+    facets.invalidate("resources")
+    related.put("resource", db_resource.id, related.resource_text(db_resource), db_resource.updated_at)
     return db_resource
 
 def get_resource(db: Session, resource_id: int):
-    return db.query(models.Resource).filter(models.Resource.id == resource_id).first()
+    return db.get(models.Resource, resource_id)
+
+def get_cached_resource(db: Session, resource_id: int):
+    return entities.lookup(db, "resource", resource_id)
 
 def get_resources(db: Session, skip: int = 0, limit: int = 100, category_id: Optional[int] = None, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, search: Optional[str] = None):
-    query = db.query(models.Resource).options(joinedload(models.Resource.category))
+    stmt = lambda_stmt(lambda: select(models.Resource).options(joinedload(models.Resource.category)))
     if category_id is not None:
-        query = query.filter(models.Resource.category_id == category_id)
+        stmt += lambda s: s.where(models.Resource.category_id == category_id)
     if start_date is not None:
-        query = query.filter(models.Resource.created_at >= start_date)
+        stmt += lambda s: s.where(models.Resource.created_at >= start_date)
     if end_date is not None:
-        query = query.filter(models.Resource.created_at <= end_date)
+        stmt += lambda s: s.where(models.Resource.created_at <= end_date)
     if search is not None:
-        query = query.filter(models.Resource.title.ilike(f"%{search}%"))
-    return query.offset(skip).limit(limit).all()
+        pattern = f"%{search}%"
+        stmt += lambda s: s.where(models.Resource.title.ilike(pattern))
+    stmt += lambda s: s.offset(skip).limit(limit)
+    return db.execute(stmt).scalars().all()
 
 def get_resource_category_by_name(db: Session, name: str):
-    return db.query(models.ResourceCategory).filter(models.ResourceCategory.name == name).first()
+    return db.execute(select(models.ResourceCategory).where(models.ResourceCategory.name == name)).scalars().first()
 
 def create_resource_category(db: Session, category: schemas.ResourceCategoryCreate):
     db_category = models.ResourceCategory(name=category.name)
     db.add(db_category)
     db.commit()
     db.refresh(db_category)
+    suggest.put("resource_category", db_category.id, db_category.name)
+    sections.invalidate("resource_categories")
     return db_category
 
 def get_resource_categories(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.ResourceCategory).offset(skip).limit(limit).all()
+    stmt = lambda_stmt(lambda: select(models.ResourceCategory).offset(skip).limit(limit))
+    return db.execute(stmt).scalars().all()
 
 def update_resource(db: Session, resource_id: int, resource: schemas.ResourceCreate):
-    db_resource = db.query(models.Resource).filter(models.Resource.id == resource_id).first()
+    db_resource = db.get(models.Resource, resource_id)
     if db_resource:
         db_resource.title = resource.title
         db_resource.context = resource.context
@@ -160,52 +284,71 @@ def update_resource(db: Session, resource_id: int, resource: schemas.ResourceCre
         db.add(db_resource)
         db.commit()
         db.refresh(db_resource)
+        entities.invalidate("resource", resource_id)
+        suggest.put("resource", db_resource.id, db_resource.title)
+        facets.invalidate("resources")
+        related.put("resource", db_resource.id, related.resource_text(db_resource), db_resource.updated_at)
     return db_resource
 
-def delete_resource(db: Session, resource_id: int):
-    db_resource = db.query(models.Resource).filter(models.Resource.id == resource_id).first()
-    if db_resource:
-        db.delete(db_resource)
-        db.commit()
-    return db_resource
+def delete_resource(db: Session, resource_id: int) -> bool:
+    if not _delete_by_id(db, models.Resource, resource_id):
+        return False
+    changes.record_deletion(db, "resources", resource_id)
+    db.commit()
+    entities.invalidate("resource", resource_id)
+    suggest.remove("resource", resource_id)
+    facets.invalidate("resources")
+    related.remove("resource", resource_id)
+    return True
 
 def create_club(db: Session, club: schemas.ClubCreate):
     db_club = models.Club(**club.model_dump())
     db.add(db_club)
     db.commit()
     db.refresh(db_club)
+    entities.invalidate("club", db_club.id)
+    suggest.put("club", db_club.id, db_club.name)
+    facets.invalidate("clubs")
     return db_club
 
 def get_club(db: Session, club_id: int):
-    return db.query(models.Club).filter(models.Club.id == club_id).first()
+    return db.get(models.Club, club_id)
+
+def get_cached_club(db: Session, club_id: int):
+    return entities.lookup(db, "club", club_id)
 
 def get_clubs(db: Session, skip: int = 0, limit: int = 100, category_id: Optional[int] = None, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, search: Optional[str] = None):
-    query = db.query(models.Club).options(joinedload(models.Club.category))
+    stmt = lambda_stmt(lambda: select(models.Club).options(joinedload(models.Club.category)))
     if category_id is not None:
-        query = query.filter(models.Club.category_id == category_id)
+        stmt += lambda s: s.where(models.Club.category_id == category_id)
     if start_date is not None:
-        query = query.filter(models.Club.created_at >= start_date)
+        stmt += lambda s: s.where(models.Club.created_at >= start_date)
     if end_date is not None:
-        query = query.filter(models.Club.created_at <= end_date)
+        stmt += lambda s: s.where(models.Club.created_at <= end_date)
     if search is not None:
-        query = query.filter(models.Club.name.ilike(f"%{search}%"))
-    return query.offset(skip).limit(limit).all()
+        pattern = f"%{search}%"
+        stmt += lambda s: s.where(models.Club.name.ilike(pattern))
+    stmt += lambda s: s.offset(skip).limit(limit)
+    return db.execute(stmt).scalars().all()
 
 def get_club_category_by_name(db: Session, name: str):
-    return db.query(models.ClubCategory).filter(models.ClubCategory.name == name).first()
+    return db.execute(select(models.ClubCategory).where(models.ClubCategory.name == name)).scalars().first()
 
 def create_club_category(db: Session, category: schemas.ClubCategoryCreate):
     db_category = models.ClubCategory(name=category.name)
     db.add(db_category)
     db.commit()
     db.refresh(db_category)
+    suggest.put("club_category", db_category.id, db_category.name)
+    sections.invalidate("club_categories")
     return db_category
 
 def get_club_categories(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.ClubCategory).offset(skip).limit(limit).all()
+    stmt = lambda_stmt(lambda: select(models.ClubCategory).offset(skip).limit(limit))
+    return db.execute(stmt).scalars().all()
 
 def update_club(db: Session, club_id: int, club: schemas.ClubCreate):
-    db_club = db.query(models.Club).filter(models.Club.id == club_id).first()
+    db_club = db.get(models.Club, club_id)
     if db_club:
         db_club.name = club.name
         db_club.description = club.description
@@ -214,38 +357,184 @@ def update_club(db: Session, club_id: int, club: schemas.ClubCreate):
         db.add(db_club)
         db.commit()
         db.refresh(db_club)
+        entities.invalidate("club", club_id)
+        suggest.put("club", db_club.id, db_club.name)
+        facets.invalidate("clubs")
     return db_club
 
-def delete_club(db: Session, club_id: int):
-    db_club = db.query(models.Club).filter(models.Club.id == club_id).first()
-    if db_club:
-        db.delete(db_club)
-        db.commit()
-    return db_club
+def delete_club(db: Session, club_id: int) -> bool:
+    if not _delete_by_id(db, models.Club, club_id):
+        return False
+    changes.record_deletion(db, "clubs", club_id)
+    db.commit()
+    entities.invalidate("club", club_id)
+    suggest.remove("club", club_id)
+    facets.invalidate("clubs")
+    return True
 
 # Comment CRUD operations
-def create_comment(db: Session, comment: schemas.CommentCreate, user_id: int):
+def create_comment(db: Session, comment: schemas.CommentCreate, user_id: int, parent: Optional[models.Comment] = None):
     db_comment = models.Comment(
         content=comment.content,
         user_id=user_id,
-        post_id=comment.post_id
+        post_id=comment.post_id,
+        parent_id=parent.id if parent else None,
+        depth=parent.depth + 1 if parent else 0
     )
     db.add(db_comment)
+    _bump_post_counter(db, comment.post_id, models.Post.comment_count, 1)
+    db.flush()
+    # At created_at, like create_bookmark, so delete_comment takes back exactly this amount
+    trending.add_event(db, comment.post_id, trending.COMMENT_WEIGHT, db_comment.created_at)
+    # The path ends with the comment's own id, so it can only be set once that is known
+    db_comment.path = threads.child_path(parent.path if parent else None, db_comment.id)
+    if parent is not None:
+        threads.add_replies(db, parent.path, 1)
+    notifications.enqueue_comment(db, db_comment.id)
     db.commit()
     db.refresh(db_comment)
+    events.hub.publish(
+        f"post:{db_comment.post_id}", "comment_created",
+        schemas.Comment.model_validate(db_comment).model_dump(mode="json")
+    )
     return db_comment
 
 def get_comments_by_post(db: Session, post_id: int):
-    return db.query(models.Comment).filter(
+    stmt = lambda_stmt(lambda: select(models.Comment).where(
         models.Comment.post_id == post_id
-    ).options(joinedload(models.Comment.user)).order_by(models.Comment.created_at.desc()).all()
+    ).options(joinedload(models.Comment.user)).order_by(models.Comment.created_at.desc()))
+    return db.execute(stmt).scalars().all()
 
 def get_comment(db: Session, comment_id: int):
-    return db.query(models.Comment).filter(models.Comment.id == comment_id).first()
+    return db.get(models.Comment, comment_id)
 
 def delete_comment(db: Session, comment_id: int):
-    db_comment = db.query(models.Comment).filter(models.Comment.id == comment_id).first()
+    # Replies go too (ON DELETE CASCADE): tombstone them and take them off the counters first
+    db_comment = db.get(models.Comment, comment_id)
     if db_comment:
+        subtree = threads.subtree(db_comment.post_id, db_comment.path)
+        # Locked, like the post in delete_post, so no fan-out commits between the discount and the delete
+        removed = db.execute(
+            select(models.Comment.id, models.Comment.created_at).where(subtree).with_for_update()
+        ).all()
+        notifications.discount_unread(db, models.Notification.comment_id.in_(select(models.Comment.id).where(subtree)))
+        changes.record_deletions(db, "comments", models.Comment.id, subtree)
+        if db_comment.parent_id is not None:
+            threads.add_replies(db, db_comment.path.rsplit("/", 1)[0], -len(removed))
         db.delete(db_comment)
+        _bump_post_counter(db, db_comment.post_id, models.Post.comment_count, -len(removed))
+        for _, created_at in removed:
+            trending.remove_event(db, db_comment.post_id, trending.COMMENT_WEIGHT, created_at)
         db.commit()
-    return db_comment
\ No newline at end of file
+        events.hub.publish(
+            f"post:{db_comment.post_id}", "comment_deleted",
+            # ids: the comment and the replies that went with it
+            {"id": db_comment.id, "post_id": db_comment.post_id, "ids": [row_id for row_id, _ in removed]}
+        )
+    return db_comment
+
+# Refresh token CRUD operations
+def create_refresh_token(db: Session, user_id: int, token_hash: str, family_id: str, expires_at: datetime):
+    db_token = models.RefreshToken(
+        user_id=user_id,
+        token_hash=token_hash,
+        family_id=family_id,
+        expires_at=expires_at
+    )
+    db.add(db_token)
+    db.commit()
+    db.refresh(db_token)
+    return db_token
+
+def get_refresh_token_by_hash(db: Session, token_hash: str):
+    stmt = lambda_stmt(lambda: select(models.RefreshToken).where(models.RefreshToken.token_hash == token_hash))
+    return db.execute(stmt).scalars().first()
+
+def rotate_refresh_token(db: Session, db_token: models.RefreshToken, token_hash: str, expires_at: datetime):
+    # Conditional update so two concurrent rotations of the same token cannot both win
+    claimed = db.execute(
+        update(models.RefreshToken).where(
+            models.RefreshToken.id == db_token.id,
+            models.RefreshToken.revoked_at.is_(None)
+        ).values(revoked_at=datetime.utcnow()),
+        execution_options={"synchronize_session": False}
+    ).rowcount
+    if not claimed:
+        db.rollback()
+        return None
+    new_token = models.RefreshToken(
+        user_id=db_token.user_id,
+        token_hash=token_hash,
+        family_id=db_token.family_id,
+        expires_at=expires_at
+    )
+    db.add(new_token)
+    db.flush()
+    db.execute(
+        update(models.RefreshToken).where(models.RefreshToken.id == db_token.id).values(replaced_by_id=new_token.id),
+        execution_options={"synchronize_session": False}
+    )
+    db.commit()
+    db.refresh(new_token)
+    return new_token
+
+def revoke_refresh_token_family(db: Session, family_id: str):
+    revoked = db.execute(
+        update(models.RefreshToken).where(
+            models.RefreshToken.family_id == family_id,
+            models.RefreshToken.revoked_at.is_(None)
+        ).values(revoked_at=datetime.utcnow()),
+        execution_options={"synchronize_session": False}
+    ).rowcount
+    db.commit()
+    return revoked
+
+def revoke_user_refresh_tokens(db: Session, user_id: int):
+    revoked = db.execute(
+        update(models.RefreshToken).where(
+            models.RefreshToken.user_id == user_id,
+            models.RefreshToken.revoked_at.is_(None)
+        ).values(revoked_at=datetime.utcnow()),
+        execution_options={"synchronize_session": False}
+    ).rowcount
+    db.commit()
+    return revoked
+
+def image_url_in_use(db: Session, url: str) -> bool:
+    return any(
+        db.query(db.query(model).filter(model.image_url == url).exists()).scalar()
+        for model in (models.Post, models.Resource, models.Club)
+    )
+
+def replace_image_url(db: Session, old_url: str, new_url: str):
+    updated = 0
+    for model in (models.Post, models.Resource, models.Club):
+        updated += db.execute(
+            update(model).where(model.image_url == old_url).values(image_url=new_url),
+            execution_options={"synchronize_session": False}
+        ).rowcount
+    db.commit()
+    if updated:
+        for kind in ("post", "resource", "club"):
+            entities.invalidate_kind(kind)
+    return updated
+
+# Direct upload CRUD operations
+def create_upload(db: Session, user_id: int, key: str, content_type: str, backend: str, expires_at: datetime):
+    db_upload = models.Upload(user_id=user_id, key=key, content_type=content_type, backend=backend, expires_at=expires_at)
+    db.add(db_upload)
+    db.commit()
+    db.refresh(db_upload)
+    return db_upload
+
+def get_upload(db: Session, upload_id: int):
+    return db.get(models.Upload, upload_id)
+
+def complete_upload(db: Session, db_upload: models.Upload, url: str, size: Optional[int]):
+    db_upload.status = "complete"
+    db_upload.url = url
+    db_upload.size = size
+    db_upload.completed_at = datetime.utcnow()
+    db.commit()
+    db.refresh(db_upload)
+    return db_upload
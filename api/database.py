@@ -1,20 +1,25 @@
-import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from pathlib import Path
-from dotenv import load_dotenv
+from .settings import get_settings
+from .sql_stats import instrument
 
-# Get the directory where this file is located (backend directory)
-BASE_DIR = Path(__file__).resolve().parent
-load_dotenv(BASE_DIR / ".env")
-
-DATABASE_URL = os.getenv("DATABASE_URL")
+DATABASE_URL = get_settings().database_url
 
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL environment variable is not set")
 
+# No connection is opened here; the first one is made when the first query runs
 engine = create_engine(DATABASE_URL)
+instrument(engine)
+
+if engine.dialect.name == "sqlite":
+    # SQLite ignores foreign keys, ON DELETE CASCADE included, unless each connection asks for them
+    @event.listens_for(engine, "connect")
+    def _enable_foreign_keys(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -1,20 +1,16 @@
-import os 
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from dotenv import load_dotenv
-from pathlib import Path 
+from .settings import get_settings
 
-dotenv_path = Path(__file__).resolve().parent / '.env'
-load_dotenv(dotenv_path=dotenv_path)
+settings = get_settings()
+EMAIL_HOST = settings.email_host
+EMAIL_PORT = settings.email_port
+EMAIL_USERNAME = settings.email_username
+EMAIL_PASSWORD = settings.email_password
+EMAIL_FROM = settings.email_from
 
-EMAIL_HOST = os.getenv("EMAIL_HOST")
-EMAIL_PORT = int(os.getenv("EMAIL_PORT" , 587))
-EMAIL_USERNAME = os.getenv("EMAIL_USERNAME")
-EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD") 
-EMAIL_FROM = os.getenv("EMAIL_FROM") 
-
-def send_verification_email(to_email: str, verification_link: str):
+def send_verification_email(to_email: str, verification_link: str, raise_errors: bool = False):
     if not all([EMAIL_HOST,EMAIL_USERNAME,EMAIL_PASSWORD,EMAIL_FROM]):
         print("Email sending configration misisng. Skiping email")
         return
@@ -40,4 +36,6 @@ def send_verification_email(to_email: str, verification_link: str):
             server.send_message(msg)
         print(f"Verfication email sent to {to_email}")
     except Exception as e:
-        print(f"Failed to send verification email to {to_email}: {e}")
\ No newline at end of file
+        print(f"Failed to send verification email to {to_email}: {e}")
+        if raise_errors:
+            raise
\ No newline at end of file
@@ -0,0 +1,205 @@
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from . import metrics, models, schemas
+from .caches import registry
+from .settings import get_settings
+
+# Serialized snapshots of single rows, for detail routes and existence/owner checks.
+#
+# Entries are keyed by (kind, id) and hold the response schema's dump of the row, or None
+# when the row doesn't exist (negative caching: probing missing ids doesn't reach the
+# database either). Memory is bounded by an LRU of MAX_ENTRIES, and an entry is dropped
+# TTL_SECONDS after it was read from the database.
+#
+# Each row has a version, bumped by every write to it: crud calls invalidate_on_commit() and
+# the bump happens, here and in the other workers, once the session commits. A lookup notes
+# the version before reading the database and the result is only stored if the version is
+# still the same, so a read that raced with a write can't put the old row back. Writes that
+# touch many rows at once (username changes, image URL rewrites, counter repair) bump a
+# generation for the whole kind instead.
+#
+# View counts are the exception: views.flush() adds them to the cached snapshots in place
+# (add_views) instead of bumping versions, so hot rows aren't evicted by every flush. Between
+# begin_views() and add_views() this worker stores no snapshot of that kind, so a row read
+# while the flush commits is never counted twice or left without its views. Other workers
+# only get the deltas; a row one of them reads in the moment before they arrive can be
+# counted twice, until its next write.
+#
+# The TTL is the backstop for the bus: without WORKER_BUS_DIR (plain `uvicorn --workers N`)
+# or when a message is dropped, another worker's copy of a changed row is at most
+# TTL_SECONDS old instead of stale until restart.
+#
+# Snapshots are shared between requests: callers must not modify them.
+
+settings = get_settings()
+
+MAX_ENTRIES = settings.entity_cache_size
+TTL_SECONDS = settings.entity_cache_ttl_seconds
+
+KINDS = {
+    "post": (models.Post, schemas.Post),
+    "resource": (models.Resource, schemas.Resource),
+    "club": (models.Club, schemas.Club),
+    "user": (models.User, schemas.UserPublic),
+}
+
+
+class EntityCache:
+    def __init__(self, max_entries: int = MAX_ENTRIES, ttl_seconds: float = TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # key -> (snapshot, monotonic time it expires)
+        self._entries = OrderedDict()
+        # Versions outlive their entries so in-flight lookups still see the bump; bounded the same way
+        self._versions = OrderedDict()
+        self._generations = {kind: 0 for kind in KINDS}
+        self._flushing = {kind: 0 for kind in KINDS}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Returns (True, snapshot or None) on a hit, (False, version) on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    return True, entry[0]
+                del self._entries[key]
+            return False, (self._generations[key[0]], self._versions.get(key, 0))
+
+    def put(self, key, value, version):
+        with self._lock:
+            if self._flushing[key[0]] or (self._generations[key[0]], self._versions.get(key, 0)) != version:
+                return
+            self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def bump(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._versions[key] = self._versions.get(key, 0) + 1
+            self._versions.move_to_end(key)
+            while len(self._versions) > self.max_entries * 4:
+                self._versions.popitem(last=False)
+
+    def bump_kind(self, kind: str):
+        with self._lock:
+            self._generations[kind] += 1
+            for key in [key for key in self._entries if key[0] == kind]:
+                del self._entries[key]
+
+    def begin_views(self, kind: str):
+        with self._lock:
+            self._flushing[kind] += 1
+            # Lookups already under way won't store what they read either
+            self._generations[kind] += 1
+
+    def end_views(self, kind: str):
+        with self._lock:
+            self._flushing[kind] = max(0, self._flushing[kind] - 1)
+            self._generations[kind] += 1
+
+    def add_views(self, kind: str, deltas):
+        with self._lock:
+            self._generations[kind] += 1
+            for row_id, delta in deltas:
+                entry = self._entries.get((kind, row_id))
+                if entry is not None and entry[0] is not None:
+                    snapshot, expires = entry
+                    # A new dict: the old one may still be in use by a request
+                    self._entries[(kind, row_id)] = ({**snapshot, "view_count": snapshot["view_count"] + delta}, expires)
+
+
+cache = EntityCache()
+
+
+def _apply(message):
+    if "views" in message:
+        cache.add_views(message["kind"], message["views"])
+    elif "ids" in message:
+        for row_id in message["ids"]:
+            cache.bump((message["kind"], row_id))
+    elif message["id"] is None:
+        cache.bump_kind(message["kind"])
+    else:
+        cache.bump((message["kind"], message["id"]))
+
+
+registry.register("entities", _apply, size=lambda: len(cache))
+
+
+def invalidate(kind: str, row_id: int):
+    cache.bump((kind, row_id))
+    registry.broadcast("entities", {"kind": kind, "id": row_id})
+
+
+def invalidate_many(kind: str, row_ids):
+    row_ids = list(row_ids)
+    for row_id in row_ids:
+        cache.bump((kind, row_id))
+    registry.broadcast("entities", {"kind": kind, "ids": row_ids})
+
+
+def invalidate_kind(kind: str):
+    cache.bump_kind(kind)
+    registry.broadcast("entities", {"kind": kind, "id": None})
+
+
+# Row deltas per bus message, well under the bus's message size limit
+VIEWS_PER_MESSAGE = 1000
+
+
+def begin_views(kinds):
+    for kind in kinds:
+        cache.begin_views(kind)
+
+
+def add_views(kind: str, deltas: dict):
+    """Ends a begin_views(); deltas maps row id to views added, empty if the flush failed."""
+    deltas = [[row_id, delta] for row_id, delta in deltas.items()]
+    cache.add_views(kind, deltas)
+    cache.end_views(kind)
+    for start in range(0, len(deltas), VIEWS_PER_MESSAGE):
+        registry.broadcast("entities", {"kind": kind, "views": deltas[start:start + VIEWS_PER_MESSAGE]})
+
+
+_PENDING = "entity_invalidations"
+
+
+def invalidate_on_commit(db: Session, kind: str, row_id: int):
+    db.info.setdefault(_PENDING, set()).add((kind, row_id))
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session):
+    for kind, row_id in session.info.pop(_PENDING, ()):
+        invalidate(kind, row_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session):
+    session.info.pop(_PENDING, None)
+
+
+def lookup(db, kind: str, row_id: int):
+    key = (kind, row_id)
+    hit, value = cache.get(key)
+    if hit:
+        metrics.increment("entity_cache", result="hit", kind=kind)
+        return value
+    metrics.increment("entity_cache", result="miss", kind=kind)
+    model, schema = KINDS[kind]
+    row = db.get(model, row_id)
+    snapshot = schema.model_validate(row).model_dump() if row is not None else None
+    cache.put(key, snapshot, value)
+    return snapshot
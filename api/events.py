@@ -0,0 +1,126 @@
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+
+from . import metrics
+from .bus import local_bus
+from .settings import get_settings
+
+# In-process pub/sub for Server-Sent Events.
+#
+# Channels: "posts" for new posts, "post:<id>" for comments on one post.
+# publish() can be called from the threadpool (crud runs there); delivery hops onto each
+# subscriber's event loop. Events are also forwarded to other workers over the local bus.
+
+settings = get_settings()
+
+QUEUE_SIZE = settings.sse_queue_size
+HEARTBEAT_SECONDS = settings.sse_heartbeat_seconds
+IDLE_TIMEOUT_SECONDS = settings.sse_idle_timeout_seconds
+RETRY_MILLISECONDS = 3000
+
+
+class Subscriber:
+    def __init__(self, channel: str, loop):
+        self.channel = channel
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.overflowed = False
+
+    def offer(self, message):
+        """Runs on the subscriber's loop. A client that falls QUEUE_SIZE events behind is cut off."""
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            metrics.increment("sse_slow_clients_dropped")
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+
+class EventHub:
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel: str) -> Subscriber:
+        subscriber = Subscriber(channel, asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers[channel].add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(subscriber.channel)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[subscriber.channel]
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(s) for s in self._subscribers.values())
+
+    def publish(self, channel: str, event: str, data):
+        message = {"channel": channel, "event": event, "data": data}
+        self.deliver(message)
+        local_bus.publish("events", message)
+
+    def deliver(self, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(message["channel"], ()))
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber.offer, message)
+            except RuntimeError:
+                # Loop already closed (shutdown)
+                self.unsubscribe(subscriber)
+
+
+hub = EventHub()
+local_bus.subscribe("events", hub.deliver)
+
+
+def _format(message):
+    return f"event: {message['event']}\ndata: {json.dumps(message['data'], default=str)}\n\n"
+
+
+async def _event_stream(request: Request, channel: str):
+    subscriber = hub.subscribe(channel)
+    loop = asyncio.get_running_loop()
+    last_event = loop.time()
+    try:
+        yield f"retry: {RETRY_MILLISECONDS}\n\n"
+        while True:
+            try:
+                message = await asyncio.wait_for(subscriber.queue.get(), HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+                if loop.time() - last_event > IDLE_TIMEOUT_SECONDS:
+                    # Let the browser reconnect instead of holding idle connections forever
+                    break
+                yield ": ping\n\n"
+                continue
+            if message is None:
+                yield "event: overflow\ndata: {}\n\n"
+                break
+            last_event = loop.time()
+            yield _format(message)
+    finally:
+        hub.unsubscribe(subscriber)
+
+
+def stream(request: Request, channel: str):
+    return StreamingResponse(
+        _event_stream(request, channel),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
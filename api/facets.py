@@ -0,0 +1,144 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import func, select
+
+from . import metrics, models
+from .caches import registry
+from .settings import get_settings
+
+# Counts per category and per month for the list filters (category_id, start_date, end_date,
+# search), plus the total, from one GROUP BY category, month query.
+#
+# Results are cached per filter set. Every write to an entity bumps that entity's generation
+# (here and, over the local bus, in the other workers), and the generation is part of the
+# cache key, so a write makes every cached answer for that entity unreachable at once.
+# Old entries fall out of the LRU.
+
+settings = get_settings()
+
+CACHE_SIZE = settings.facets_cache_size
+
+
+class Entity:
+    def __init__(self, model, category_model, search_column, end_of_day: bool = False):
+        self.model = model
+        self.category_model = category_model
+        self.search_column = search_column
+        # get_posts treats end_date as the whole day; resources and clubs compare as given
+        self.end_of_day = end_of_day
+
+
+ENTITIES = {
+    "posts": Entity(models.Post, models.PostCategory, models.Post.title, end_of_day=True),
+    "resources": Entity(models.Resource, models.ResourceCategory, models.Resource.title),
+    "clubs": Entity(models.Club, models.ClubCategory, models.Club.name),
+}
+
+
+class FacetCache:
+    def __init__(self, max_entries: int = CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._generations = {name: 0 for name in ENTITIES}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def generation(self, entity: str) -> int:
+        with self._lock:
+            return self._generations[entity]
+
+    def bump(self, entity: str):
+        with self._lock:
+            self._generations[entity] += 1
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+cache = FacetCache()
+
+
+def invalidate(entity: str):
+    cache.bump(entity)
+    registry.broadcast("facets", {"entity": entity})
+
+
+def _apply(message):
+    cache.bump(message["entity"])
+
+
+registry.register("facets", _apply, size=lambda: len(cache))
+
+
+def _month(db, column):
+    if db.get_bind().dialect.name == "sqlite":
+        return func.strftime("%Y-%m", column)
+    return func.to_char(column, "YYYY-MM")
+
+
+def _compute(db, entity: Entity, category_id, start_date, end_date, search):
+    model = entity.model
+    month = _month(db, model.created_at).label("month")
+    stmt = (
+        select(model.category_id, entity.category_model.name, month, func.count())
+        .select_from(model)
+        .outerjoin(entity.category_model, entity.category_model.id == model.category_id)
+        .group_by(model.category_id, entity.category_model.name, month)
+    )
+    if category_id is not None:
+        stmt = stmt.where(model.category_id == category_id)
+    if start_date is not None:
+        stmt = stmt.where(model.created_at >= start_date)
+    if end_date is not None:
+        if entity.end_of_day:
+            end_date = end_date.replace(hour=23, minute=59, second=59, microsecond=999999)
+        stmt = stmt.where(model.created_at <= end_date)
+    if search is not None:
+        stmt = stmt.where(entity.search_column.ilike(f"%{search}%"))
+
+    total = 0
+    categories = {}
+    months = {}
+    for row_category_id, name, row_month, count in db.execute(stmt):
+        total += count
+        category = categories.setdefault(row_category_id, {"id": row_category_id, "name": name, "count": 0})
+        category["count"] += count
+        if row_month is not None:
+            months[row_month] = months.get(row_month, 0) + count
+    return {
+        "total": total,
+        "categories": sorted(categories.values(), key=lambda c: -c["count"]),
+        "months": [{"month": m, "count": months[m]} for m in sorted(months, reverse=True)],
+    }
+
+
+def get_facets(db, entity_name: str, category_id: Optional[int] = None, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, search: Optional[str] = None):
+    key = (entity_name, cache.generation(entity_name), category_id, start_date, end_date, search)
+    result = cache.get(key)
+    if result is not None:
+        metrics.increment("facets_cache", result="hit", entity=entity_name)
+        return result
+    metrics.increment("facets_cache", result="miss", entity=entity_name)
+    result = _compute(db, ENTITIES[entity_name], category_id, start_date, end_date, search)
+    cache.put(key, result)
+    return result
+
+
+def get_total(db, entity_name: str, **filters) -> int:
+    return get_facets(db, entity_name, **filters)["total"]
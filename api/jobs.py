@@ -0,0 +1,206 @@
+import json
+import random
+import threading
+import traceback
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import metrics
+from . import models
+from .database import SessionLocal
+from .settings import get_settings
+
+# Durable background jobs stored in the `jobs` table of the application database.
+#
+# enqueue() inserts a row; a pool of worker threads started from the app lifespan claims
+# due jobs with a conditional UPDATE, runs the registered handler and records the result.
+# A claimed job is invisible to other workers for VISIBILITY_TIMEOUT seconds; if its worker
+# dies it becomes claimable again after that. Failures are retried with exponential
+# backoff until max_attempts, then the job is marked failed.
+
+settings = get_settings()
+
+WORKER_COUNT = settings.job_workers
+POLL_SECONDS = settings.job_poll_seconds
+VISIBILITY_TIMEOUT = settings.job_visibility_timeout_seconds
+BACKOFF_BASE_SECONDS = settings.job_backoff_base_seconds
+BACKOFF_MAX_SECONDS = 3600
+
+_handlers = {}
+_wakeup = threading.Event()
+
+
+def handler(kind: str):
+    """Registers the decorated function as the handler for jobs of `kind`. It receives the payload dict."""
+    def register(func):
+        _handlers[kind] = func
+        return func
+    return register
+
+
+def enqueue(db: Session, kind: str, payload: dict | None = None, idempotency_key: str | None = None,
+            delay_seconds: float = 0, max_attempts: int = 5, commit: bool = True):
+    """
+    Adds a job and commits. If a job with the same idempotency key already exists,
+    that job is returned instead of creating a second one.
+
+    With commit=False the job is only added to the session: it is queued if and when the
+    caller's transaction commits, together with the rows it is about.
+    """
+    if idempotency_key is not None:
+        existing = get_job_by_idempotency_key(db, idempotency_key)
+        if existing is not None:
+            return existing
+    db_job = models.Job(
+        kind=kind,
+        payload=json.dumps(payload or {}),
+        status="queued",
+        attempts=0,
+        max_attempts=max_attempts,
+        run_at=datetime.utcnow() + timedelta(seconds=delay_seconds),
+        idempotency_key=idempotency_key
+    )
+    db.add(db_job)
+    if not commit:
+        event.listen(db, "after_commit", lambda session: _queued(kind), once=True)
+        return db_job
+    try:
+        db.commit()
+    except IntegrityError:
+        # Same idempotency key enqueued concurrently
+        db.rollback()
+        return get_job_by_idempotency_key(db, idempotency_key)
+    db.refresh(db_job)
+    _queued(kind)
+    return db_job
+
+
+def _queued(kind: str):
+    metrics.increment("jobs_enqueued", kind=kind)
+    _wakeup.set()
+
+
+def get_job_by_idempotency_key(db: Session, idempotency_key: str):
+    return db.query(models.Job).filter(models.Job.idempotency_key == idempotency_key).first()
+
+
+def _claimable(now: datetime):
+    return (
+        models.Job.run_at <= now,
+        or_(
+            models.Job.status == "queued",
+            (models.Job.status == "running") & (models.Job.locked_until < now),
+        ),
+    )
+
+
+def claim_next(db: Session):
+    """Claims the next due job for this worker, or returns None when nothing is due."""
+    now = datetime.utcnow()
+    candidates = db.query(models.Job.id).filter(*_claimable(now)).order_by(models.Job.run_at).limit(5).all()
+    for (job_id,) in candidates:
+        claimed = db.query(models.Job).filter(models.Job.id == job_id, *_claimable(now)).update(
+            {
+                models.Job.status: "running",
+                models.Job.locked_until: now + timedelta(seconds=VISIBILITY_TIMEOUT),
+                models.Job.attempts: models.Job.attempts + 1,
+            },
+            synchronize_session=False
+        )
+        db.commit()
+        if claimed:
+            return db.get(models.Job, job_id)
+    return None
+
+
+def _backoff(attempts: int) -> float:
+    delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempts - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def run_job(db: Session, db_job: models.Job):
+    func = _handlers.get(db_job.kind)
+    try:
+        if func is None:
+            raise LookupError(f"No handler registered for job kind '{db_job.kind}'")
+        func(json.loads(db_job.payload))
+    except Exception as e:
+        db.rollback()
+        db_job.last_error = f"{e}\n{traceback.format_exc()}"
+        if db_job.attempts >= db_job.max_attempts:
+            db_job.status = "failed"
+            db_job.finished_at = datetime.utcnow()
+            metrics.increment("jobs_failed", kind=db_job.kind)
+            print(f"ERROR job {db_job.id} ({db_job.kind}) failed permanently: {e}")
+        else:
+            db_job.status = "queued"
+            db_job.run_at = datetime.utcnow() + timedelta(seconds=_backoff(db_job.attempts))
+            metrics.increment("jobs_retried", kind=db_job.kind)
+        db_job.locked_until = None
+        db.commit()
+        return False
+    db_job.status = "done"
+    db_job.locked_until = None
+    db_job.finished_at = datetime.utcnow()
+    db.commit()
+    metrics.increment("jobs_done", kind=db_job.kind)
+    return True
+
+
+def run_pending(session_factory=SessionLocal, max_jobs: int | None = None):
+    """Runs due jobs in the calling thread until none are left. Returns how many ran."""
+    ran = 0
+    while max_jobs is None or ran < max_jobs:
+        db = session_factory()
+        try:
+            db_job = claim_next(db)
+            if db_job is None:
+                return ran
+            run_job(db, db_job)
+            ran += 1
+        finally:
+            db.close()
+    return ran
+
+
+class WorkerPool:
+    def __init__(self, size: int = WORKER_COUNT, session_factory=SessionLocal):
+        self.size = size
+        self.session_factory = session_factory
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for i in range(self.size):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 10):
+        self._stop.set()
+        _wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _work(self):
+        while not self._stop.is_set():
+            try:
+                ran = run_pending(self.session_factory)
+            except Exception as e:
+                print(f"ERROR in job worker: {e}")
+                ran = 0
+            if not ran:
+                _wakeup.wait(POLL_SECONDS)
+                _wakeup.clear()
+
+
+if __name__ == "__main__":
+    # Drain the queue without starting the app, e.g. from cron or after a deploy
+    # Under -m this file is __main__; the handlers register on the imported api.jobs module
+    from . import tasks
+
+    print(f"Ran {tasks.jobs.run_pending()} jobs")
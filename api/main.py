@@ -1,11 +1,8 @@
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File,status
+from fastapi import FastAPI, Depends, HTTPException, Request, Response, UploadFile, File,status
 from fastapi.staticfiles import StaticFiles
 import shutil
 from pathlib import Path
 import uuid
-import os
-import cloudinary
-import cloudinary.uploader
 from sqlalchemy.orm import Session
 from fastapi.middleware.cors import CORSMiddleware
 from typing import List, Optional
@@ -14,23 +11,145 @@ from . import crud
 from . import models
 from . import schemas
 from . import auth
+from . import metrics
+from . import rate_limit
+from . import trending
+from . import events
+from . import jobs
+from . import media
+from . import suggest
+from . import related
+from . import facets
+from . import bootstrap
+from . import changes
+from . import notifications
+from . import threads
+from . import entities
+from . import storage
+from . import uploads
+from . import views
+from . import tasks  # noqa: F401  registers the job handlers
+from .bus import local_bus
+from .caches import registry
 from .database import SessionLocal, engine, get_db
+from .services import services
+from .admission import AdmissionMiddleware, configure_threadpool
+from .coalesce import CoalescingMiddleware
+from .compression import CompressionMiddleware
+from .sql_stats import SQLStatsMiddleware
+from .settings import BASE_DIR, get_settings
 from .email_utils import send_verification_email
 import secrets
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi.concurrency import run_in_threadpool
 from typing import List
 from .schemas import BookmarkCreate, Bookmark
 from .crud import create_bookmark, get_bookmark_by_user_and_post, delete_bookmark, get_bookmarks_by_user
 
-# This command creates all the tables defined in models.py in the database 
-models.Base.metadata.create_all(bind=engine)
+def run_trending_decay():
+    db = SessionLocal()
+    try:
+        removed = trending.decay(db)
+        if removed:
+            print(f"Trending decay removed {removed} scores")
+    except Exception as e:
+        print(f"ERROR decaying trending scores: {e}")
+    finally:
+        db.close()
 
-app = FastAPI()
+async def decay_trending_periodically():
+    while True:
+        await asyncio.sleep(trending.DECAY_INTERVAL_SECONDS)
+        await run_in_threadpool(run_trending_decay)
+
+def save_related_snapshot():
+    try:
+        related.save_if_changed()
+    except Exception as e:
+        print(f"ERROR saving related index snapshot: {e}")
 
-from dotenv import load_dotenv
+async def save_related_periodically():
+    while True:
+        await asyncio.sleep(related.SNAPSHOT_INTERVAL_SECONDS)
+        await run_in_threadpool(save_related_snapshot)
 
-load_dotenv()
+def run_tombstone_prune():
+    db = SessionLocal()
+    try:
+        removed = changes.prune_tombstones(db)
+        if removed:
+            print(f"Pruned {removed} tombstones")
+    except Exception as e:
+        print(f"ERROR pruning tombstones: {e}")
+    finally:
+        db.close()
 
-# ... existing code ...
+async def prune_tombstones_periodically():
+    while True:
+        await asyncio.sleep(changes.PRUNE_INTERVAL_SECONDS)
+        await run_in_threadpool(run_tombstone_prune)
+
+def run_upload_prune():
+    db = SessionLocal()
+    try:
+        removed = uploads.prune_uploads(db)
+        if removed:
+            print(f"Pruned {removed} uploads")
+    except Exception as e:
+        print(f"ERROR pruning uploads: {e}")
+    finally:
+        db.close()
+
+async def prune_uploads_periodically():
+    while True:
+        await asyncio.sleep(uploads.PRUNE_INTERVAL_SECONDS)
+        await run_in_threadpool(run_upload_prune)
+
+def flush_views():
+    db = SessionLocal()
+    try:
+        views.flush(db)
+    except Exception as e:
+        print(f"ERROR flushing view counts: {e}")
+    finally:
+        db.close()
+
+async def flush_views_periodically():
+    while True:
+        await asyncio.sleep(views.FLUSH_INTERVAL_SECONDS)
+        await run_in_threadpool(flush_views)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    configure_threadpool()
+    # Table creation and client setup happen here rather than at import time
+    await run_in_threadpool(services.startup)
+    local_bus.start(asyncio.get_running_loop())
+    job_workers = jobs.WorkerPool()
+    job_workers.start()
+    decay_task = asyncio.create_task(decay_trending_periodically())
+    snapshot_task = asyncio.create_task(save_related_periodically())
+    prune_task = asyncio.create_task(prune_tombstones_periodically())
+    views_task = asyncio.create_task(flush_views_periodically())
+    upload_prune_task = asyncio.create_task(prune_uploads_periodically())
+    yield
+    upload_prune_task.cancel()
+    views_task.cancel()
+    prune_task.cancel()
+    snapshot_task.cancel()
+    decay_task.cancel()
+    await run_in_threadpool(save_related_snapshot)
+    await run_in_threadpool(flush_views)
+    await run_in_threadpool(job_workers.stop)
+    local_bus.stop()
+
+app = FastAPI(lifespan=lifespan)
+
+# Added first so it sits inside CORS: preflights are never queued and a 503 still carries CORS headers
+app.add_middleware(AdmissionMiddleware)
+# Outside admission: requests that share another's response never take a slot
+app.add_middleware(CoalescingMiddleware)
 
 # CORS Configuration
 origins = [
@@ -38,7 +157,7 @@ origins = [
 ]
 
 # Get the production origin from an environment variable
-prod_origin = os.getenv("PROD_ORIGIN")
+prod_origin = get_settings().prod_origin
 if prod_origin:
     origins.append(prod_origin)
 
@@ -48,30 +167,62 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Total-Count"],
 )
 
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(SQLStatsMiddleware)
+
 @app.middleware("http")
 async def log_requests(request, call_next):
     print(f"DEBUG: Incoming request headers: {request.headers}")
     response = await call_next(request)
     return response
 
-# Get the directory of the current file (main.py)
-BASE_DIR = Path(__file__).resolve().parent
-
-# Cloudinary Configuration
-cloudinary.config( 
-  cloud_name = os.getenv("CLOUDINARY_CLOUD_NAME"), 
-  api_key = os.getenv("CLOUDINARY_API_KEY"), 
-  api_secret = os.getenv("CLOUDINARY_API_SECRET") 
-)
-
+# Uploads get their own handler (immutable caching, strong ETags); it must come before the mount
+app.include_router(media.router)
 # Mount the static files directory relative to BASE_DIR
 app.mount("/static", StaticFiles(directory=str(BASE_DIR / "static")), name="static") 
 app.include_router(auth.router)
+app.include_router(bootstrap.router)
+app.include_router(uploads.router)
+# Development stand-in for the storage service; in production LOCAL_STORAGE_URL points elsewhere
+if uploads.BACKEND == "local" and uploads.LOCAL_STORAGE_URL.startswith("/storage/"):
+    print("WARNING: DIRECT_UPLOAD_BACKEND=local, uploads are stored by the API itself (development only)")
+    app.mount("/storage", storage.app)
+
+@app.get("/metrics")
+def read_metrics():
+    return metrics.snapshot()
+
+# Per worker: which process answered and what its caches have sent and received
+@app.get("/metrics/caches")
+def read_cache_stats():
+    return registry.stats()
+
+# Served from memory, no database session: typeahead fires on every keystroke
+@app.get("/suggest", response_model=List[schemas.Suggestion])
+async def read_suggestions(q: str, limit: int = suggest.DEFAULT_LIMIT, type: Optional[str] = None):
+    kinds = None
+    if type is not None:
+        kinds = set(type.split(","))
+        if not kinds <= set(suggest.KINDS):
+            raise HTTPException(status_code=400, detail=f"type must be one of: {', '.join(suggest.KINDS)}")
+    return suggest.index.search(q, limit=max(1, min(limit, suggest.MAX_LIMIT)), kinds=kinds)
+
+# Rows written or deleted since the token from the previous call; no token returns everything
+@app.get("/changes", response_model=schemas.Changes)
+def read_changes(since: Optional[str] = None, limit: int = changes.DEFAULT_LIMIT, db: Session = Depends(get_db)):
+    try:
+        return changes.get_changes(db, since=since, limit=max(1, min(limit, changes.MAX_LIMIT)))
+    except changes.InvalidToken as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except changes.TokenExpired:
+        raise HTTPException(status_code=410, detail="Change token has expired, sync again without one")
 
 @app.post("/users/", response_model=schemas.User)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+def create_user(request: Request, user: schemas.UserCreate, db: Session = Depends(get_db)):
+    rate_limit.check_signup(request)
     try:
         db_user = crud.get_user_by_email(db, email=user.email)
         if db_user:
@@ -89,6 +240,7 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
         db.add(db_user)
         db.commit()
         db.refresh(db_user)
+        entities.invalidate("user", db_user.id)
         
         return db_user
     except Exception as e:
@@ -97,15 +249,47 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
-# ---- FIXED POST ENDPOINT ----
+# "inline" (default): upload to Cloudinary inside the request, as /uploadfile always has
+# "background": store the file locally, answer right away with its /static/uploads URL and
+#               let a job move it to Cloudinary once a row uses it
+UPLOAD_MODE = get_settings().upload_mode
+UPLOAD_DIR = BASE_DIR / "static" / "uploads"
+LOCAL_UPLOAD_PREFIX = "/static/uploads/"
+
+def queue_image_move(db: Session, image_url: Optional[str]):
+    # Called once a committed row refers to the file, so the job always finds a row to repoint
+    if UPLOAD_MODE != "background" or not image_url or not image_url.startswith(LOCAL_UPLOAD_PREFIX):
+        return
+    filename = image_url[len(LOCAL_UPLOAD_PREFIX):]
+    path = UPLOAD_DIR / filename
+    if "/" in filename or not path.is_file():
+        return
+    # Direct uploads (uploads.py) stay on the storage they were made to
+    if db.query(models.Upload.id).filter(models.Upload.key == filename).first() is not None:
+        return
+    jobs.enqueue(db, "upload_image", {"path": str(path), "url": image_url}, idempotency_key=f"upload_image:{filename}")
+
+# Streams the file through this worker; browsers use the direct flow in uploads.py instead
 @app.post("/uploadfile")
-async def create_upload_file(file: UploadFile = File(...)):
-    try:
-        # Upload the file to Cloudinary
-        result = cloudinary.uploader.upload(file.file)
-        return {"filename": result.get("public_id"), "url": result.get("secure_url")}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Image upload failed: {str(e)}")
+def create_upload_file(file: UploadFile = File(...), db: Session = Depends(get_db)):
+    if UPLOAD_MODE == "inline":
+        import cloudinary.uploader
+        services.init_cloudinary()
+        try:
+            # Upload the file to Cloudinary
+            result = cloudinary.uploader.upload(file.file)
+            return {"filename": result.get("public_id"), "url": result.get("secure_url")}
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Image upload failed: {str(e)}")
+
+    suffix = Path(file.filename or "").suffix.lower()
+    filename = f"{uuid.uuid4()}{suffix if suffix in uploads.IMAGE_SUFFIXES else ''}"
+    UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+    path = UPLOAD_DIR / filename
+    with path.open("wb") as buffer:
+        shutil.copyfileobj(file.file, buffer)
+    # Served from /static until a post, resource or club uses it; queue_image_move() then moves it to Cloudinary
+    return {"filename": filename, "url": f"{LOCAL_UPLOAD_PREFIX}{filename}"}
 
 @app.post("/posts/", response_model=schemas.Post)
 def create_post_for_user(
@@ -113,7 +297,9 @@ def create_post_for_user(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
-    return crud.create_user_post(db=db, post=post, user_id=current_user.id)
+    db_post = crud.create_user_post(db=db, post=post, user_id=current_user.id)
+    queue_image_move(db, post.image_url)
+    return db_post
 
 @app.post("/post-categories/", response_model=schemas.PostCategory)
 def create_post_category(
@@ -133,8 +319,8 @@ def read_post_categories(skip: int = 0, limit: int = 100, db: Session = Depends(
 
 
 @app.get("/users/me", response_model=schemas.User)
-async def read_user_me(current_user: models.User = Depends(auth.get_current_user)):
-    return current_user
+def read_user_me(current_user: models.User = Depends(auth.get_current_user), db: Session = Depends(get_db)):
+    return crud.load_user_profile(db, current_user.id)
 @app.put("/users/me/username", response_model=schemas.User)
 def update_my_username(
     username_update: schemas.UserUpdateUsername,
@@ -150,10 +336,31 @@ def update_my_username(
         raise HTTPException(status_code=404, detail="User not found") # Should not happen with current_user
     return updated_user
 
+@app.get("/users/me/notifications", response_model=schemas.NotificationPage)
+def read_my_notifications(
+    before: Optional[int] = None,
+    limit: int = notifications.DEFAULT_LIMIT,
+    unread_only: bool = False,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    items, next_cursor = notifications.list_notifications(
+        db, current_user.id, before=before, limit=limit, unread_only=unread_only
+    )
+    return {"items": items, "next_cursor": next_cursor, "unread_count": current_user.unread_notifications}
+
+@app.post("/users/me/notifications/read", response_model=schemas.UnreadCount)
+def mark_my_notifications_read(
+    request: schemas.NotificationsRead,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    return {"unread_count": notifications.mark_read(db, current_user.id, up_to=request.up_to)}
+
 @app.get("/users/{user_id}", response_model=schemas.UserProfileDisplay)
 def read_user_public(user_id: int, db: Session = Depends(get_db)):
     print(f"DEBUG: Requesting user_id={user_id}")
-    db_user = crud.get_user_by_id(db, user_id=user_id)
+    db_user = crud.load_public_profile(db, user_id=user_id)
     print(f"DEBUG: Found user: {db_user}")
     if db_user:
         print(f"DEBUG: User ID: {db_user.id}, Username: {db_user.username}")
@@ -172,12 +379,14 @@ def update_post(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
-    db_post = crud.get_post(db, post_id=post_id)
+    db_post = crud.get_cached_post(db, post_id=post_id)
     if db_post is None:
         raise HTTPException(status_code=404, detail="Post not found") 
-    if db_post.owner_id != current_user.id:
+    if db_post["owner_id"] != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to update this post")
-    return crud.update_post(db=db, post_id=post_id, post=post)
+    updated_post = crud.update_post(db=db, post_id=post_id, post=post)
+    queue_image_move(db, post.image_url)
+    return updated_post
 
 @app.delete("/posts/{post_id}")
 def delete_post(
@@ -185,25 +394,49 @@ def delete_post(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
-    db_post = crud.get_post(db, post_id=post_id)
+    db_post = crud.get_cached_post(db, post_id=post_id)
     if db_post is None:
         raise HTTPException(status_code=404, detail="Post not found") 
-    if db_post.owner_id != current_user.id:
+    if db_post["owner_id"] != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to delete this post")
-    crud.delete_post(db=db, post_id=post_id)
+    # One DELETE: the database cascades to bookmarks, comments and the trending score
+    crud.delete_post(db, post_id=post_id)
     return {"message": "Post Deleted Successfully"}    
 
 @app.get("/posts/", response_model=List[schemas.Post])
-def read_posts(skip: int = 0, limit: int = 100, category_id: Optional[int] = None, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, search: Optional[str] = None, db: Session = Depends(get_db)):
-    posts = crud.get_posts(db, skip=skip, limit=limit, category_id=category_id, start_date=start_date, end_date=end_date, search=search)
+def read_posts(response: Response, skip: int = 0, limit: int = 100, category_id: Optional[int] = None, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, search: Optional[str] = None, sort: Optional[str] = None, db: Session = Depends(get_db)):
+    if sort is not None and sort not in crud.POST_SORTS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of: {', '.join(crud.POST_SORTS)}")
+    posts = crud.get_posts(db, skip=skip, limit=limit, category_id=category_id, start_date=start_date, end_date=end_date, search=search, sort=sort)
+    response.headers["X-Total-Count"] = str(facets.get_total(db, "posts", category_id=category_id, start_date=start_date, end_date=end_date, search=search))
     return posts
 
+@app.get("/posts/facets", response_model=schemas.Facets)
+def read_post_facets(category_id: Optional[int] = None, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, search: Optional[str] = None, db: Session = Depends(get_db)):
+    return facets.get_facets(db, "posts", category_id=category_id, start_date=start_date, end_date=end_date, search=search)
+
+# Must be registered before /posts/{post_id}
+@app.get("/posts/stream")
+async def stream_new_posts(request: Request):
+    return events.stream(request, "posts")
+
+@app.get("/posts/trending", response_model=List[schemas.Post])
+def read_trending_posts(skip: int = 0, limit: int = 20, category_id: Optional[int] = None, db: Session = Depends(get_db)):
+    return trending.get_trending_posts(db, skip=skip, limit=limit, category_id=category_id)
+
+@app.get("/posts/{post_id}/related", response_model=List[schemas.RelatedItem])
+def read_related_content(post_id: int, limit: int = related.DEFAULT_LIMIT, db: Session = Depends(get_db)):
+    if not crud.post_exists(db, post_id=post_id):
+        raise HTTPException(status_code=404, detail="Post not found")
+    return related.get_related(db, "post", post_id, limit=max(1, min(limit, related.MAX_LIMIT)))
+
 @app.get("/posts/{post_id}", response_model=schemas.Post)
 def read_post(post_id: int, db: Session = Depends(get_db)):
-    db_post = crud.get_post(db, post_id=post_id)
+    db_post = crud.get_cached_post(db, post_id=post_id)
     if db_post is None:
         raise HTTPException(status_code=404, detail="Post not found")
-    return db_post
+    views.record("post", post_id)
+    return {**db_post, "view_count": db_post["view_count"] + views.pending("post", post_id)}
 
  
 @app.post("/bookmarks/", response_model=schemas.Bookmark, status_code=status.HTTP_201_CREATED)
@@ -212,6 +445,9 @@ def create_user_bookmark(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
+    # With foreign keys enforced a bookmark on a missing post would fail in the INSERT
+    if not crud.post_exists(db, post_id=bookmark.post_id):
+        raise HTTPException(status_code=404, detail="Post not found")
     db_bookmark = crud.get_bookmark_by_user_and_post(db, user_id=current_user.id, post_id=bookmark.post_id)
     if db_bookmark:
         raise HTTPException(status_code=400, detail="Bookmark already exists")
@@ -248,10 +484,13 @@ def create_resource(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
-    return crud.create_resource(db=db, resource=resource)
+    db_resource = crud.create_resource(db=db, resource=resource)
+    queue_image_move(db, resource.image_url)
+    return db_resource
 
 @app.get("/resources/", response_model=List[schemas.Resource])
 def read_resources(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     category_id: Optional[int] = None,
@@ -261,14 +500,20 @@ def read_resources(
     db: Session = Depends(get_db)
 ):
     resources = crud.get_resources(db, skip=skip, limit=limit, category_id=category_id, start_date=start_date, end_date=end_date, search=search)
+    response.headers["X-Total-Count"] = str(facets.get_total(db, "resources", category_id=category_id, start_date=start_date, end_date=end_date, search=search))
     return resources
 
+@app.get("/resources/facets", response_model=schemas.Facets)
+def read_resource_facets(category_id: Optional[int] = None, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, search: Optional[str] = None, db: Session = Depends(get_db)):
+    return facets.get_facets(db, "resources", category_id=category_id, start_date=start_date, end_date=end_date, search=search)
+
 @app.get("/resources/{resource_id}", response_model=schemas.Resource)
 def read_resource(resource_id: int, db: Session = Depends(get_db)):
-    db_resource = crud.get_resource(db, resource_id=resource_id)
+    db_resource = crud.get_cached_resource(db, resource_id=resource_id)
     if db_resource is None:
         raise HTTPException(status_code=404, detail="Resource not found")
-    return db_resource
+    views.record("resource", resource_id)
+    return {**db_resource, "view_count": db_resource["view_count"] + views.pending("resource", resource_id)}
 
 @app.put("/resources/{resource_id}", response_model=schemas.Resource)
 def update_resource(
@@ -277,10 +522,12 @@ def update_resource(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
-    db_resource = crud.get_resource(db, resource_id=resource_id)
+    db_resource = crud.get_cached_resource(db, resource_id=resource_id)
     if db_resource is None:
         raise HTTPException(status_code=404, detail="Resource not found")
-    return crud.update_resource(db=db, resource_id=resource_id, resource=resource)
+    updated_resource = crud.update_resource(db=db, resource_id=resource_id, resource=resource)
+    queue_image_move(db, resource.image_url)
+    return updated_resource
 
 @app.delete("/resources/{resource_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_resource(
@@ -288,10 +535,8 @@ def delete_resource(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
-    db_resource = crud.get_resource(db, resource_id=resource_id)
-    if db_resource is None:
+    if not crud.delete_resource(db=db, resource_id=resource_id):
         raise HTTPException(status_code=404, detail="Resource not found")
-    crud.delete_resource(db=db, resource_id=resource_id)
     return {"message": "Resource Deleted Successfully"}
 
 @app.post("/resource-categories/", response_model=schemas.ResourceCategory)
@@ -317,10 +562,13 @@ def create_club(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
-    return crud.create_club(db=db, club=club)
+    db_club = crud.create_club(db=db, club=club)
+    queue_image_move(db, club.image_url)
+    return db_club
 
 @app.get("/clubs/", response_model=List[schemas.Club])
 def read_clubs(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     category_id: Optional[int] = None,
@@ -330,14 +578,20 @@ def read_clubs(
     db: Session = Depends(get_db)
 ):
     clubs = crud.get_clubs(db, skip=skip, limit=limit, category_id=category_id, start_date=start_date, end_date=end_date, search=search)
+    response.headers["X-Total-Count"] = str(facets.get_total(db, "clubs", category_id=category_id, start_date=start_date, end_date=end_date, search=search))
     return clubs
 
+@app.get("/clubs/facets", response_model=schemas.Facets)
+def read_club_facets(category_id: Optional[int] = None, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, search: Optional[str] = None, db: Session = Depends(get_db)):
+    return facets.get_facets(db, "clubs", category_id=category_id, start_date=start_date, end_date=end_date, search=search)
+
 @app.get("/clubs/{club_id}", response_model=schemas.Club)
 def read_club(club_id: int, db: Session = Depends(get_db)):
-    db_club = crud.get_club(db, club_id=club_id)
+    db_club = crud.get_cached_club(db, club_id=club_id)
     if db_club is None:
         raise HTTPException(status_code=404, detail="Club not found")
-    return db_club
+    views.record("club", club_id)
+    return {**db_club, "view_count": db_club["view_count"] + views.pending("club", club_id)}
 
 @app.put("/clubs/{club_id}", response_model=schemas.Club)
 def update_club(
@@ -346,10 +600,12 @@ def update_club(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
-    db_club = crud.get_club(db, club_id=club_id)
+    db_club = crud.get_cached_club(db, club_id=club_id)
     if db_club is None:
         raise HTTPException(status_code=404, detail="Club not found")
-    return crud.update_club(db=db, club_id=club_id, club=club)
+    updated_club = crud.update_club(db=db, club_id=club_id, club=club)
+    queue_image_move(db, club.image_url)
+    return updated_club
 
 @app.delete("/clubs/{club_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_club(
@@ -357,10 +613,8 @@ def delete_club(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
-    db_club = crud.get_club(db, club_id=club_id)
-    if db_club is None:
+    if not crud.delete_club(db=db, club_id=club_id):
         raise HTTPException(status_code=404, detail="Club not found")
-    crud.delete_club(db=db, club_id=club_id)
     return {"message": "Club Deleted Successfully"}
 
 @app.post("/club-categories/", response_model=schemas.ClubCategory)
@@ -388,23 +642,61 @@ def create_comment(
     current_user: models.User = Depends(auth.get_current_user)
 ):
     # Verify post exists
-    db_post = crud.get_post(db, post_id=post_id)
-    if not db_post:
+    if not crud.post_exists(db, post_id=post_id):
         raise HTTPException(status_code=404, detail="Post not found")
     
     # Ensure the comment is for the correct post
     comment.post_id = post_id
-    return crud.create_comment(db=db, comment=comment, user_id=current_user.id)
+    parent = None
+    if comment.parent_id is not None:
+        parent = crud.get_comment(db, comment_id=comment.parent_id)
+        if parent is None or parent.post_id != post_id:
+            raise HTTPException(status_code=404, detail="Parent comment not found")
+        if parent.depth + 1 >= threads.MAX_DEPTH:
+            raise HTTPException(status_code=400, detail=f"Replies can't be nested more than {threads.MAX_DEPTH} levels deep")
+    return crud.create_comment(db=db, comment=comment, user_id=current_user.id, parent=parent)
 
 @app.get("/posts/{post_id}/comments/", response_model=List[schemas.Comment])
 def get_post_comments(post_id: int, db: Session = Depends(get_db)):
     # Verify post exists
-    db_post = crud.get_post(db, post_id=post_id)
-    if not db_post:
+    if not crud.post_exists(db, post_id=post_id):
         raise HTTPException(status_code=404, detail="Post not found")
     
     return crud.get_comments_by_post(db=db, post_id=post_id)
 
+@app.get("/posts/{post_id}/comments/threads", response_model=schemas.CommentThreadPage)
+def get_post_comment_threads(
+    post_id: int,
+    before: Optional[int] = None,
+    limit: int = threads.DEFAULT_THREADS,
+    replies: int = threads.DEFAULT_REPLIES,
+    db: Session = Depends(get_db)
+):
+    if not crud.post_exists(db, post_id=post_id):
+        raise HTTPException(status_code=404, detail="Post not found")
+    items, next_cursor = threads.get_threads(db, post_id, before=before, limit=limit, replies=replies)
+    return {
+        "items": [{**schemas.Comment.model_validate(root).model_dump(), "replies": root_replies} for root, root_replies in items],
+        "next_cursor": next_cursor,
+    }
+
+@app.get("/comments/{comment_id}/replies", response_model=schemas.CommentPage)
+def get_comment_replies(
+    comment_id: int,
+    after: Optional[int] = None,
+    limit: int = threads.DEFAULT_PAGE,
+    db: Session = Depends(get_db)
+):
+    db_comment = crud.get_comment(db, comment_id=comment_id)
+    if db_comment is None:
+        raise HTTPException(status_code=404, detail="Comment not found")
+    items, next_cursor = threads.get_replies(db, db_comment, after=after, limit=limit)
+    return {"items": items, "next_cursor": next_cursor}
+
+@app.get("/posts/{post_id}/comments/stream")
+async def stream_post_comments(request: Request, post_id: int):
+    return events.stream(request, f"post:{post_id}")
+
 @app.delete("/comments/{comment_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_comment(
     comment_id: int,
@@ -0,0 +1,91 @@
+import mimetypes
+import os
+import re
+from pathlib import Path
+
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import FileResponse
+
+from .settings import BASE_DIR, get_settings
+
+# Serving for uploaded images under /static/uploads.
+#
+# Uploads are named <uuid4>.<ext> and never rewritten, so they get a year of immutable
+# caching and a strong ETag derived from the name. Everything else gets an ETag and must be
+# revalidated. FileResponse handles Range/If-Range and uses the server's zero-copy pathsend
+# extension when there is one. With MEDIA_ACCEL_REDIRECT_PREFIX set (e.g. "/_uploads/")
+# the response carries only headers plus X-Accel-Redirect and the fronting nginx sends the file.
+
+settings = get_settings()
+
+UPLOAD_DIR = BASE_DIR / "static" / "uploads"
+ACCEL_REDIRECT_PREFIX = settings.media_accel_redirect_prefix
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "public, no-cache"
+UUID_NAME = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$")
+
+# Accept-Encoding token -> suffix of a precompressed sibling file
+PRECOMPRESSED = (("br", ".br"), ("gzip", ".gz"))
+
+router = APIRouter()
+
+
+def _resolve(filename: str) -> Path:
+    path = (UPLOAD_DIR / filename).resolve()
+    if path.parent != UPLOAD_DIR.resolve() or not path.is_file():
+        raise HTTPException(status_code=404, detail="Not Found")
+    return path
+
+
+def _etag(path: Path, stat_result: os.stat_result, immutable: bool) -> str:
+    if immutable:
+        return f'"{path.stem}-{stat_result.st_size:x}"'
+    return f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    return etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+
+def _precompressed(request: Request, path: Path):
+    accepted = {
+        token.split(";")[0].strip().lower()
+        for token in request.headers.get("accept-encoding", "").split(",")
+    }
+    for encoding, suffix in PRECOMPRESSED:
+        if encoding in accepted:
+            candidate = path.with_name(path.name + suffix)
+            if candidate.is_file():
+                return encoding, candidate
+    return None, path
+
+
+@router.api_route("/static/uploads/{filename}", methods=["GET", "HEAD"], include_in_schema=False)
+async def serve_upload(filename: str, request: Request):
+    path = _resolve(filename)
+    stat_result = path.stat()
+    immutable = bool(UUID_NAME.match(path.stem))
+    etag = _etag(path, stat_result, immutable)
+    headers = {"Cache-Control": IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL}
+
+    encoding, send_path = _precompressed(request, path)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+        headers["Vary"] = "Accept-Encoding"
+        etag = etag[:-1] + f'-{encoding}"'
+    headers["ETag"] = etag
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+
+    if ACCEL_REDIRECT_PREFIX:
+        headers["X-Accel-Redirect"] = ACCEL_REDIRECT_PREFIX + send_path.name
+        return Response(status_code=200, headers=headers, media_type=media_type)
+
+    return FileResponse(send_path, headers=headers, media_type=media_type, stat_result=send_path.stat())
@@ -0,0 +1,35 @@
+import threading
+from collections import defaultdict
+
+# Process-local counters, exposed as JSON on GET /metrics.
+# Each worker keeps its own numbers; scrape every worker to get the full picture.
+
+_lock = threading.Lock()
+_counters = defaultdict(float)
+
+
+def _key(name: str, labels: dict):
+    return name, tuple(sorted(labels.items()))
+
+
+def increment(name: str, value: float = 1, **labels):
+    """Adds `value` to the counter identified by `name` and `labels`."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] += value
+
+
+def snapshot():
+    """Returns {name: {"label=value,...": total}} for every counter seen so far."""
+    with _lock:
+        items = list(_counters.items())
+    result = {}
+    for (name, labels), value in sorted(items):
+        label = ",".join(f"{k}={v}" for k, v in labels) or "total"
+        result.setdefault(name, {})[label] = value
+    return result
+
+
+def reset():
+    with _lock:
+        _counters.clear()
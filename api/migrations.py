@@ -0,0 +1,254 @@
+from sqlalchemy import bindparam, insert, inspect, select, text, update
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.engine import Engine
+from datetime import datetime
+
+# create_all only creates missing tables. This adds columns that were added to
+# existing models since the table was created, so older databases keep working.
+# New columns must be nullable or carry a constant string server_default.
+#
+# Foreign keys whose ON DELETE action changed are only reported at startup
+# (check_foreign_key_actions): bringing them in line deletes orphaned rows and, on SQLite,
+# rebuilds tables, so it is a one-off run by hand with the app stopped:
+#
+#   python -m api.migrations --dry-run    lists the tables and the rows it would delete
+#   python -m api.migrations              syncs them
+#
+# sync_foreign_key_actions then drops and re-adds the constraint on Postgres and rebuilds
+# the table on SQLite (which can't alter a constraint).
+
+
+def add_missing_columns(engine: Engine, metadata):
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    added = []
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing_columns = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                ddl = f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'
+                default = getattr(column.server_default, "arg", None)
+                if isinstance(default, str):
+                    ddl += f" DEFAULT '{default}'"
+                    if not column.nullable:
+                        ddl += " NOT NULL"
+                conn.execute(text(ddl))
+                added.append(f"{table.name}.{column.name}")
+            for index in table.indexes:
+                if any(c.name not in existing_columns for c in index.columns):
+                    index.create(conn, checkfirst=True)
+    if added:
+        print(f"Added missing columns: {', '.join(added)}")
+    return added
+
+
+def init_change_seq(engine: Engine, metadata):
+    """Creates the change_counter row and gives rows from before change_seq existed 0.
+
+    Must run before anything else here writes to a table with change_seq: its default
+    takes a number from the counter row.
+    """
+    counter = metadata.tables["change_counter"]
+    filled = 0
+    with engine.begin() as conn:
+        if conn.execute(select(counter.c.id)).first() is None:
+            conn.execute(insert(counter).values(id=1, value=0))
+        for table in metadata.sorted_tables:
+            if "change_seq" not in table.c:
+                continue
+            values = {"change_seq": 0}
+            if "updated_at" in table.c:
+                # Not an edit: keep onupdate off updated_at
+                values["updated_at"] = table.c.updated_at
+            filled += conn.execute(update(table).where(table.c.change_seq.is_(None)).values(values)).rowcount
+    if filled:
+        print(f"Initialized change_seq on {filled} rows")
+    return filled
+
+
+def backfill_updated_at(engine: Engine, metadata, batch_size: int = 1000):
+    """Sets updated_at = created_at on rows from before the column existed.
+
+    Copied through Python rather than in SQL so the stored values have the same format as
+    the ones crud writes; SQLite compares datetimes as text.
+    """
+    filled = 0
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            if "updated_at" not in table.c or "created_at" not in table.c:
+                continue
+            rows = conn.execute(
+                select(table.c.id, table.c.created_at).where(table.c.updated_at.is_(None))
+            ).all()
+            stmt = update(table).where(table.c.id == bindparam("row_id")).values(updated_at=bindparam("value"))
+            for start in range(0, len(rows), batch_size):
+                conn.execute(stmt, [
+                    {"row_id": row_id, "value": created_at or datetime.utcnow()}
+                    for row_id, created_at in rows[start:start + batch_size]
+                ])
+            filled += len(rows)
+    if filled:
+        print(f"Backfilled updated_at on {filled} rows")
+    return filled
+
+
+def backfill_comment_paths(engine: Engine, metadata, batch_size: int = 1000):
+    """Gives comments from before threading their path. They can only be roots: path is their own id."""
+    from .threads import child_path
+
+    comments = metadata.tables["comments"]
+    with engine.begin() as conn:
+        ids = conn.execute(select(comments.c.id).where(comments.c.path.is_(None))).scalars().all()
+        stmt = update(comments).where(comments.c.id == bindparam("row_id")).values(path=bindparam("value"))
+        for start in range(0, len(ids), batch_size):
+            conn.execute(stmt, [{"row_id": row_id, "value": child_path(None, row_id)} for row_id in ids[start:start + batch_size]])
+    if ids:
+        print(f"Backfilled path on {len(ids)} comments")
+    return len(ids)
+
+
+def _ondelete(value):
+    value = (value or "").upper()
+    return None if value in ("", "NO ACTION") else value
+
+
+def _foreign_key_mismatches(inspector, table):
+    reflected = inspector.get_foreign_keys(table.name)
+    mismatches = []
+    for constraint in table.foreign_key_constraints:
+        columns = [c.name for c in constraint.columns]
+        current = next((fk for fk in reflected if fk["constrained_columns"] == columns), None)
+        current_action = _ondelete((current or {}).get("options", {}).get("ondelete"))
+        if current is None or current_action != _ondelete(constraint.ondelete):
+            mismatches.append((constraint, current))
+    return mismatches
+
+
+def _orphans(table, constraint):
+    column = constraint.columns[0].name
+    element = constraint.elements[0]
+    ref_table, ref_column = element.column.table.name, element.column.name
+    return f"{column} IS NOT NULL AND {column} NOT IN (SELECT {ref_column} FROM {ref_table})"
+
+
+def _count_orphans(conn, table, constraint):
+    return conn.execute(text(f"SELECT COUNT(*) FROM {table.name} WHERE {_orphans(table, constraint)}")).scalar()
+
+
+def _delete_orphans(conn, table, constraint):
+    # What the cascade would have done, had it been there; Postgres won't add the constraint otherwise
+    return conn.execute(text(f"DELETE FROM {table.name} WHERE {_orphans(table, constraint)}")).rowcount
+
+
+def _rebuild_sqlite_table(conn, table, existing_columns):
+    # The documented SQLite procedure: create the new shape under a temporary name, copy, swap
+    temp = f"_rebuild_{table.name}"
+    ddl = str(CreateTable(table).compile(dialect=conn.dialect)).strip()
+    prefix = f"CREATE TABLE {table.name} ("
+    assert ddl.startswith(prefix), ddl
+    conn.exec_driver_sql(f"CREATE TABLE {temp} (" + ddl[len(prefix):])
+    columns = ", ".join(c.name for c in table.columns if c.name in existing_columns)
+    conn.exec_driver_sql(f"INSERT INTO {temp} ({columns}) SELECT {columns} FROM {table.name}")
+    conn.exec_driver_sql(f"DROP TABLE {table.name}")
+    conn.exec_driver_sql(f"ALTER TABLE {temp} RENAME TO {table.name}")
+    for index in table.indexes:
+        index.create(conn)
+
+
+def _replace_postgres_constraint(conn, table, constraint, current):
+    if current is not None:
+        conn.execute(text(f'ALTER TABLE {table.name} DROP CONSTRAINT "{current["name"]}"'))
+    columns = ", ".join(c.name for c in constraint.columns)
+    ref_table = constraint.elements[0].column.table.name
+    ref_columns = ", ".join(e.column.name for e in constraint.elements)
+    name = (current or {}).get("name") or f"{table.name}_{constraint.columns[0].name}_fkey"
+    ddl = f'ALTER TABLE {table.name} ADD CONSTRAINT "{name}" FOREIGN KEY ({columns}) REFERENCES {ref_table} ({ref_columns})'
+    if constraint.ondelete:
+        ddl += f" ON DELETE {constraint.ondelete}"
+    conn.execute(text(ddl))
+    for index in table.indexes:
+        index.create(conn, checkfirst=True)
+
+
+def _pending_foreign_keys(engine: Engine, metadata):
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    pending = []
+    for table in metadata.sorted_tables:
+        if table.name in existing_tables:
+            mismatches = _foreign_key_mismatches(inspector, table)
+            if mismatches:
+                columns = {c["name"] for c in inspector.get_columns(table.name)}
+                pending.append((table, mismatches, columns))
+    return pending
+
+
+def check_foreign_key_actions(engine: Engine, metadata):
+    """Warns about foreign keys that don't match models.py; changes nothing. Returns the table names."""
+    tables = [table.name for table, _, _ in _pending_foreign_keys(engine, metadata)]
+    if tables:
+        print(
+            f"WARNING: foreign keys on {', '.join(tables)} don't match models.py; "
+            "see `python -m api.migrations --dry-run`"
+        )
+    return tables
+
+
+def sync_foreign_key_actions(engine: Engine, metadata, dry_run: bool = False):
+    """Brings foreign keys in line with models.py, deleting orphaned rows first. Returns the table names."""
+    pending = _pending_foreign_keys(engine, metadata)
+    if not pending:
+        print("Foreign keys match models.py")
+        return []
+
+    with engine.connect() as conn:
+        for table, mismatches, _ in pending:
+            orphans = sum(
+                _count_orphans(conn, table, constraint)
+                for constraint, _ in mismatches if constraint.ondelete == "CASCADE"
+            )
+            columns = ", ".join(constraint.columns[0].name for constraint, _ in mismatches)
+            print(f"{table.name} ({columns}): {orphans} orphaned rows {'would be' if dry_run else 'will be'} deleted")
+    if dry_run:
+        return [table.name for table, _, _ in pending]
+
+    sqlite = engine.dialect.name == "sqlite"
+    with engine.connect() as conn:
+        if sqlite:
+            # Must be off while tables are swapped, and can't change inside a transaction
+            conn.exec_driver_sql("PRAGMA foreign_keys=OFF")
+            conn.commit()
+        try:
+            with conn.begin():
+                for table, mismatches, columns in pending:
+                    orphans = sum(
+                        _delete_orphans(conn, table, constraint)
+                        for constraint, _ in mismatches if constraint.ondelete == "CASCADE"
+                    )
+                    if orphans:
+                        print(f"Deleted {orphans} orphaned rows from {table.name}")
+                    if sqlite:
+                        _rebuild_sqlite_table(conn, table, columns)
+                    else:
+                        for constraint, current in mismatches:
+                            _replace_postgres_constraint(conn, table, constraint, current)
+        finally:
+            if sqlite:
+                conn.exec_driver_sql("PRAGMA foreign_keys=ON")
+                conn.commit()
+    updated = [table.name for table, _, _ in pending]
+    print(f"Updated foreign keys on: {', '.join(updated)}")
+    return updated
+
+
+if __name__ == "__main__":
+    import sys
+    from . import models
+    from .database import engine
+
+    sync_foreign_key_actions(engine, models.Base.metadata, dry_run="--dry-run" in sys.argv)
@@ -1,8 +1,34 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, Text
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, Text, Float, Index, UniqueConstraint, update
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
+from datetime import datetime
 from .database import Base
 
+class ChangeCounter(Base):
+    # A single row: the last change sequence number handed out (see next_change_seq)
+    __tablename__ = "change_counter"
+
+    id = Column(Integer, primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+
+def next_change_seq(context):
+    # Default and onupdate for change_seq (see changes.py). A transaction takes the next value the
+    # first time it writes a tracked row and all its rows share it. The UPDATE keeps the counter
+    # row locked until the transaction ends, so values are handed out, and committed, in order.
+    conn = context.connection
+    transaction = conn.get_transaction()
+    cached = conn.info.get("change_seq")
+    if cached is not None and cached[0] is transaction:
+        return cached[1]
+    counter = ChangeCounter.__table__
+    value = conn.execute(
+        update(counter).values(value=counter.c.value + 1).returning(counter.c.value)
+    ).scalar_one()
+    conn.info["change_seq"] = (transaction, value)
+    return value
+
+
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer,primary_key=True, index=True)
@@ -13,8 +39,12 @@ class User(Base):
     is_verified = Column(Boolean,default=False)
     verification_token = Column(String, unique=True, nullable=True) 
     verification_token_expires = Column(DateTime, nullable=True) 
+    # Denormalized, kept in step by notifications.py
+    unread_notifications = Column(Integer, nullable=False, default=0, server_default="0")
     posts = relationship("Post",back_populates="owner")
-    bookmarks = relationship("Bookmark", back_populates="user") 
+    # Bookmarks and comments go with the user: ON DELETE CASCADE in the database, not row by row here
+    bookmarks = relationship("Bookmark", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
+    refresh_tokens = relationship("RefreshToken", back_populates="user")
 
 
 
@@ -41,9 +71,10 @@ class Bookmark(Base):
     __tablename__ = "bookmarks"
     
     id = Column(Integer, primary_key=True,index=True)
-    user_id = Column(Integer,ForeignKey("users.id"))
-    post_id = Column(Integer, ForeignKey("posts.id"))
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    user_id = Column(Integer,ForeignKey("users.id", ondelete="CASCADE"), index=True)
+    post_id = Column(Integer, ForeignKey("posts.id", ondelete="CASCADE"), index=True)
+    # Set in Python, to the microsecond: it is the time of the trending event the bookmark added
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow, server_default=func.now())
 
     user = relationship("User", back_populates="bookmarks")
     post = relationship("Post", back_populates="bookmarks")
@@ -59,21 +90,56 @@ class Post(Base):
     owner_id = Column(Integer,ForeignKey("users.id")) 
     category_id = Column(Integer, ForeignKey("post_categories.id"), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Denormalized, kept in step by crud and checked by counters.reconcile()
+    bookmark_count = Column(Integer, nullable=False, default=0, server_default="0", index=True)
+    comment_count = Column(Integer, nullable=False, default=0, server_default="0", index=True)
+    # Added to in batches by views.flush(), not per request
+    view_count = Column(Integer, nullable=False, default=0, server_default="0")
+    # Set from Python rather than the database so every value has the same precision (related.py compares them)
+    updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    change_seq = Column(Integer, default=next_change_seq, onupdate=next_change_seq, index=True)
 
     owner = relationship("User" , back_populates="posts")
     category = relationship("PostCategory", back_populates="posts")
-    bookmarks = relationship("Bookmark", back_populates="post", cascade="all, delete-orphan")
-    comments = relationship("Comment", back_populates="post", cascade="all, delete-orphan")
+    # schemas.Post includes bookmarks: queries that return many posts add selectinload(Post.bookmarks)
+    # Children are removed by ON DELETE CASCADE; passive_deletes keeps the ORM from loading them first
+    bookmarks = relationship("Bookmark", back_populates="post", cascade="all, delete-orphan", passive_deletes=True)
+    comments = relationship("Comment", back_populates="post", cascade="all, delete-orphan", passive_deletes=True)
+    score = relationship("PostScore", back_populates="post", uselist=False, cascade="all, delete-orphan", passive_deletes=True)
+
+
+class PostScore(Base):
+    __tablename__ = "post_scores"
+
+    post_id = Column(Integer, ForeignKey("posts.id", ondelete="CASCADE"), primary_key=True)
+    # log2 of the time-decayed engagement score, measured against a fixed epoch (see trending.py)
+    hot = Column(Float, index=True, nullable=False)
+
+    post = relationship("Post", back_populates="score")
 
 
 class Comment(Base):
     __tablename__ = "comments"
+    __table_args__ = (
+        # Threads and subtrees are ranges on this (see threads.py)
+        Index("ix_comments_post_id_path", "post_id", "path"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     content = Column(Text, nullable=False)
-    user_id = Column(Integer, ForeignKey("users.id"))
-    post_id = Column(Integer, ForeignKey("posts.id"))
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), index=True)
+    post_id = Column(Integer, ForeignKey("posts.id", ondelete="CASCADE"), index=True)
+    # Replies go with the comment they answer
+    parent_id = Column(Integer, ForeignKey("comments.id", ondelete="CASCADE"), index=True, nullable=True)
+    # Zero-padded ids from the thread's root down to this comment, joined by "/"
+    path = Column(String, nullable=True)
+    depth = Column(Integer, nullable=False, default=0, server_default="0")
+    # Denormalized: comments anywhere below this one, kept in step by crud
+    reply_count = Column(Integer, nullable=False, default=0, server_default="0")
+    # Set in Python like Bookmark.created_at, for the same reason
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow, server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    change_seq = Column(Integer, default=next_change_seq, onupdate=next_change_seq, index=True)
     
     user = relationship("User")
     post = relationship("Post", back_populates="comments")
@@ -90,6 +156,9 @@ class Resource(Base):
     image_url = Column(String, nullable=True)
     category_id = Column(Integer, ForeignKey("resource_categories.id"), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    view_count = Column(Integer, nullable=False, default=0, server_default="0")
+    updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    change_seq = Column(Integer, default=next_change_seq, onupdate=next_change_seq, index=True)
 
     category = relationship("ResourceCategory", back_populates="resources")
 
@@ -103,5 +172,97 @@ class Club(Base):
     image_url = Column(String, nullable=True)
     category_id = Column(Integer, ForeignKey("club_categories.id"), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    view_count = Column(Integer, nullable=False, default=0, server_default="0")
+    updated_at = Column(DateTime(timezone=True), default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    change_seq = Column(Integer, default=next_change_seq, onupdate=next_change_seq, index=True)
+
+    category = relationship("ClubCategory", back_populates="clubs")
+
+
+class RateLimitBucket(Base):
+    __tablename__ = "rate_limit_buckets"
+
+    # "<scope>:<identity>", e.g. "login_ip:203.0.113.7"
+    key = Column(String, primary_key=True)
+    tokens = Column(Float, nullable=False)
+    updated_at = Column(Float, nullable=False) # unix timestamp of the last refill
+
+
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True, nullable=False)
+    token_hash = Column(String, unique=True, index=True, nullable=False) # sha256 of the opaque token, never the token itself
+    family_id = Column(String, index=True, nullable=False) # shared by every token rotated from the same login
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    expires_at = Column(DateTime, nullable=False)
+    revoked_at = Column(DateTime, nullable=True)
+    replaced_by_id = Column(Integer, ForeignKey("refresh_tokens.id"), nullable=True)
+
+    user = relationship("User", back_populates="refresh_tokens")
+
+
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, index=True, nullable=False)
+    payload = Column(Text, nullable=False, default="{}") # JSON
+    status = Column(String, index=True, nullable=False, default="queued") # queued, running, done, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=5)
+    run_at = Column(DateTime, index=True, nullable=False) # not before this time (UTC)
+    locked_until = Column(DateTime, nullable=True) # visibility timeout while running
+    idempotency_key = Column(String, unique=True, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    finished_at = Column(DateTime, nullable=True)
+
+
+class Tombstone(Base):
+    __tablename__ = "tombstones"
+
+    id = Column(Integer, primary_key=True, index=True)
+    entity = Column(String, nullable=False) # posts, resources, clubs, comments
+    entity_id = Column(Integer, nullable=False)
+    deleted_at = Column(DateTime(timezone=True), default=datetime.utcnow, index=True, nullable=False)
+    change_seq = Column(Integer, default=next_change_seq, index=True)
+
+
+class Upload(Base):
+    __tablename__ = "uploads"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), index=True, nullable=False)
+    key = Column(String, unique=True, nullable=False) # object name in storage, <uuid4>.<ext>
+    content_type = Column(String, nullable=False)
+    backend = Column(String, nullable=False) # local, cloudinary
+    status = Column(String, nullable=False, default="pending") # pending, complete
+    size = Column(Integer, nullable=True)
+    url = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    expires_at = Column(DateTime, nullable=False) # the signed form stops working after this (UTC)
+    completed_at = Column(DateTime, nullable=True)
+
+
+class Notification(Base):
+    __tablename__ = "notifications"
+    __table_args__ = (
+        # One per user and comment, so a re-run fan-out job can't notify twice
+        UniqueConstraint("user_id", "comment_id"),
+        # /users/me/notifications pages through a user's rows newest first by id
+        Index("ix_notifications_user_id_id", "user_id", "id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    kind = Column(String, nullable=False) # comment
+    actor_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), index=True, nullable=False)
+    post_id = Column(Integer, ForeignKey("posts.id", ondelete="CASCADE"), index=True, nullable=False)
+    comment_id = Column(Integer, ForeignKey("comments.id", ondelete="CASCADE"), index=True, nullable=True)
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow, nullable=False)
+    read_at = Column(DateTime, nullable=True)
 
-    category = relationship("ClubCategory", back_populates="clubs")
\ No newline at end of file
+    actor = relationship("User", foreign_keys=[actor_id])
+    post = relationship("Post")
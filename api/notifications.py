@@ -0,0 +1,150 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.orm import Session, joinedload, load_only
+
+from . import jobs, metrics, models
+from .settings import get_settings
+
+# Notifications for comments on posts people have bookmarked.
+#
+# create_comment doesn't notify anyone itself: it adds a "notify_comment" job to its own
+# transaction, so a comment costs the same whether the post has no bookmarks or thousands.
+# The job walks the post's bookmarks in keyset batches of FANOUT_BATCH_SIZE. Each batch is
+# one multi-row INSERT and one UPDATE of the recipients' unread counters, committed together.
+# A job that runs again (retry, or a worker that died) skips users who already have the
+# notification; the (user_id, comment_id) unique constraint backs that up.
+#
+# User.unread_notifications is the badge count, so reading it is a column, not a COUNT. It
+# goes up with each inserted row and down when rows are marked read or removed along with
+# their comment or post (discount_unread, called before those deletes).
+
+settings = get_settings()
+
+FANOUT_BATCH_SIZE = settings.notify_fanout_batch_size
+DEFAULT_LIMIT = 20
+MAX_LIMIT = settings.notifications_max_limit
+
+
+def enqueue_comment(db: Session, comment_id: int):
+    """Adds the fan-out job to the session; it is queued when the comment's transaction commits."""
+    jobs.enqueue(db, "notify_comment", {"comment_id": comment_id}, commit=False)
+
+
+def fan_out_comment(db: Session, comment_id: int) -> int:
+    """Notifies everyone who bookmarked the comment's post, except its author. Returns rows added."""
+    comment = db.get(models.Comment, comment_id)
+    if comment is None:
+        # Deleted before the job ran
+        return 0
+    created = 0
+    last_id = 0
+    while True:
+        rows = db.execute(
+            select(models.Bookmark.id, models.Bookmark.user_id)
+            .where(
+                models.Bookmark.post_id == comment.post_id,
+                models.Bookmark.id > last_id,
+                models.Bookmark.user_id != comment.user_id,
+            )
+            .order_by(models.Bookmark.id)
+            .limit(FANOUT_BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        user_ids = {row.user_id for row in rows}
+        notified = set(db.scalars(
+            select(models.Notification.user_id).where(
+                models.Notification.comment_id == comment_id, models.Notification.user_id.in_(user_ids)
+            )
+        ))
+        recipients = sorted(user_ids - notified)
+        if recipients:
+            now = datetime.utcnow()
+            db.execute(insert(models.Notification), [
+                {
+                    "user_id": user_id, "kind": "comment", "actor_id": comment.user_id,
+                    "post_id": comment.post_id, "comment_id": comment_id, "created_at": now,
+                }
+                for user_id in recipients
+            ])
+            db.execute(
+                update(models.User)
+                .where(models.User.id.in_(recipients))
+                .values(unread_notifications=models.User.unread_notifications + 1)
+            )
+            db.commit()
+            created += len(recipients)
+        if len(rows) < FANOUT_BATCH_SIZE:
+            break
+    metrics.increment("notifications_created", created, kind="comment")
+    return created
+
+
+def list_notifications(db: Session, user_id: int, before: Optional[int] = None,
+                       limit: int = DEFAULT_LIMIT, unread_only: bool = False):
+    """Newest first. Returns (notifications, next cursor or None)."""
+    limit = max(1, min(limit, MAX_LIMIT))
+    stmt = (
+        select(models.Notification)
+        .where(models.Notification.user_id == user_id)
+        .options(
+            joinedload(models.Notification.actor),
+            joinedload(models.Notification.post).load_only(models.Post.id, models.Post.title),
+        )
+        .order_by(models.Notification.id.desc())
+        # One extra row tells whether there is a next page
+        .limit(limit + 1)
+    )
+    if before is not None:
+        stmt = stmt.where(models.Notification.id < before)
+    if unread_only:
+        stmt = stmt.where(models.Notification.read_at.is_(None))
+    rows = db.execute(stmt).scalars().all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, rows[-1].id
+    return rows, None
+
+
+def mark_read(db: Session, user_id: int, up_to: Optional[int] = None) -> int:
+    """Marks the user's unread notifications (those with id <= up_to, if given) read. Returns the unread count left."""
+    stmt = update(models.Notification).where(
+        models.Notification.user_id == user_id, models.Notification.read_at.is_(None)
+    )
+    if up_to is not None:
+        stmt = stmt.where(models.Notification.id <= up_to)
+    marked = db.execute(
+        stmt.values(read_at=datetime.utcnow()), execution_options={"synchronize_session": False}
+    ).rowcount
+    if marked:
+        # Subtract rather than set to 0: a fan-out may have added rows since the UPDATE above
+        db.execute(
+            update(models.User)
+            .where(models.User.id == user_id)
+            .values(unread_notifications=models.User.unread_notifications - marked)
+        )
+    db.commit()
+    return db.scalar(select(models.User.unread_notifications).where(models.User.id == user_id))
+
+
+def discount_unread(db: Session, condition):
+    """
+    Takes the unread notifications matching `condition` off their users' counters, in one
+    UPDATE. Call it in the same transaction, before the delete that removes them.
+    """
+    unread = (models.Notification.read_at.is_(None), condition)
+    per_user = (
+        select(func.count(models.Notification.id))
+        .where(models.Notification.user_id == models.User.id, *unread)
+        .correlate(models.User)
+        .scalar_subquery()
+    )
+    db.execute(
+        update(models.User)
+        .where(models.User.id.in_(select(models.Notification.user_id).where(*unread)))
+        .values(unread_notifications=models.User.unread_notifications - per_user),
+        execution_options={"synchronize_session": False},
+    )
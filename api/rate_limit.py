@@ -0,0 +1,175 @@
+import threading
+import time
+from collections import OrderedDict
+from math import ceil
+
+from fastapi import HTTPException, Request, status
+from sqlalchemy import case, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from . import metrics
+from . import models
+from .database import SessionLocal
+from .settings import get_settings
+
+# Token buckets in front of the bcrypt-heavy routes (/auth/token and POST /users/).
+# Limits are "<attempts>/<seconds>": a bucket holds up to <attempts> tokens and
+# refills at <attempts>/<seconds> tokens per second.
+#
+# RATE_LIMIT_BACKEND=memory   (default) buckets live in this process only
+# RATE_LIMIT_BACKEND=database buckets live in the rate_limit_buckets table, so every
+#                             uvicorn worker sharing the database shares the limits
+#
+# The database store takes a token with one conditional UPDATE (refill and spend in SQL,
+# only where the refilled bucket has a token), so concurrent workers can't both spend the
+# same token. If the database fails the request is refused (fail closed) and counted in
+# rate_limit_errors.
+
+
+class Limit:
+    def __init__(self, attempts: int, seconds: float):
+        self.capacity = float(attempts)
+        self.refill_rate = attempts / seconds
+
+    @classmethod
+    def parse(cls, value: str):
+        attempts, seconds = value.split("/")
+        return cls(int(attempts), float(seconds))
+
+
+settings = get_settings()
+
+LOGIN_IP_LIMIT = Limit.parse(settings.login_ip_limit)
+LOGIN_ACCOUNT_LIMIT = Limit.parse(settings.login_account_limit)
+SIGNUP_IP_LIMIT = Limit.parse(settings.signup_ip_limit)
+TRUST_FORWARDED_FOR = settings.trust_forwarded_for
+
+
+def _take(tokens: float, updated_at: float, limit: Limit, now: float):
+    """Refills a bucket up to `now` and tries to take one token.
+
+    Returns the new token count and how many seconds the caller has to wait
+    (0 when the token was granted).
+    """
+    tokens = min(limit.capacity, tokens + max(0.0, now - updated_at) * limit.refill_rate)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / limit.refill_rate
+
+
+class MemoryBucketStore:
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, limit: Limit, now: float) -> float:
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (limit.capacity, now))
+            tokens, retry_after = _take(tokens, updated_at, limit, now)
+            self._buckets[key] = (tokens, now)
+            # Least recently touched buckets go first; they are the ones most likely full again
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return retry_after
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class DatabaseBucketStore:
+    def __init__(self, session_factory=SessionLocal):
+        self.session_factory = session_factory
+
+    def _create(self, db, key: str, limit: Limit, now: float):
+        dialect = {"sqlite": sqlite, "postgresql": postgresql}[db.get_bind().dialect.name]
+        db.execute(
+            dialect.insert(models.RateLimitBucket)
+            .values(key=key, tokens=limit.capacity, updated_at=now)
+            .on_conflict_do_nothing(index_elements=["key"])
+        )
+
+    def take(self, key: str, limit: Limit, now: float) -> float:
+        bucket = models.RateLimitBucket
+        elapsed = case((bucket.updated_at < now, now - bucket.updated_at), else_=0.0)
+        refilled = case(
+            (bucket.tokens + elapsed * limit.refill_rate > limit.capacity, limit.capacity),
+            else_=bucket.tokens + elapsed * limit.refill_rate,
+        )
+        db = self.session_factory()
+        try:
+            self._create(db, key, limit, now)
+            granted = db.execute(
+                update(bucket)
+                .where(bucket.key == key, refilled >= 1)
+                .values(
+                    tokens=refilled - 1,
+                    updated_at=case((bucket.updated_at < now, now), else_=bucket.updated_at),
+                )
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            if granted:
+                db.commit()
+                return 0.0
+            tokens, updated_at = db.execute(select(bucket.tokens, bucket.updated_at).where(bucket.key == key)).one()
+            db.commit()
+            # Never 0 here: the UPDATE found no token, even if another worker has refilled since
+            return _take(tokens, updated_at, limit, now)[1] or 1.0
+        except Exception as e:
+            db.rollback()
+            print(f"ERROR taking rate limit token for {key}: {e}")
+            metrics.increment("rate_limit_errors")
+            # Refused rather than let through: the limits guard password hashing
+            return 1 / limit.refill_rate
+        finally:
+            db.close()
+
+    def clear(self):
+        db = self.session_factory()
+        try:
+            db.query(models.RateLimitBucket).delete()
+            db.commit()
+        finally:
+            db.close()
+
+
+def _make_store():
+    backend = settings.rate_limit_backend
+    if backend == "database":
+        return DatabaseBucketStore()
+    if backend != "memory":
+        raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {backend}")
+    return MemoryBucketStore()
+
+
+store = _make_store()
+
+
+def client_ip(request: Request) -> str:
+    if TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+def enforce(scope: str, identity: str, limit: Limit):
+    """Takes a token from the `scope` bucket of `identity` or raises 429 with Retry-After."""
+    retry_after = store.take(f"{scope}:{identity}", limit, time.time())
+    if retry_after > 0:
+        metrics.increment("rate_limit_rejected", scope=scope)
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many attempts. Please try again later.",
+            headers={"Retry-After": str(ceil(retry_after))},
+        )
+
+
+def check_login(request: Request, account: str):
+    enforce("login_ip", client_ip(request), LOGIN_IP_LIMIT)
+    enforce("login_account", account.strip().lower(), LOGIN_ACCOUNT_LIMIT)
+
+
+def check_signup(request: Request):
+    enforce("signup_ip", client_ip(request), SIGNUP_IP_LIMIT)
@@ -0,0 +1,345 @@
+import os
+import re
+import tempfile
+import threading
+import zlib
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import select
+
+from . import models
+from .caches import registry
+from .settings import get_settings
+
+# "Related posts and resources" from TF-IDF cosine similarity over hashed word features.
+#
+# Each post (title + content) and resource (title + context + teachings) is kept as a sparse
+# vector of log-scaled term counts over HASH_DIM hashed features, with document frequencies
+# kept alongside. Writes only touch the one document; the first lookup after a write
+# re-packs everything into flat arrays weighted by the current IDF, both by document and by
+# feature (an inverted index). A lookup then reads only the postings of the features the
+# document has, sums them per document with bincount and takes the top k by argpartition.
+#
+# The term vectors are saved to RELATED_SNAPSHOT_PATH (on shutdown and every
+# RELATED_SNAPSHOT_INTERVAL_SECONDS when changed), each with the updated_at of the row it was
+# made from. On startup the snapshot is loaded and only rows added, deleted or updated since
+# are read from the database. Other workers learn about a change over the local bus and
+# re-read that row on their next lookup, or before their next save; a row still waiting for
+# that when the snapshot is written is saved as outdated, so the next load re-reads it.
+
+settings = get_settings()
+
+HASH_DIM = 1 << 18
+MAX_TERMS_PER_DOC = 400
+SNAPSHOT_VERSION = 2
+SNAPSHOT_PATH = settings.related_snapshot_path
+SNAPSHOT_INTERVAL_SECONDS = settings.related_snapshot_interval_seconds
+DEFAULT_LIMIT = 5
+MAX_LIMIT = 20
+
+KINDS = ("post", "resource")
+TOKEN = re.compile(r"[a-z0-9]{2,}")
+STOP_WORDS = frozenset(
+    "the and for are but not you all any can her was one our out has have had this that with from "
+    "they will would there their what about which when your how into more some than them then these "
+    "its also just like been were who may".split()
+)
+
+
+def post_text(post):
+    return f"{post.title or ''} {post.content or ''}"
+
+
+def resource_text(resource):
+    return f"{resource.title or ''} {resource.context or ''} {resource.teachings or ''}"
+
+
+def stamp(updated_at) -> int:
+    """updated_at as integer microseconds, for exact comparison with the snapshot. 0 when unknown."""
+    if updated_at is None:
+        return 0
+    return (updated_at.replace(tzinfo=None) - datetime(1970, 1, 1)) // timedelta(microseconds=1)
+
+
+def vectorize(text: str):
+    """Sorted feature indices and log-scaled counts for one document."""
+    features = [
+        zlib.crc32(token.encode()) % HASH_DIM
+        for token in TOKEN.findall(text.lower())
+        if token not in STOP_WORDS
+    ]
+    if not features:
+        return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+    indices, counts = np.unique(np.asarray(features, dtype=np.int32), return_counts=True)
+    if len(indices) > MAX_TERMS_PER_DOC:
+        keep = np.sort(np.argpartition(counts, -MAX_TERMS_PER_DOC)[-MAX_TERMS_PER_DOC:])
+        indices, counts = indices[keep], counts[keep]
+    return indices, (1 + np.log(counts)).astype(np.float32)
+
+
+class RelatedIndex:
+    def __init__(self):
+        self._docs = {}
+        self._stamps = {}
+        self._df = np.zeros(HASH_DIM, dtype=np.int32)
+        self._stale = set()
+        self._packed = None
+        self._lock = threading.Lock()
+        self.changed = False
+
+    def __len__(self):
+        return len(self._docs)
+
+    def _remove_locked(self, key):
+        self._stamps.pop(key, None)
+        doc = self._docs.pop(key, None)
+        if doc is not None:
+            self._df[doc[0]] -= 1
+
+    def put(self, kind: str, item_id: int, text: str | None, updated_at=None):
+        key = (kind, item_id)
+        vector = vectorize(text) if text is not None else None
+        with self._lock:
+            self._remove_locked(key)
+            self._stale.discard(key)
+            if vector is not None and len(vector[0]):
+                self._docs[key] = vector
+                self._stamps[key] = stamp(updated_at)
+                self._df[vector[0]] += 1
+            self._packed = None
+            self.changed = True
+
+    def remove(self, kind: str, item_id: int):
+        self.put(kind, item_id, None)
+
+    def mark_stale(self, kind: str, item_id: int):
+        with self._lock:
+            self._stale.add((kind, item_id))
+
+    def has_stale(self) -> bool:
+        with self._lock:
+            return bool(self._stale)
+
+    def refresh_stale(self, db):
+        with self._lock:
+            stale, self._stale = self._stale, set()
+        for kind, item_id in stale:
+            if kind == "post":
+                row = db.get(models.Post, item_id)
+                self.put(kind, item_id, post_text(row) if row else None, row.updated_at if row else None)
+            else:
+                row = db.get(models.Resource, item_id)
+                self.put(kind, item_id, resource_text(row) if row else None, row.updated_at if row else None)
+
+    def replace(self, docs, stamps):
+        df = np.zeros(HASH_DIM, dtype=np.int32)
+        for indices, _ in docs.values():
+            df[indices] += 1
+        with self._lock:
+            self._docs = docs
+            self._stamps = stamps
+            self._df = df
+            self._stale = set()
+            self._packed = None
+
+    def _pack_locked(self):
+        keys = list(self._docs)
+        lengths = np.fromiter((len(self._docs[key][0]) for key in keys), dtype=np.int64, count=len(keys))
+        indices = np.concatenate([self._docs[key][0] for key in keys]) if keys else np.empty(0, dtype=np.int32)
+        values = np.concatenate([self._docs[key][1] for key in keys]) if keys else np.empty(0, dtype=np.float32)
+        rows = np.repeat(np.arange(len(keys)), lengths)
+        idf = (np.log((1 + len(keys)) / (1 + self._df)) + 1).astype(np.float32)
+        weights = values * idf[indices]
+        norms = np.sqrt(np.bincount(rows, weights=weights * weights, minlength=len(keys)))
+        norms[norms == 0] = 1
+        # Same non-zeros ordered by feature: the postings list of every feature is a slice
+        by_feature = np.argsort(indices, kind="stable")
+        self._packed = {
+            "keys": keys,
+            "positions": {key: n for n, key in enumerate(keys)},
+            "indptr": np.concatenate([[0], np.cumsum(lengths)]),
+            "indices": indices,
+            "weights": weights,
+            "norms": norms,
+            "posting_features": indices[by_feature],
+            "posting_rows": rows[by_feature],
+            "posting_weights": weights[by_feature],
+        }
+        return self._packed
+
+    def similar(self, kind: str, item_id: int, limit: int = DEFAULT_LIMIT):
+        with self._lock:
+            packed = self._packed or self._pack_locked()
+        position = packed["positions"].get((kind, item_id))
+        if position is None:
+            return []
+        start, end = packed["indptr"][position], packed["indptr"][position + 1]
+        features, query_weights = packed["indices"][start:end], packed["weights"][start:end]
+        # Only the postings of the features this document has are touched
+        lows = np.searchsorted(packed["posting_features"], features, side="left")
+        highs = np.searchsorted(packed["posting_features"], features, side="right")
+        counts = highs - lows
+        offsets = np.repeat(lows - np.concatenate([[0], np.cumsum(counts)[:-1]]), counts)
+        postings = np.arange(counts.sum()) + offsets
+        scores = np.bincount(
+            packed["posting_rows"][postings],
+            weights=packed["posting_weights"][postings] * np.repeat(query_weights, counts),
+            minlength=len(packed["keys"]),
+        )
+        scores /= packed["norms"] * packed["norms"][position]
+        scores[position] = 0
+        limit = min(limit, len(scores))
+        top = np.argpartition(scores, -limit)[-limit:]
+        top = top[np.argsort(scores[top])[::-1]]
+        return [(*packed["keys"][n], float(scores[n])) for n in top if scores[n] > 0]
+
+    def save(self, path: str = SNAPSHOT_PATH):
+        with self._lock:
+            keys = list(self._docs)
+            vectors = [self._docs[key] for key in keys]
+            # Outdated entries get stamp 0, so loading the snapshot re-reads them
+            stamps = [0 if key in self._stale else self._stamps.get(key, 0) for key in keys]
+            self.changed = False
+        lengths = np.array([len(indices) for indices, _ in vectors], dtype=np.int64)
+        directory = os.path.dirname(path) or "."
+        with tempfile.NamedTemporaryFile(dir=directory, suffix=".npz", delete=False) as handle:
+            np.savez(
+                handle,
+                version=np.array(SNAPSHOT_VERSION),
+                hash_dim=np.array(HASH_DIM),
+                kinds=np.array([KINDS.index(kind) for kind, _ in keys], dtype=np.int8),
+                ids=np.array([item_id for _, item_id in keys], dtype=np.int64),
+                stamps=np.array(stamps, dtype=np.int64),
+                indptr=np.concatenate([[0], np.cumsum(lengths)]),
+                indices=np.concatenate([v[0] for v in vectors]) if vectors else np.empty(0, dtype=np.int32),
+                values=np.concatenate([v[1] for v in vectors]) if vectors else np.empty(0, dtype=np.float32),
+            )
+        # Several workers may save at once; each replace is atomic
+        os.replace(handle.name, path)
+
+    def load(self, path: str = SNAPSHOT_PATH) -> bool:
+        if not os.path.exists(path):
+            return False
+        try:
+            with np.load(path) as snapshot:
+                if int(snapshot["version"]) != SNAPSHOT_VERSION or int(snapshot["hash_dim"]) != HASH_DIM:
+                    return False
+                kinds, ids, indptr = snapshot["kinds"], snapshot["ids"], snapshot["indptr"]
+                stamps = snapshot["stamps"]
+                indices, values = snapshot["indices"], snapshot["values"]
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Related index snapshot not loaded: {e}")
+            return False
+        self.replace(
+            {
+                (KINDS[kinds[n]], int(ids[n])): (indices[indptr[n]:indptr[n + 1]], values[indptr[n]:indptr[n + 1]])
+                for n in range(len(ids))
+            },
+            {(KINDS[kinds[n]], int(ids[n])): int(stamps[n]) for n in range(len(ids))},
+        )
+        self.changed = False
+        return True
+
+    def stamps(self):
+        with self._lock:
+            return dict(self._stamps)
+
+
+index = RelatedIndex()
+
+
+def _apply(message):
+    index.mark_stale(message["type"], message["id"])
+
+
+def put(kind: str, item_id: int, text: str | None, updated_at=None):
+    index.put(kind, item_id, text, updated_at)
+    registry.broadcast("related", {"type": kind, "id": item_id})
+
+
+def remove(kind: str, item_id: int):
+    put(kind, item_id, None)
+
+
+registry.register("related", _apply, size=lambda: len(index))
+
+
+def _load_rows(db, kind, ids=None):
+    model, text = (models.Post, post_text) if kind == "post" else (models.Resource, resource_text)
+    stmt = select(model)
+    if ids is not None:
+        stmt = stmt.where(model.id.in_(ids))
+    for row in db.execute(stmt).scalars():
+        yield row.id, text(row), row.updated_at
+
+
+def rebuild(db):
+    docs, stamps = {}, {}
+    for kind in KINDS:
+        for item_id, text, updated_at in _load_rows(db, kind):
+            vector = vectorize(text)
+            if len(vector[0]):
+                docs[(kind, item_id)] = vector
+                stamps[(kind, item_id)] = stamp(updated_at)
+    index.replace(docs, stamps)
+    index.changed = True
+    return len(index)
+
+
+def load_or_rebuild(db):
+    """Startup: snapshot plus the rows added, deleted or updated since, or a full rebuild without one."""
+    if not index.load():
+        return rebuild(db)
+    known = index.stamps()
+    for kind, model in (("post", models.Post), ("resource", models.Resource)):
+        current = {item_id: stamp(updated_at) for item_id, updated_at in db.execute(select(model.id, model.updated_at))}
+        indexed = {item_id: saved for (k, item_id), saved in known.items() if k == kind}
+        for item_id in indexed.keys() - current.keys():
+            index.remove(kind, item_id)
+        outdated = [item_id for item_id, updated in current.items() if item_id not in indexed or updated > indexed[item_id]]
+        for start in range(0, len(outdated), 500):
+            for item_id, text, updated_at in _load_rows(db, kind, outdated[start:start + 500]):
+                index.put(kind, item_id, text, updated_at)
+    return len(index)
+
+
+def save_if_changed():
+    if index.has_stale():
+        from .database import SessionLocal
+
+        db = SessionLocal()
+        try:
+            index.refresh_stale(db)
+        finally:
+            db.close()
+    if index.changed:
+        index.save()
+
+
+def get_related(db, kind: str, item_id: int, limit: int = DEFAULT_LIMIT):
+    index.refresh_stale(db)
+    matches = index.similar(kind, item_id, limit=limit)
+    titles = {}
+    for match_kind, model in (("post", models.Post), ("resource", models.Resource)):
+        ids = [match_id for k, match_id, _ in matches if k == match_kind]
+        if ids:
+            for match_id, title in db.execute(select(model.id, model.title).where(model.id.in_(ids))):
+                titles[(match_kind, match_id)] = title
+    return [
+        {"type": match_kind, "id": match_id, "title": titles[(match_kind, match_id)], "score": round(score, 4)}
+        for match_kind, match_id, score in matches
+        if (match_kind, match_id) in titles
+    ]
+
+
+if __name__ == "__main__":
+    from .database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        print(f"Indexed {rebuild(db)} documents")
+        index.save()
+        print(f"Saved {SNAPSHOT_PATH}")
+    finally:
+        db.close()
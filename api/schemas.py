@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from datetime import datetime 
-from typing import List, Optional 
+from typing import Dict, List, Optional 
  
 # Schemas for Post Categories
 class PostCategoryBase(BaseModel):
@@ -54,6 +54,8 @@ class PostSummary(BaseModel):
     image_url: Optional[str] = None  
     category_id: Optional[int] = None  
     category: Optional[PostCategory] = None  
+    bookmark_count: int = 0
+    comment_count: int = 0
     
     class Config:
         from_attributes = True
@@ -97,6 +99,8 @@ class ResourceCreate(ResourceBase):
 class Resource(ResourceBase):
     id: int
     created_at: datetime
+    updated_at: Optional[datetime] = None
+    view_count: int = 0
     category: Optional[ResourceCategory] = None
 
     class Config:
@@ -114,6 +118,8 @@ class ClubCreate(ClubBase):
 class Club(ClubBase):
     id: int
     created_at: datetime
+    updated_at: Optional[datetime] = None
+    view_count: int = 0
     category: Optional[ClubCategory] = None
 
     class Config:
@@ -126,9 +132,13 @@ class Post(BaseModel):
     content: str
     owner_id: int
     created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
     image_url: Optional[str] = None  
     category_id: Optional[int] = None  
     category: Optional[PostCategory] = None
+    bookmark_count: int = 0
+    comment_count: int = 0
+    view_count: int = 0
     owner: "UserPublic"
     bookmarks: List[BookmarkInPost] = []
 
@@ -158,6 +168,7 @@ class User(BaseModel):
     is_active: bool
     is_verified: bool
     username: Optional[str]
+    unread_notifications: int = 0
     posts: List[Post] = []  # Use the main Post schema
     bookmarks: List[Bookmark] = []  # This will use PostSummary for post details
 
@@ -183,6 +194,10 @@ class VerificationToken(BaseModel):
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+
+class RefreshTokenRequest(BaseModel):
+    refresh_token: str
 
 class TokenData(BaseModel):
     email: str | None = None
@@ -193,13 +208,157 @@ class CommentBase(BaseModel):
 
 class CommentCreate(CommentBase):
     post_id: int
+    parent_id: Optional[int] = None # the comment this replies to
 
 class Comment(CommentBase):
     id: int
     user_id: int
     post_id: int
     created_at: datetime
+    updated_at: Optional[datetime] = None
+    parent_id: Optional[int] = None
+    depth: int = 0
+    reply_count: int = 0
     user: UserPublic
     
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class CommentThread(Comment):
+    # The first replies below the root, in thread order; reply_count says how many there are
+    replies: List[Comment] = []
+
+class CommentThreadPage(BaseModel):
+    items: List[CommentThread]
+    # Pass as ?before= for the next page; None on the last one
+    next_cursor: Optional[int] = None
+
+class CommentPage(BaseModel):
+    items: List[Comment]
+    # Pass as ?after= for the next page; None on the last one
+    next_cursor: Optional[int] = None
+
+# Typeahead
+class Suggestion(BaseModel):
+    type: str
+    id: int
+    label: str
+
+class RelatedItem(BaseModel):
+    type: str
+    id: int
+    title: Optional[str] = None
+    score: float
+
+# Facets
+class CategoryCount(BaseModel):
+    id: Optional[int] = None
+    name: Optional[str] = None
+    count: int
+
+class MonthCount(BaseModel):
+    month: str
+    count: int
+
+class Facets(BaseModel):
+    total: int
+    categories: List[CategoryCount] = []
+    months: List[MonthCount] = []
+
+# Page bootstrap
+class BlogBootstrap(BaseModel):
+    posts: List[Post]
+    categories: List[PostCategory]
+    total: int
+    viewer: Optional[UserPublic] = None
+    bookmarks: List[Bookmark] = []
+
+class ResourcesBootstrap(BaseModel):
+    resources: List[Resource]
+    categories: List[ResourceCategory]
+    total: int
+
+class ClubsBootstrap(BaseModel):
+    clubs: List[Club]
+    categories: List[ClubCategory]
+    total: int
+
+# Delta sync
+class DeletedItem(BaseModel):
+    type: str
+    id: int
+    deleted_at: datetime
+
+class Changes(BaseModel):
+    posts: List[Post] = []
+    resources: List[Resource] = []
+    clubs: List[Club] = []
+    comments: List[Comment] = []
+    deleted: List[DeletedItem] = []
+    next: str
+    has_more: bool
+
+# Direct uploads
+class PresignRequest(BaseModel):
+    filename: str
+    content_type: str
+    size: Optional[int] = None
+
+class PresignedUpload(BaseModel):
+    upload_id: int
+    url: str
+    method: str = "POST"
+    fields: Dict[str, str]
+    file_field: str = "file"
+    expires_at: datetime
+    max_bytes: int
+
+class UploadReceipt(BaseModel):
+    signature: str
+    # local storage
+    key: Optional[str] = None
+    size: Optional[int] = None
+    sha256: Optional[str] = None
+    # Cloudinary's upload response
+    public_id: Optional[str] = None
+    version: Optional[int] = None
+    format: Optional[str] = None
+    bytes: Optional[int] = None
+
+class UploadResult(BaseModel):
+    filename: str
+    url: str
+
+# Notifications
+class NotificationPost(BaseModel):
+    id: int
+    title: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+class Notification(BaseModel):
+    id: int
+    kind: str
+    post_id: int
+    comment_id: Optional[int] = None
+    created_at: datetime
+    read_at: Optional[datetime] = None
+    actor: UserPublic
+    post: NotificationPost
+
+    class Config:
+        from_attributes = True
+
+class NotificationPage(BaseModel):
+    items: List[Notification]
+    # Pass as ?before= for the next page; None on the last one
+    next_cursor: Optional[int] = None
+    unread_count: int
+
+class NotificationsRead(BaseModel):
+    # Mark only notifications up to this id read (the newest one the client has shown); all when omitted
+    up_to: Optional[int] = None
+
+class UnreadCount(BaseModel):
+    unread_count: int
@@ -0,0 +1,48 @@
+import threading
+
+from .caches import registry
+
+# Cached response sections (e.g. the category list of a page) that only change on
+# specific writes. get() builds a section once; invalidate() drops it here and in every
+# other worker. A build that races with an invalidation is not stored.
+
+
+class SectionCache:
+    def __init__(self):
+        self._entries = {}
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, name: str, build):
+        with self._lock:
+            if name in self._entries:
+                return self._entries[name]
+            generation = self._generations.get(name, 0)
+        value = build()
+        with self._lock:
+            if self._generations.get(name, 0) == generation:
+                self._entries[name] = value
+        return value
+
+    def drop(self, name: str):
+        with self._lock:
+            self._entries.pop(name, None)
+            self._generations[name] = self._generations.get(name, 0) + 1
+
+
+cache = SectionCache()
+
+
+def _apply(message):
+    cache.drop(message["name"])
+
+
+def invalidate(name: str):
+    cache.drop(name)
+    registry.broadcast("sections", {"name": name})
+
+
+registry.register("sections", _apply, size=lambda: len(cache))
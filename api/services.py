@@ -0,0 +1,95 @@
+import threading
+import time
+
+from .settings import get_settings
+
+# Process-wide services that need a one-off setup step. None of these setup steps runs at
+# import time: the app lifespan calls startup(), and code paths that need a service call its
+# init_* method first, which is a no-op once done. Settings and the SQLAlchemy engine (which
+# opens no connection until the first query) are created at import; see settings.py.
+
+
+class Services:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ready = set()
+        self.init_seconds = {}
+
+    def _init_once(self, name: str, setup):
+        if name in self._ready:
+            return
+        with self._lock:
+            if name in self._ready:
+                return
+            started = time.perf_counter()
+            setup()
+            self.init_seconds[name] = time.perf_counter() - started
+            self._ready.add(name)
+
+    def init_database(self):
+        def setup():
+            from . import models
+            from .database import engine
+            from .migrations import (
+                add_missing_columns, backfill_comment_paths, backfill_updated_at, check_foreign_key_actions, init_change_seq
+            )
+
+            # Creates the tables defined in models.py that don't exist yet
+            models.Base.metadata.create_all(bind=engine)
+            add_missing_columns(engine, models.Base.metadata)
+            check_foreign_key_actions(engine, models.Base.metadata)
+            init_change_seq(engine, models.Base.metadata)
+            backfill_updated_at(engine, models.Base.metadata)
+            backfill_comment_paths(engine, models.Base.metadata)
+
+        self._init_once("database", setup)
+
+    def init_cloudinary(self):
+        def setup():
+            import cloudinary
+
+            settings = get_settings()
+            cloudinary.config(
+                cloud_name=settings.cloudinary_cloud_name,
+                api_key=settings.cloudinary_api_key,
+                api_secret=settings.cloudinary_api_secret
+            )
+
+        self._init_once("cloudinary", setup)
+
+    def init_suggest(self):
+        def setup():
+            from . import suggest
+            from .database import SessionLocal
+
+            db = SessionLocal()
+            try:
+                suggest.rebuild(db)
+            finally:
+                db.close()
+
+        self.init_database()
+        self._init_once("suggest", setup)
+
+    def init_related(self):
+        def setup():
+            from . import related
+            from .database import SessionLocal
+
+            db = SessionLocal()
+            try:
+                related.load_or_rebuild(db)
+            finally:
+                db.close()
+
+        self.init_database()
+        self._init_once("related", setup)
+
+    def startup(self):
+        self.init_database()
+        self.init_cloudinary()
+        self.init_suggest()
+        self.init_related()
+
+
+services = Services()
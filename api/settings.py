@@ -0,0 +1,143 @@
+import os
+from functools import lru_cache
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+# Directory of the api package; the .env file lives here
+BASE_DIR = Path(__file__).resolve().parent
+
+# Settings are not lazy: the first module that calls get_settings() reads .env and the
+# environment, and modules copy what they need into constants at import. That is only
+# environment lookups. What waits for the lifespan (or first use) is the expensive part,
+# database migrations, Cloudinary setup and index builds, in services.py.
+
+
+class Settings:
+    """Environment configuration, read once per process."""
+
+    def __init__(self):
+        load_dotenv(BASE_DIR / ".env")
+
+        self.database_url = os.getenv("DATABASE_URL")
+        self.prod_origin = os.getenv("PROD_ORIGIN")
+
+        # Auth
+        self.jwt_secret_key = os.getenv("JWT_SECRET_KEY")
+        self.google_client_id = os.getenv("GOOGLE_CLIENT_ID")
+        self.google_client_secret = os.getenv("GOOGLE_CLIENT_SECRET")
+        self.google_redirect_uri = os.getenv("GOOGLE_REDIRECT_URI")
+        self.refresh_token_expire_days = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", 14))
+
+        # Email
+        self.email_host = os.getenv("EMAIL_HOST")
+        self.email_port = int(os.getenv("EMAIL_PORT", 587))
+        self.email_username = os.getenv("EMAIL_USERNAME")
+        self.email_password = os.getenv("EMAIL_PASSWORD")
+        self.email_from = os.getenv("EMAIL_FROM")
+
+        # Cloudinary
+        self.cloudinary_cloud_name = os.getenv("CLOUDINARY_CLOUD_NAME")
+        self.cloudinary_api_key = os.getenv("CLOUDINARY_API_KEY")
+        self.cloudinary_api_secret = os.getenv("CLOUDINARY_API_SECRET")
+
+        # Direct uploads: signs upload forms and storage receipts (see storage.py)
+        self.storage_signing_key = os.getenv("STORAGE_SIGNING_KEY")
+
+        self.worker_bus_dir = os.getenv("WORKER_BUS_DIR")
+
+        # Image uploads through /uploadfile (main.py)
+        self.upload_mode = os.getenv("UPLOAD_MODE", "inline")
+
+        # Direct uploads (uploads.py, storage.py)
+        # Cloudinary when it is configured; "local" (storage.py) only when asked for, it is for development
+        cloudinary_configured = all((self.cloudinary_cloud_name, self.cloudinary_api_key, self.cloudinary_api_secret))
+        self.direct_upload_backend = os.getenv("DIRECT_UPLOAD_BACKEND") or ("cloudinary" if cloudinary_configured else None)
+        self.local_storage_url = os.getenv("LOCAL_STORAGE_URL", "/storage/upload")
+        self.upload_url_ttl_seconds = int(os.getenv("UPLOAD_URL_TTL_SECONDS", 300))
+        self.upload_max_bytes = int(os.getenv("UPLOAD_MAX_BYTES", 10 * 1024 * 1024))
+        self.upload_prune_grace_hours = float(os.getenv("UPLOAD_PRUNE_GRACE_HOURS", 24))
+        self.upload_prune_interval_seconds = float(os.getenv("UPLOAD_PRUNE_INTERVAL_SECONDS", 3600))
+        self.storage_allowed_origins = [origin for origin in os.getenv("STORAGE_ALLOWED_ORIGINS", "*").split(",") if origin]
+
+        # Media serving (media.py)
+        self.media_accel_redirect_prefix = os.getenv("MEDIA_ACCEL_REDIRECT_PREFIX")
+
+        # Admission control (admission.py)
+        self.threadpool_size = int(os.getenv("THREADPOOL_SIZE", 40))
+        self.admission_queue_timeout_ms = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_MS", 1000))
+        self.admission_codel_target_ms = float(os.getenv("ADMISSION_CODEL_TARGET_MS", 20))
+        self.admission_codel_interval_ms = float(os.getenv("ADMISSION_CODEL_INTERVAL_MS", 200))
+        self.admission_auth_limit = int(os.getenv("ADMISSION_AUTH_LIMIT", 4))
+        self.admission_auth_queue = int(os.getenv("ADMISSION_AUTH_QUEUE", 16))
+        self.admission_write_limit = int(os.getenv("ADMISSION_WRITE_LIMIT", 12))
+        self.admission_write_queue = int(os.getenv("ADMISSION_WRITE_QUEUE", 48))
+        self.admission_read_limit = int(os.getenv("ADMISSION_READ_LIMIT", 24))
+        self.admission_read_queue = int(os.getenv("ADMISSION_READ_QUEUE", 96))
+
+        # Rate limits (rate_limit.py)
+        self.login_ip_limit = os.getenv("LOGIN_IP_LIMIT", "20/60")
+        self.login_account_limit = os.getenv("LOGIN_ACCOUNT_LIMIT", "5/60")
+        self.signup_ip_limit = os.getenv("SIGNUP_IP_LIMIT", "5/300")
+        self.trust_forwarded_for = os.getenv("TRUST_FORWARDED_FOR", "").lower() in ("1", "true", "yes")
+        self.rate_limit_backend = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+
+        # Read coalescing (coalesce.py)
+        self.coalesce_reads = os.getenv("COALESCE_READS", "1").lower() in ("1", "true", "yes")
+
+        # Response compression (compression.py)
+        self.compression_min_size = int(os.getenv("COMPRESSION_MIN_SIZE", 1024))
+        self.compression_cache_max_bytes = int(os.getenv("COMPRESSION_CACHE_MAX_BYTES", 16 * 1024 * 1024))
+
+        # Caches (entities.py, facets.py, suggest.py)
+        self.entity_cache_size = int(os.getenv("ENTITY_CACHE_SIZE", 10000))
+        self.entity_cache_ttl_seconds = float(os.getenv("ENTITY_CACHE_TTL_SECONDS", 30))
+        self.facets_cache_size = int(os.getenv("FACETS_CACHE_SIZE", 512))
+        self.suggest_max_entries = int(os.getenv("SUGGEST_MAX_ENTRIES", 200_000))
+        self.suggest_max_key_chars = int(os.getenv("SUGGEST_MAX_KEY_CHARS", 48))
+
+        # Query stats (sql_stats.py)
+        self.sql_slow_query_ms = float(os.getenv("SQL_SLOW_QUERY_MS", 200))
+        self.sql_repeat_threshold = int(os.getenv("SQL_REPEAT_THRESHOLD", 5))
+        self.sql_server_timing = os.getenv("SQL_SERVER_TIMING", "").lower() in ("1", "true", "yes")
+
+        # Server-Sent Events (events.py)
+        self.sse_queue_size = int(os.getenv("SSE_QUEUE_SIZE", 100))
+        self.sse_heartbeat_seconds = float(os.getenv("SSE_HEARTBEAT_SECONDS", 15))
+        self.sse_idle_timeout_seconds = float(os.getenv("SSE_IDLE_TIMEOUT_SECONDS", 300))
+
+        # Background jobs (jobs.py)
+        self.job_workers = int(os.getenv("JOB_WORKERS", 2))
+        self.job_poll_seconds = float(os.getenv("JOB_POLL_SECONDS", 1))
+        self.job_visibility_timeout_seconds = float(os.getenv("JOB_VISIBILITY_TIMEOUT_SECONDS", 300))
+        self.job_backoff_base_seconds = float(os.getenv("JOB_BACKOFF_BASE_SECONDS", 5))
+
+        # Change feed (changes.py)
+        self.changes_max_limit = int(os.getenv("CHANGES_MAX_LIMIT", 1000))
+        self.changes_tombstone_days = int(os.getenv("CHANGES_TOMBSTONE_DAYS", 30))
+        self.changes_prune_interval_seconds = int(os.getenv("CHANGES_PRUNE_INTERVAL_SECONDS", 3600))
+
+        # Trending (trending.py)
+        self.trending_half_life_hours = float(os.getenv("TRENDING_HALF_LIFE_HOURS", 24))
+        self.trending_min_score = float(os.getenv("TRENDING_MIN_SCORE", 0.01))
+        self.trending_decay_interval_seconds = float(os.getenv("TRENDING_DECAY_INTERVAL_SECONDS", 600))
+
+        # Related content index (related.py)
+        self.related_snapshot_path = os.getenv("RELATED_SNAPSHOT_PATH", str(BASE_DIR / "related_index.npz"))
+        self.related_snapshot_interval_seconds = float(os.getenv("RELATED_SNAPSHOT_INTERVAL_SECONDS", 300))
+
+        # View counters (views.py)
+        self.view_counter_shards = max(1, int(os.getenv("VIEW_COUNTER_SHARDS", 16)))
+        self.view_flush_interval_seconds = float(os.getenv("VIEW_FLUSH_INTERVAL_SECONDS", 10))
+
+        # Notifications (notifications.py)
+        self.notify_fanout_batch_size = int(os.getenv("NOTIFY_FANOUT_BATCH_SIZE", 500))
+        self.notifications_max_limit = int(os.getenv("NOTIFICATIONS_MAX_LIMIT", 100))
+
+        # Comment threads (threads.py)
+        self.comment_max_depth = int(os.getenv("COMMENT_MAX_DEPTH", 16))
+
+
+@lru_cache
+def get_settings() -> Settings:
+    return Settings()
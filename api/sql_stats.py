@@ -0,0 +1,169 @@
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+from . import metrics
+from .settings import get_settings
+
+# Per-request SQL accounting.
+#
+# Engine events time every statement and charge it to the request being served (a
+# ContextVar, which the threadpool copies into sync routes). SQLStatsMiddleware records
+# per-route metrics and, with SQL_SERVER_TIMING=1 (off by default: it shows clients how the
+# database is doing), a Server-Timing header (count, total DB time, slowest statement).
+# A statement that runs SQL_REPEAT_THRESHOLD times or more in one request is almost always
+# a lazy load in a loop (N+1); those are logged and counted in sql_repeated_statements.
+#
+# query_budget() is for scripts and tests: it fails when the code or requests run inside
+# it issue more statements than allowed.
+
+settings = get_settings()
+
+SLOW_QUERY_MS = settings.sql_slow_query_ms
+REPEAT_THRESHOLD = settings.sql_repeat_threshold
+SERVER_TIMING = settings.sql_server_timing
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.slowest_seconds = 0.0
+        self.slowest_statement = None
+        self.statements = Counter()
+
+    def record(self, statement: str, seconds: float):
+        self.count += 1
+        self.seconds += seconds
+        self.statements[statement] += 1
+        if seconds > self.slowest_seconds:
+            self.slowest_seconds = seconds
+            self.slowest_statement = statement
+
+    def repeated(self, threshold: int = REPEAT_THRESHOLD):
+        return [(statement, n) for statement, n in self.statements.most_common() if n >= threshold]
+
+
+def _one_line(statement: str) -> str:
+    return " ".join(statement.split())
+
+
+_current = ContextVar("sql_stats", default=None)
+_observers = []
+_observers_lock = threading.Lock()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("sql_stats_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["sql_stats_started"].pop()
+    stats = _current.get()
+    if stats is not None:
+        stats.record(statement, time.perf_counter() - started)
+
+
+def _handle_error(exception_context):
+    # after_cursor_execute doesn't fire for a failed statement
+    started = exception_context.connection.info.get("sql_stats_started") if exception_context.connection else None
+    if started:
+        started.pop()
+
+
+def instrument(engine):
+    if event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+def _finish(route: str, stats: QueryStats):
+    metrics.increment("sql_queries", stats.count, route=route)
+    metrics.increment("sql_seconds", stats.seconds, route=route)
+    if stats.slowest_seconds * 1000 >= SLOW_QUERY_MS:
+        metrics.increment("sql_slow_queries", route=route)
+        print(f"WARNING: slow query on {route} ({stats.slowest_seconds * 1000:.0f} ms): {_one_line(stats.slowest_statement)}")
+    for statement, n in stats.repeated():
+        metrics.increment("sql_repeated_statements", route=route)
+        print(f"WARNING: possible N+1 on {route}, ran {n} times: {_one_line(statement)}")
+    with _observers_lock:
+        observers = list(_observers)
+    for observer in observers:
+        observer(route, stats)
+
+
+def _server_timing(stats: QueryStats) -> bytes:
+    value = f'db;dur={stats.seconds * 1000:.1f};desc="{stats.count} queries"'
+    if stats.count:
+        value += f", db-slowest;dur={stats.slowest_seconds * 1000:.1f}"
+    return value.encode("latin-1")
+
+
+class SQLStatsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = QueryStats()
+        token = _current.set(stats)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and SERVER_TIMING:
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", _server_timing(stats)))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            _finish(route, stats)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def query_budget(max_queries: int):
+    """Fails when the block, including any requests served while it runs, issues more than max_queries statements.
+
+        with sql_stats.query_budget(3):
+            client.get("/posts/")
+    """
+    stats = QueryStats()
+    requests = []
+
+    def observe(route, request_stats):
+        requests.append((route, request_stats))
+
+    token = _current.set(stats)
+    with _observers_lock:
+        _observers.append(observe)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+        with _observers_lock:
+            _observers.remove(observe)
+    for route, request_stats in requests:
+        for statement, n in request_stats.statements.items():
+            stats.statements[statement] += n
+        stats.count += request_stats.count
+        stats.seconds += request_stats.seconds
+    if stats.count > max_queries:
+        lines = [f"{n}x {_one_line(statement)}" for statement, n in stats.statements.most_common(5)]
+        raise QueryBudgetExceeded(
+            f"{stats.count} queries, budget {max_queries}. Most frequent:\n" + "\n".join(lines)
+        )
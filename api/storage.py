@@ -0,0 +1,123 @@
+import argparse
+import hashlib
+import hmac
+import os
+import tempfile
+import time
+
+from fastapi import FastAPI, File, Form, HTTPException, UploadFile
+
+from .settings import BASE_DIR, get_settings
+
+# Local stand-in for an object store that takes uploads straight from the browser.
+#
+# POST /uploads/presign hands the browser a form signed with the storage key: the object
+# key, content type, size limit and expiry. The browser posts that form and the file here.
+# This app checks the signature, writes static/uploads/<key> and answers with a receipt
+# (key, size, sha256) signed with the same key. POST /uploads/{id}/complete only has to
+# check the receipt, so the API never touches the bytes.
+#
+# In development the app is mounted in the API at /storage. To keep upload bandwidth off
+# the API workers, run it as its own process and point LOCAL_STORAGE_URL at it:
+#
+#   python -m api.storage --port 9000
+#   LOCAL_STORAGE_URL=http://127.0.0.1:9000/upload
+
+settings = get_settings()
+
+UPLOAD_DIR = BASE_DIR / "static" / "uploads"
+ALLOWED_ORIGINS = settings.storage_allowed_origins
+CHUNK_SIZE = 1024 * 1024
+
+
+def signing_key() -> bytes:
+    settings = get_settings()
+    if settings.storage_signing_key:
+        return settings.storage_signing_key.encode()
+    if not settings.jwt_secret_key:
+        raise RuntimeError("Set STORAGE_SIGNING_KEY (or JWT_SECRET_KEY) to use direct uploads")
+    # Derived, so the JWT secret itself never signs anything a client gets to see
+    return hmac.new(settings.jwt_secret_key.encode(), b"storage-signing-key", hashlib.sha256).digest()
+
+
+def _sign(*parts) -> str:
+    message = "\n".join(str(part) for part in parts).encode()
+    return hmac.new(signing_key(), message, hashlib.sha256).hexdigest()
+
+
+def sign_policy(key: str, content_type: str, max_bytes: int, expires: int) -> str:
+    return _sign("policy", key, content_type, max_bytes, expires)
+
+
+def sign_receipt(key: str, size: int, sha256: str) -> str:
+    return _sign("receipt", key, size, sha256)
+
+
+def verify_receipt(key: str, size: int, sha256: str, signature: str) -> bool:
+    return hmac.compare_digest(sign_receipt(key, size, sha256), signature)
+
+
+def _valid_key(key: str) -> bool:
+    return bool(key) and not key.startswith(".") and "/" not in key and "\\" not in key
+
+
+app = FastAPI(title="Local upload storage")
+
+
+@app.post("/upload")
+def store_upload(
+    key: str = Form(...),
+    content_type: str = Form(...),
+    max_bytes: int = Form(...),
+    expires: int = Form(...),
+    signature: str = Form(...),
+    file: UploadFile = File(...),
+):
+    if not hmac.compare_digest(sign_policy(key, content_type, max_bytes, expires), signature):
+        raise HTTPException(status_code=403, detail="Invalid upload signature")
+    if expires < time.time():
+        raise HTTPException(status_code=403, detail="Upload form has expired")
+    if not _valid_key(key):
+        raise HTTPException(status_code=400, detail="Invalid key")
+    if file.content_type != content_type:
+        raise HTTPException(status_code=400, detail="Content type does not match the signed one")
+
+    UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, temp_path = tempfile.mkstemp(dir=UPLOAD_DIR, prefix=".upload-")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while chunk := file.file.read(CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(status_code=413, detail=f"File is larger than {max_bytes} bytes")
+                digest.update(chunk)
+                out.write(chunk)
+        try:
+            # link, not replace: a key is written once and never overwritten
+            os.link(temp_path, UPLOAD_DIR / key)
+        except FileExistsError:
+            raise HTTPException(status_code=409, detail="Key has already been used")
+    finally:
+        os.unlink(temp_path)
+
+    sha256 = digest.hexdigest()
+    return {"key": key, "size": size, "sha256": sha256, "signature": sign_receipt(key, size, sha256)}
+
+
+def main():
+    import uvicorn
+    from fastapi.middleware.cors import CORSMiddleware
+
+    parser = argparse.ArgumentParser(prog="python -m api.storage")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    args = parser.parse_args()
+    # Only standalone: mounted in the API, the API's own CORS middleware already applies
+    app.add_middleware(CORSMiddleware, allow_origins=ALLOWED_ORIGINS, allow_methods=["POST"], allow_headers=["*"])
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import bisect
+import re
+import threading
+
+from sqlalchemy import select
+
+from . import metrics, models
+from .caches import registry
+from .settings import get_settings
+
+# Typeahead over post titles, resource titles, club names and category names.
+#
+# The index is a sorted list of (key, kind, id) where key is the lowercased label starting
+# at each word, so "intro to rust" is found by "intro", "to" and "rust". A lookup is a
+# bisect to the first key >= the query and a short walk forward, so its cost depends on
+# the number of results, not on the number of rows. crud keeps it current on every write
+# and forwards the change to the other workers over the local bus.
+#
+# Memory is bounded by SUGGEST_MAX_ENTRIES keys of at most SUGGEST_MAX_KEY_CHARS characters;
+# items that don't fit are left out (counted in suggest_index_full) until the next rebuild.
+
+settings = get_settings()
+
+MAX_ENTRIES = settings.suggest_max_entries
+MAX_KEY_CHARS = settings.suggest_max_key_chars
+MAX_WORDS_PER_LABEL = 8
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 25
+# Keys looked at per search at most, so a filter by type can't turn into a full scan
+MAX_SCAN = 2000
+
+KINDS = ("post", "resource", "club", "post_category", "resource_category", "club_category")
+WORD_START = re.compile(r"\w+")
+
+
+def _keys(label: str):
+    text = " ".join(label.lower().split())
+    keys = []
+    for match in WORD_START.finditer(text):
+        keys.append(text[match.start():match.start() + MAX_KEY_CHARS])
+        if len(keys) == MAX_WORDS_PER_LABEL:
+            break
+    return keys
+
+
+class PrefixIndex:
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = []
+        self._labels = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove_locked(self, item):
+        label = self._labels.pop(item, None)
+        if label is None:
+            return
+        kind, item_id = item
+        for key in set(_keys(label)):
+            entry = (key, kind, item_id)
+            position = bisect.bisect_left(self._entries, entry)
+            if position < len(self._entries) and self._entries[position] == entry:
+                del self._entries[position]
+
+    def put(self, kind: str, item_id: int, label: str | None):
+        item = (kind, item_id)
+        with self._lock:
+            if self._labels.get(item) == label:
+                return
+            self._remove_locked(item)
+            if not label:
+                return
+            keys = set(_keys(label))
+            if len(self._entries) + len(keys) > self.max_entries:
+                metrics.increment("suggest_index_full")
+                return
+            self._labels[item] = label
+            for key in keys:
+                bisect.insort(self._entries, (key, kind, item_id))
+
+    def remove(self, kind: str, item_id: int):
+        with self._lock:
+            self._remove_locked((kind, item_id))
+
+    def load(self, items):
+        """Replaces the whole index with (kind, id, label) rows."""
+        entries = []
+        labels = {}
+        for kind, item_id, label in items:
+            if not label:
+                continue
+            keys = set(_keys(label))
+            if len(entries) + len(keys) > self.max_entries:
+                metrics.increment("suggest_index_full")
+                continue
+            labels[(kind, item_id)] = label
+            entries.extend((key, kind, item_id) for key in keys)
+        entries.sort()
+        with self._lock:
+            self._entries = entries
+            self._labels = labels
+
+    def search(self, query: str, limit: int = DEFAULT_LIMIT, kinds=None):
+        prefix = " ".join(query.lower().split())[:MAX_KEY_CHARS]
+        if not prefix:
+            return []
+        results = []
+        seen = set()
+        with self._lock:
+            position = bisect.bisect_left(self._entries, (prefix,))
+            end = min(len(self._entries), position + MAX_SCAN)
+            while position < end and len(results) < limit:
+                key, kind, item_id = self._entries[position]
+                if not key.startswith(prefix):
+                    break
+                position += 1
+                if (kind, item_id) in seen or (kinds and kind not in kinds):
+                    continue
+                seen.add((kind, item_id))
+                results.append({"type": kind, "id": item_id, "label": self._labels[(kind, item_id)]})
+        return results
+
+
+index = PrefixIndex()
+
+
+def _apply(message):
+    index.put(message["type"], message["id"], message["label"])
+
+
+def put(kind: str, item_id: int, label: str | None):
+    index.put(kind, item_id, label)
+    registry.broadcast("suggest", {"type": kind, "id": item_id, "label": label})
+
+
+def remove(kind: str, item_id: int):
+    put(kind, item_id, None)
+
+
+registry.register("suggest", _apply, size=lambda: len(index))
+
+
+def rebuild(db):
+    sources = (
+        ("post", models.Post.id, models.Post.title),
+        ("resource", models.Resource.id, models.Resource.title),
+        ("club", models.Club.id, models.Club.name),
+        ("post_category", models.PostCategory.id, models.PostCategory.name),
+        ("resource_category", models.ResourceCategory.id, models.ResourceCategory.name),
+        ("club_category", models.ClubCategory.id, models.ClubCategory.name),
+    )
+    items = []
+    for kind, id_column, label_column in sources:
+        items.extend((kind, item_id, label) for item_id, label in db.execute(select(id_column, label_column)))
+    index.load(items)
+    return len(index)
@@ -0,0 +1,73 @@
+from pathlib import Path
+
+from . import crud
+from . import jobs
+from . import notifications
+from .database import SessionLocal
+from .email_utils import send_verification_email
+from .services import services
+
+# Handlers for the background jobs in jobs.py. Each one must be safe to run twice:
+# a job is retried after a failure and re-run if its worker dies mid-way.
+
+
+@jobs.handler("upload_image")
+def upload_image(payload: dict):
+    """Moves an image saved under static/uploads to Cloudinary and repoints rows that use it."""
+    path = Path(payload["path"])
+    if not path.exists():
+        # Already uploaded by an earlier attempt
+        return
+    import cloudinary.uploader
+
+    db = SessionLocal()
+    try:
+        if not crud.image_url_in_use(db, payload["url"]):
+            # Nothing uses the URL (any more): keep serving the local file, upload nothing
+            print(f"WARNING: no rows use {payload['url']}; keeping the local file")
+            return
+        services.init_cloudinary()
+        result = cloudinary.uploader.upload(str(path))
+        updated = crud.replace_image_url(db, old_url=payload["url"], new_url=result.get("secure_url"))
+    finally:
+        db.close()
+    if not updated:
+        # The row changed its image while the upload ran: don't leave the copy orphaned on Cloudinary
+        print(f"WARNING: no rows use {payload['url']} any more; removing its Cloudinary copy")
+        cloudinary.uploader.destroy(result["public_id"])
+        return
+    path.unlink(missing_ok=True)
+
+
+@jobs.handler("notify_comment")
+def notify_comment(payload: dict):
+    db = SessionLocal()
+    try:
+        notifications.fan_out_comment(db, payload["comment_id"])
+    finally:
+        db.close()
+
+
+@jobs.handler("send_verification_email")
+def send_verification_email_job(payload: dict):
+    send_verification_email(payload["to_email"], payload["verification_link"], raise_errors=True)
+
+
+# No longer enqueued (deletes are a single statement now); kept for jobs queued before that
+@jobs.handler("delete_post")
+def delete_post(payload: dict):
+    db = SessionLocal()
+    try:
+        crud.delete_post(db, post_id=payload["post_id"])
+    finally:
+        db.close()
+
+
+@jobs.handler("cleanup_orphan_bookmarks")
+def cleanup_orphan_bookmarks(payload: dict):
+    db = SessionLocal()
+    try:
+        deleted = crud.delete_orphan_bookmarks(db)
+        print(f"Deleted {deleted} orphan bookmarks")
+    finally:
+        db.close()
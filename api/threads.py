@@ -0,0 +1,131 @@
+from typing import Optional
+
+from sqlalchemy import and_, func, select, update
+from sqlalchemy.orm import Session, joinedload
+
+from . import models
+from .settings import get_settings
+
+# Reply threads as materialized paths.
+#
+# Every comment stores the ids from its thread's root down to itself, each zero-padded to
+# PATH_WIDTH digits and joined by "/": a root is "0000000012", a reply to it
+# "0000000012/0000000034". Sorting a post's comments by path lists each thread depth
+# first, siblings oldest first. The comment at `path` and everything below it is the range
+#
+#     path >= '<path>' AND path < '<path>0'
+#
+# ("/" sorts right before "0"), so a thread or a subtree is one range scan on the
+# (post_id, path) index, with no recursive queries. The top-N roots with their first K
+# replies are one query as well: a window function numbers each thread's rows in path
+# order and keeps the first K + 1.
+#
+# Paths are written once (a comment never moves), so the cost is on insert: one extra
+# UPDATE for the path and one for the ancestors' reply_count.
+
+settings = get_settings()
+
+PATH_WIDTH = 10
+MAX_DEPTH = settings.comment_max_depth
+DEFAULT_THREADS = 20
+MAX_THREADS = 100
+DEFAULT_REPLIES = 3
+MAX_REPLIES = 50
+DEFAULT_PAGE = 50
+MAX_PAGE = 200
+
+
+def child_path(parent_path: Optional[str], comment_id: int) -> str:
+    segment = f"{comment_id:0{PATH_WIDTH}d}"
+    return f"{parent_path}/{segment}" if parent_path else segment
+
+
+def path_ids(path: str):
+    return [int(segment) for segment in path.split("/")]
+
+
+def subtree(post_id: int, path):
+    """The comment at `path` and all comments below it. `path` may be a column expression."""
+    return and_(
+        models.Comment.post_id == post_id,
+        models.Comment.path >= path,
+        models.Comment.path < path + "0",
+    )
+
+
+def add_replies(db: Session, ancestor_path: str, delta: int):
+    """Adds delta to reply_count on the comment at ancestor_path and every comment above it."""
+    db.execute(
+        update(models.Comment)
+        .where(models.Comment.id.in_(path_ids(ancestor_path)))
+        .values(reply_count=models.Comment.reply_count + delta),
+        execution_options={"synchronize_session": False},
+    )
+
+
+def get_threads(db: Session, post_id: int, before: Optional[int] = None,
+                limit: int = DEFAULT_THREADS, replies: int = DEFAULT_REPLIES):
+    """
+    The post's newest root comments (id < before), each with its first `replies` replies in
+    thread order. Returns ([(root, [reply, ...]), ...], next cursor or None).
+    """
+    limit = max(1, min(limit, MAX_THREADS))
+    replies = max(0, min(replies, MAX_REPLIES))
+    roots = select(models.Comment.id.label("root_id"), models.Comment.path.label("root_path")).where(
+        models.Comment.post_id == post_id, models.Comment.parent_id.is_(None)
+    )
+    if before is not None:
+        roots = roots.where(models.Comment.id < before)
+    # One extra root tells whether there is a next page
+    roots = roots.order_by(models.Comment.id.desc()).limit(limit + 1).cte("roots")
+    ranked = (
+        select(
+            models.Comment.id,
+            roots.c.root_id,
+            func.row_number().over(partition_by=roots.c.root_id, order_by=models.Comment.path).label("rank"),
+        )
+        .join(roots, subtree(post_id, roots.c.root_path))
+        .subquery()
+    )
+    stmt = (
+        select(models.Comment)
+        .join(ranked, models.Comment.id == ranked.c.id)
+        .where(ranked.c.rank <= replies + 1)
+        .options(joinedload(models.Comment.user))
+        .order_by(ranked.c.root_id.desc(), models.Comment.path)
+    )
+    threads = []
+    for comment in db.execute(stmt).scalars():
+        # The root sorts first in its thread
+        if comment.parent_id is None:
+            threads.append((comment, []))
+        else:
+            threads[-1][1].append(comment)
+    if len(threads) > limit:
+        threads = threads[:limit]
+        return threads, threads[-1][0].id
+    return threads, None
+
+
+def get_replies(db: Session, comment: models.Comment, after: Optional[int] = None, limit: int = DEFAULT_PAGE):
+    """
+    Everything below `comment` in thread order, a page at a time: `after` is the id of the
+    last reply already seen. Returns (replies, next cursor or None).
+    """
+    limit = max(1, min(limit, MAX_PAGE))
+    stmt = (
+        select(models.Comment)
+        .where(subtree(comment.post_id, comment.path), models.Comment.id != comment.id)
+        .options(joinedload(models.Comment.user))
+        .order_by(models.Comment.path)
+        .limit(limit + 1)
+    )
+    if after is not None:
+        stmt = stmt.where(
+            models.Comment.path > select(models.Comment.path).where(models.Comment.id == after).scalar_subquery()
+        )
+    rows = db.execute(stmt).scalars().all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, rows[-1].id
+    return rows, None
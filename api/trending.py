@@ -0,0 +1,144 @@
+import math
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload, selectinload
+
+from . import models
+from .settings import get_settings
+
+# Trending ("hot") score for posts.
+#
+# Every engagement event adds weight * 2^(-age / half_life) to a post's score. Instead of
+# decaying every row as time passes, we store
+#
+#     hot = log2(sum(weight * 2^((event_time - EPOCH) / half_life)))
+#
+# which orders posts exactly like the decayed score at any moment, so the feed is a plain
+# ORDER BY on an indexed column and an event only touches its own post's row. Keeping it in
+# log space means it never overflows. The decayed score at time t is 2^(hot - (t - EPOCH) / half_life).
+
+settings = get_settings()
+
+HALF_LIFE_HOURS = settings.trending_half_life_hours
+HALF_LIFE = HALF_LIFE_HOURS * 3600
+EPOCH = datetime(2025, 1, 1, tzinfo=timezone.utc).timestamp()
+
+POST_WEIGHT = 1.0
+BOOKMARK_WEIGHT = 2.0
+COMMENT_WEIGHT = 1.0
+
+# Rows whose decayed score falls below this are dropped by decay()
+MIN_SCORE = settings.trending_min_score
+DECAY_INTERVAL_SECONDS = settings.trending_decay_interval_seconds
+
+# Stored when every event of a post has been removed again
+NO_SCORE = -1e12
+
+
+def _timestamp(at: Optional[datetime]) -> float:
+    if at is None:
+        return datetime.now(timezone.utc).timestamp()
+    if at.tzinfo is None:
+        # SQLite hands back naive datetimes for server_default=func.now(), which is UTC
+        at = at.replace(tzinfo=timezone.utc)
+    return at.timestamp()
+
+
+def _exponent(weight: float, at: Optional[datetime]) -> float:
+    return math.log2(weight) + (_timestamp(at) - EPOCH) / HALF_LIFE
+
+
+def _log2_add(a: float, b: float) -> float:
+    high, low = max(a, b), min(a, b)
+    return high + math.log2(1 + 2 ** (low - high))
+
+
+def decayed_score(hot: float, now: Optional[datetime] = None) -> float:
+    return 2 ** (hot - (_timestamp(now) - EPOCH) / HALF_LIFE)
+
+
+def add_event(db: Session, post_id: int, weight: float, at: Optional[datetime] = None):
+    """Adds an engagement event to the post's score. Does not commit."""
+    if post_id is None:
+        return
+    x = _exponent(weight, at)
+    row = db.get(models.PostScore, post_id, with_for_update=True)
+    if row is not None:
+        row.hot = x if row.hot <= NO_SCORE else _log2_add(row.hot, x)
+        return
+    try:
+        # Another request may create the row for the same post concurrently
+        with db.begin_nested():
+            db.add(models.PostScore(post_id=post_id, hot=x))
+    except IntegrityError:
+        row = db.get(models.PostScore, post_id, with_for_update=True, populate_existing=True)
+        row.hot = _log2_add(row.hot, x)
+
+
+def remove_event(db: Session, post_id: int, weight: float, at: Optional[datetime] = None):
+    """Takes back an event added with add_event (same weight and time). Does not commit."""
+    if post_id is None:
+        return
+    row = db.get(models.PostScore, post_id, with_for_update=True)
+    if row is None:
+        return
+    x = _exponent(weight, at)
+    if x >= row.hot - 1e-9:
+        row.hot = NO_SCORE
+    else:
+        row.hot = row.hot + math.log2(1 - 2 ** (x - row.hot))
+
+
+def get_trending_posts(db: Session, skip: int = 0, limit: int = 20, category_id: Optional[int] = None):
+    query = db.query(models.Post).join(models.PostScore).options(
+        joinedload(models.Post.owner), joinedload(models.Post.category), selectinload(models.Post.bookmarks)
+    )
+    if category_id is not None:
+        query = query.filter(models.Post.category_id == category_id)
+    return query.order_by(models.PostScore.hot.desc()).offset(skip).limit(limit).all()
+
+
+def decay(db: Session, now: Optional[datetime] = None):
+    """
+    Periodic maintenance: drops scores that have decayed below MIN_SCORE.
+    Ordering never needs rewriting, so this only keeps the table and its index small.
+    """
+    cutoff = math.log2(MIN_SCORE) + (_timestamp(now) - EPOCH) / HALF_LIFE
+    removed = db.query(models.PostScore).filter(models.PostScore.hot < cutoff).delete(synchronize_session=False)
+    db.commit()
+    return removed
+
+
+def rebuild(db: Session):
+    """Recomputes every score from posts, bookmarks and comments. For backfills, not for serving."""
+    scores = {}
+
+    def add(post_id, weight, at):
+        x = _exponent(weight, at)
+        scores[post_id] = _log2_add(scores[post_id], x) if post_id in scores else x
+
+    for post_id, created_at in db.query(models.Post.id, models.Post.created_at):
+        add(post_id, POST_WEIGHT, created_at)
+    for post_id, created_at in db.query(models.Bookmark.post_id, models.Bookmark.created_at).filter(models.Bookmark.post_id.isnot(None)):
+        add(post_id, BOOKMARK_WEIGHT, created_at)
+    for post_id, created_at in db.query(models.Comment.post_id, models.Comment.created_at).filter(models.Comment.post_id.isnot(None)):
+        add(post_id, COMMENT_WEIGHT, created_at)
+
+    db.query(models.PostScore).delete(synchronize_session=False)
+    db.add_all(models.PostScore(post_id=post_id, hot=hot) for post_id, hot in scores.items())
+    db.commit()
+    decay(db)
+    return db.query(func.count(models.PostScore.post_id)).scalar()
+
+
+if __name__ == "__main__":
+    from .database import SessionLocal
+
+    session = SessionLocal()
+    try:
+        print(f"Rebuilt trending scores for {rebuild(session)} posts")
+    finally:
+        session.close()
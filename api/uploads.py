@@ -0,0 +1,188 @@
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import and_, delete, exists, or_, select
+from sqlalchemy.orm import Session
+
+from . import auth, crud, metrics, models, schemas, storage
+from .database import get_db
+from .services import services
+from .settings import get_settings
+
+# Direct-to-storage uploads: the API signs, the browser uploads, the API records the result.
+#
+#   1. POST /uploads/presign            -> a URL and form fields, valid for URL_TTL_SECONDS
+#   2. POST <url> with the fields + file   (straight to storage, not through the API)
+#   3. POST /uploads/{id}/complete       with storage's signed answer -> {"filename", "url"}
+#
+# DIRECT_UPLOAD_BACKEND picks the storage, "cloudinary" by default when its credentials are
+# set. "local" is the development stand-in in storage.py, which keeps the files on the API's
+# own disk, checks the form's signature and signs a receipt; it is only used when set
+# explicitly. With neither, /uploads/presign answers 503. "cloudinary" signs Cloudinary's own
+# direct upload parameters and checks the signature Cloudinary puts on its response.
+# Cloudinary enforces its own one-hour timestamp window and size limits (set them on the
+# account); max_bytes is only enforced by the local stand-in.
+#
+# prune_uploads() runs every PRUNE_INTERVAL_SECONDS and removes, with their stored files,
+# uploads that were never completed and completed uploads that no post, resource or club
+# image_url points to. Both get PRUNE_GRACE_HOURS first (after the form expired, after
+# completion), so an upload on its way into a post isn't taken from under it.
+
+settings = get_settings()
+
+BACKEND = settings.direct_upload_backend
+LOCAL_STORAGE_URL = settings.local_storage_url
+URL_TTL_SECONDS = settings.upload_url_ttl_seconds
+MAX_BYTES = settings.upload_max_bytes
+PRUNE_GRACE_HOURS = settings.upload_prune_grace_hours
+PRUNE_INTERVAL_SECONDS = settings.upload_prune_interval_seconds
+PRUNE_BATCH_SIZE = 200
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".gif", ".webp"}
+
+router = APIRouter(prefix="/uploads", tags=["uploads"])
+
+
+def _local_form(key: str, content_type: str, expires: int):
+    fields = {"key": key, "content_type": content_type, "max_bytes": str(MAX_BYTES), "expires": str(expires)}
+    fields["signature"] = storage.sign_policy(key, content_type, MAX_BYTES, expires)
+    return LOCAL_STORAGE_URL, fields
+
+
+def _cloudinary_form(key: str, content_type: str, expires: int):
+    import cloudinary.utils
+
+    settings = get_settings()
+    params = {"public_id": Path(key).stem, "timestamp": int(time.time())}
+    fields = {name: str(value) for name, value in params.items()}
+    fields["api_key"] = settings.cloudinary_api_key
+    fields["signature"] = cloudinary.utils.api_sign_request(params, settings.cloudinary_api_secret)
+    return f"https://api.cloudinary.com/v1_1/{settings.cloudinary_cloud_name}/image/upload", fields
+
+
+def _verify_local(db_upload: models.Upload, receipt: schemas.UploadReceipt):
+    if (
+        receipt.key != db_upload.key or receipt.size is None or receipt.sha256 is None
+        or not storage.verify_receipt(receipt.key, receipt.size, receipt.sha256, receipt.signature)
+    ):
+        raise HTTPException(status_code=400, detail="Invalid upload receipt")
+    return f"/static/uploads/{db_upload.key}", receipt.size
+
+
+def _verify_cloudinary(db_upload: models.Upload, receipt: schemas.UploadReceipt):
+    import cloudinary.utils
+
+    services.init_cloudinary()
+    if (
+        receipt.public_id != Path(db_upload.key).stem or receipt.version is None
+        or not cloudinary.utils.verify_api_response_signature(receipt.public_id, receipt.version, receipt.signature)
+    ):
+        raise HTTPException(status_code=400, detail="Invalid upload receipt")
+    url, _ = cloudinary.utils.cloudinary_url(
+        receipt.public_id, version=receipt.version, format=receipt.format, secure=True
+    )
+    return url, receipt.bytes
+
+
+def _remove_object(db_upload: models.Upload):
+    if db_upload.backend == "local":
+        (storage.UPLOAD_DIR / db_upload.key).unlink(missing_ok=True)
+        return
+    import cloudinary.uploader
+
+    services.init_cloudinary()
+    # "not found" for a pending upload the browser never sent is fine too
+    cloudinary.uploader.destroy(Path(db_upload.key).stem)
+
+
+def prune_uploads(db: Session) -> int:
+    """Removes abandoned and unused uploads, files first; returns how many were removed."""
+    cutoff = datetime.utcnow() - timedelta(hours=PRUNE_GRACE_HOURS)
+    used = or_(*(
+        exists().where(model.image_url == models.Upload.url)
+        for model in (models.Post, models.Resource, models.Club)
+    ))
+    unused = or_(
+        and_(models.Upload.status == "pending", models.Upload.expires_at < cutoff),
+        and_(models.Upload.status == "complete", models.Upload.completed_at < cutoff, ~used),
+    )
+    removed = 0
+    last_id = 0
+    while True:
+        batch = db.scalars(
+            select(models.Upload).where(unused, models.Upload.id > last_id).order_by(models.Upload.id).limit(PRUNE_BATCH_SIZE)
+        ).all()
+        if not batch:
+            break
+        last_id = batch[-1].id
+        gone = []
+        for db_upload in batch:
+            try:
+                _remove_object(db_upload)
+            except Exception as e:
+                # Kept, so the next run tries again
+                print(f"WARNING: could not remove upload {db_upload.key}: {e}")
+                continue
+            gone.append(db_upload.id)
+        if gone:
+            db.execute(delete(models.Upload).where(models.Upload.id.in_(gone)))
+            db.commit()
+            removed += len(gone)
+    if removed:
+        metrics.increment("uploads_pruned", removed)
+    return removed
+
+
+FORMS = {"local": _local_form, "cloudinary": _cloudinary_form}
+VERIFIERS = {"local": _verify_local, "cloudinary": _verify_cloudinary}
+
+
+@router.post("/presign", response_model=schemas.PresignedUpload)
+def presign_upload(
+    request: schemas.PresignRequest,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user),
+):
+    if BACKEND is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Uploads are not configured: set the Cloudinary credentials (or DIRECT_UPLOAD_BACKEND=local in development)",
+        )
+    suffix = Path(request.filename).suffix.lower()
+    if suffix not in IMAGE_SUFFIXES or not request.content_type.startswith("image/"):
+        raise HTTPException(status_code=400, detail=f"Only images can be uploaded ({', '.join(sorted(IMAGE_SUFFIXES))})")
+    if request.size is not None and request.size > MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"File is larger than {MAX_BYTES} bytes")
+
+    key = f"{uuid.uuid4()}{suffix}"
+    expires = int(time.time()) + URL_TTL_SECONDS
+    expires_at = datetime.utcfromtimestamp(expires)
+    db_upload = crud.create_upload(db, current_user.id, key, request.content_type, BACKEND, expires_at)
+    url, fields = FORMS[BACKEND](key, request.content_type, expires)
+    metrics.increment("uploads_presigned", backend=BACKEND)
+    return {
+        "upload_id": db_upload.id,
+        "url": url,
+        "fields": fields,
+        "expires_at": expires_at,
+        "max_bytes": MAX_BYTES,
+    }
+
+
+@router.post("/{upload_id}/complete", response_model=schemas.UploadResult)
+def complete_upload(
+    upload_id: int,
+    receipt: schemas.UploadReceipt,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user),
+):
+    db_upload = crud.get_upload(db, upload_id)
+    if db_upload is None or db_upload.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    if db_upload.status != "complete":
+        url, size = VERIFIERS[db_upload.backend](db_upload, receipt)
+        db_upload = crud.complete_upload(db, db_upload, url=url, size=size)
+        metrics.increment("uploads_completed", backend=db_upload.backend)
+    return {"filename": db_upload.key, "url": db_upload.url}
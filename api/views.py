@@ -0,0 +1,122 @@
+import re
+import threading
+from collections import Counter
+
+from sqlalchemy import case, update
+from sqlalchemy.orm import Session
+
+from . import coalesce, entities, metrics, models
+from .settings import get_settings
+
+# View counts for posts, resources and clubs.
+#
+# A detail read must not become a write, so a view only adds to an in-memory counter. The
+# counters are split in SHARDS, each with its own lock and picked by thread, so request
+# threads don't queue up behind one lock. Every FLUSH_INTERVAL_SECONDS flush() swaps the
+# shards out and adds the totals with one UPDATE per kind (... SET view_count = view_count +
+# CASE id WHEN ... END), whatever the number of views in between.
+#
+# A crash loses at most the views since the last flush; shutdown flushes what's left. A
+# failed flush puts its counts back for the next one. Until a view is flushed, pending()
+# lets this worker's own responses include it. Views don't touch updated_at or change_seq,
+# so they don't show up in /changes, and they are added to cached snapshots in place
+# (entities.add_views) rather than evicting them.
+
+settings = get_settings()
+
+SHARDS = settings.view_counter_shards
+FLUSH_INTERVAL_SECONDS = settings.view_flush_interval_seconds
+# Ids per UPDATE; keeps the CASE and the IN list well under SQLite's parameter limit
+FLUSH_BATCH_SIZE = 400
+
+MODELS = {"post": models.Post, "resource": models.Resource, "club": models.Club}
+
+
+class _Shard:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = Counter()
+
+
+_shards = [_Shard() for _ in range(SHARDS)]
+
+
+def record(kind: str, row_id: int, count: int = 1):
+    shard = _shards[threading.get_ident() % SHARDS]
+    with shard.lock:
+        shard.counts[(kind, row_id)] += count
+
+
+def pending(kind: str, row_id: int) -> int:
+    total = 0
+    for shard in _shards:
+        with shard.lock:
+            total += shard.counts.get((kind, row_id), 0)
+    return total
+
+
+def _take():
+    totals = Counter()
+    for shard in _shards:
+        with shard.lock:
+            counts, shard.counts = shard.counts, Counter()
+        totals.update(counts)
+    return totals
+
+
+def _restore(totals: Counter):
+    shard = _shards[0]
+    with shard.lock:
+        shard.counts.update(totals)
+
+
+def flush(db: Session) -> int:
+    """Writes the pending views; returns how many were written."""
+    totals = _take()
+    if not totals:
+        return 0
+    by_kind = {}
+    for (kind, row_id), count in totals.items():
+        by_kind.setdefault(kind, {})[row_id] = count
+    entities.begin_views(by_kind)
+    try:
+        for kind, deltas in by_kind.items():
+            model = MODELS[kind]
+            ids = sorted(deltas)
+            for start in range(0, len(ids), FLUSH_BATCH_SIZE):
+                chunk = {row_id: deltas[row_id] for row_id in ids[start:start + FLUSH_BATCH_SIZE]}
+                db.execute(
+                    update(model)
+                    .where(model.id.in_(chunk))
+                    # updated_at and change_seq set to themselves, so onupdate doesn't move the row in /changes
+                    .values(
+                        view_count=model.view_count + case(chunk, value=model.id, else_=0),
+                        updated_at=model.updated_at, change_seq=model.change_seq,
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+        db.commit()
+    except Exception:
+        db.rollback()
+        _restore(totals)
+        for kind in by_kind:
+            entities.add_views(kind, {})
+        raise
+    for kind, deltas in by_kind.items():
+        entities.add_views(kind, deltas)
+    written = sum(totals.values())
+    metrics.increment("views_flushed", written)
+    return written
+
+
+_POST_PATH = re.compile(r"^/posts/(\d+)/?$")
+
+
+def _count_replayed_view(path: str, status: int):
+    # Coalesced followers never reach read_post, but each one is still a view
+    match = _POST_PATH.match(path)
+    if match and status == 200:
+        record("post", int(match.group(1)))
+
+
+coalesce.on_replay("/posts/{post_id}", _count_replayed_view)
@@ -0,0 +1,110 @@
+import os
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import joinedload, sessionmaker
+
+# api.database refuses to import without a URL; the benchmark uses its own engine below
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from api import crud, models
+
+# Compares the hot read paths in api.crud (select() + lambda_stmt, Session.get) with the
+# legacy Query versions they replaced, against a seeded SQLite file. Each call runs in a
+# fresh session, like a request does, so the identity map never answers for free.
+
+ROUNDS = 2000
+POSTS = 2000
+
+
+def legacy_get_post(db, post_id):
+    return db.query(models.Post).filter(models.Post.id == post_id).first()
+
+
+def legacy_get_user_by_email(db, email):
+    return db.query(models.User).filter(models.User.email == email).first()
+
+
+def legacy_get_posts(db, skip=0, limit=100, search=None, sort=None):
+    query = db.query(models.Post).options(joinedload(models.Post.owner), joinedload(models.Post.category))
+    if search is not None:
+        query = query.filter(models.Post.title.ilike(f"%{search}%"))
+    if sort is not None:
+        query = query.order_by(crud.POST_SORTS[sort], models.Post.id.desc())
+    return query.offset(skip).limit(limit).all()
+
+
+def legacy_get_comments_by_post(db, post_id):
+    return db.query(models.Comment).filter(
+        models.Comment.post_id == post_id
+    ).options(joinedload(models.Comment.user)).order_by(models.Comment.created_at.desc()).all()
+
+
+CASES = [
+    ("get_post", legacy_get_post, crud.get_post, lambda i: (i % POSTS + 1,)),
+    ("get_user_by_email", legacy_get_user_by_email, crud.get_user_by_email, lambda i: (f"user{i % 50}@example.com",)),
+    ("get_posts page", lambda db, i: legacy_get_posts(db, skip=i % 10 * 20, limit=20),
+        lambda db, i: crud.get_posts(db, skip=i % 10 * 20, limit=20), lambda i: (i,)),
+    ("get_posts search+sort", lambda db, i: legacy_get_posts(db, limit=20, search=f"post {i % 9}", sort="comments"),
+        lambda db, i: crud.get_posts(db, limit=20, search=f"post {i % 9}", sort="comments"), lambda i: (i,)),
+    ("get_comments_by_post", legacy_get_comments_by_post, crud.get_comments_by_post, lambda i: (i % 100 + 1,)),
+]
+
+
+def seed(Session):
+    db = Session()
+    users = [models.User(email=f"user{n}@example.com", hashed_password="x", is_active=True) for n in range(50)]
+    db.add_all(users)
+    category = models.PostCategory(name="general")
+    db.add(category)
+    db.flush()
+    posts = [
+        models.Post(title=f"post {n}", content="lorem ipsum " * 40, owner_id=users[n % 50].id, category_id=category.id)
+        for n in range(POSTS)
+    ]
+    db.add_all(posts)
+    db.flush()
+    db.add_all(
+        models.Comment(content=f"comment {n}", post_id=posts[n % 100].id, user_id=users[n % 50].id)
+        for n in range(1000)
+    )
+    db.commit()
+    db.close()
+
+
+def timed(Session, fn, args_for):
+    samples = []
+    for i in range(ROUNDS):
+        db = Session()
+        started = time.perf_counter()
+        fn(db, *args_for(i))
+        samples.append(time.perf_counter() - started)
+        db.close()
+    return statistics.median(samples) * 1e6
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+        models.Base.metadata.create_all(engine)
+        Session = sessionmaker(bind=engine)
+        seed(Session)
+
+        print(f"{POSTS} posts, {ROUNDS} calls per case, median per call\n")
+        print(f"{'':24} {'Query':>10} {'select':>10}")
+        for name, legacy, current, args_for in CASES:
+            # Untimed call first so both sides start with warm statement caches
+            for fn in (legacy, current):
+                db = Session()
+                fn(db, *args_for(0))
+                db.close()
+            timed_legacy = timed(Session, legacy, args_for)
+            timed_current = timed(Session, current, args_for)
+            print(f"{name:24} {timed_legacy:8.0f}us {timed_current:8.0f}us  {timed_legacy / timed_current:4.2f}x")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import statistics
+import time
+from pathlib import Path
+
+from fastapi import FastAPI
+from fastapi.staticfiles import StaticFiles
+from fastapi.testclient import TestClient
+
+from api import media
+from api.settings import BASE_DIR
+
+# Compares the old plain StaticFiles mount with api.media for a browser that already has the
+# image: cold fetch, revalidation and a 64 KiB range. Runs in-process, so it measures the
+# framework's work per request, not the network.
+
+ROUNDS = 300
+
+
+def build_clients():
+    mount_app = FastAPI()
+    mount_app.mount("/static", StaticFiles(directory=str(BASE_DIR / "static")), name="static")
+
+    media_app = FastAPI()
+    media_app.include_router(media.router)
+    return {"StaticFiles mount": TestClient(mount_app), "api.media": TestClient(media_app)}
+
+
+def timed(client, url, headers=None):
+    samples = []
+    response = None
+    for _ in range(ROUNDS):
+        started = time.perf_counter()
+        response = client.get(url, headers=headers or {})
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1e6, response
+
+
+def main():
+    image = max(media.UPLOAD_DIR.iterdir(), key=lambda p: p.stat().st_size)
+    url = f"/static/uploads/{image.name}"
+    print(f"{image.name}: {image.stat().st_size} bytes, {ROUNDS} rounds, median per request\n")
+
+    for name, client in build_clients().items():
+        full_us, response = timed(client, url)
+        etag = response.headers.get("etag")
+        revalidate_us, revalidated = timed(client, url, {"if-none-match": etag})
+        range_us, ranged = timed(client, url, {"range": "bytes=0-65535"})
+        print(name)
+        print(f"  Cache-Control      {response.headers.get('cache-control', '(none)')}")
+        print(f"  full fetch         {full_us:8.0f} us  {len(response.content)} bytes")
+        print(f"  revalidation       {revalidate_us:8.0f} us  status {revalidated.status_code}, {len(revalidated.content)} bytes")
+        print(f"  64 KiB range       {range_us:8.0f} us  status {ranged.status_code}, {len(ranged.content)} bytes")
+        print()
+    print("With an immutable Cache-Control a browser never sends the revalidation request at all;")
+    print("without one it pays that round trip for every image on every page view.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import os
+import sys
+import tempfile
+
+# Runs the read routes against a seeded scratch SQLite database and fails when one issues
+# more SQL statements than its budget. Seeded with enough rows that an N+1 shows up as a
+# number well over budget rather than a near miss.
+#
+#   python check_query_budgets.py
+
+scratch = tempfile.mkdtemp(prefix="query-budgets-")
+os.environ["DATABASE_URL"] = f"sqlite:///{scratch}/budgets.db"
+os.environ.setdefault("JWT_SECRET_KEY", "query-budgets-secret")
+os.environ["WORKER_BUS_DIR"] = ""
+os.environ["RELATED_SNAPSHOT_PATH"] = os.path.join(scratch, "related.npz")
+os.environ["SIGNUP_IP_LIMIT"] = "1000/60"
+os.environ["SQL_REPEAT_THRESHOLD"] = "1000"
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from api import sql_stats  # noqa: E402
+from api.main import app  # noqa: E402
+
+POSTS = 25
+PASSWORD = "query-budgets-pw"
+
+# (path, max statements). Includes the current user lookup for authenticated routes.
+BUDGETS = [
+    ("/posts/", 3),
+    ("/posts/?sort=comments&search=post", 3),
+    ("/posts/trending", 3),
+    ("/posts/1", 4),
+    ("/posts/1/comments/", 3),
+    ("/posts/1/related", 4),
+    ("/posts/facets", 1),
+    ("/users/me", 6),
+    ("/users/1", 5),
+    ("/bookmarks/", 4),
+    ("/resources/", 2),
+    ("/clubs/", 2),
+    ("/post-categories/", 1),
+    ("/bootstrap/blog", 5),
+    ("/bootstrap/resources", 2),
+    ("/bootstrap/clubs", 2),
+    ("/changes", 6),
+    ("/users/me/notifications", 2),
+    ("/posts/1/comments/threads", 2),
+    ("/comments/1/replies", 2),
+]
+
+
+def seed(client):
+    headers = []
+    for n in range(3):
+        email = f"budget{n}@example.com"
+        client.post("/users/", json={"email": email, "password": PASSWORD}).raise_for_status()
+        token = client.post("/auth/token", data={"username": email, "password": PASSWORD}).json()["access_token"]
+        headers.append({"Authorization": f"Bearer {token}"})
+    category = client.post("/post-categories/", json={"name": "general"}, headers=headers[0]).json()
+    for n in range(POSTS):
+        author = headers[n % 3]
+        post = client.post(
+            "/posts/", json={"title": f"post {n}", "content": "budget check", "category_id": category["id"]}, headers=author
+        ).json()
+        for reader in headers:
+            client.post("/bookmarks/", json={"post_id": post["id"]}, headers=reader)
+            client.post("/posts/1/comments/", json={"content": f"comment on {n}", "post_id": post["id"]}, headers=reader)
+    return headers[0]
+
+
+def main():
+    failures = 0
+    with TestClient(app) as client:
+        headers = seed(client)
+        width = max(len(path) for path, _ in BUDGETS)
+        for path, budget in BUDGETS:
+            try:
+                with sql_stats.query_budget(budget) as stats:
+                    response = client.get(path, headers=headers)
+                    response.raise_for_status()
+                print(f"ok    {path:<{width}}  {stats.count}/{budget}")
+            except sql_stats.QueryBudgetExceeded as e:
+                failures += 1
+                print(f"FAIL  {path:<{width}}  {e}")
+    print(f"{len(BUDGETS) - failures} of {len(BUDGETS)} routes within budget")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
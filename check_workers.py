@@ -0,0 +1,155 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import httpx
+
+# Starts the app with N workers on a scratch SQLite database and checks that the in-process
+# caches (suggest index, facet counts, post detail snapshots, the /bootstrap/blog categories
+# section) never answer with data older than a write that already returned. Every read opens
+# a new connection so reads spread over the workers.
+#
+#   python check_workers.py --workers 4 --rounds 30
+#   python check_workers.py --no-bus    same without the bus, to see what it catches
+#
+# Exits 1 when any read was stale or any worker dropped a bus message.
+
+PASSWORD = "check-workers-pw"
+
+
+def wait_for_workers(base_url: str, workers: int, timeout: float):
+    deadline = time.monotonic() + timeout
+    seen = {}
+    while time.monotonic() < deadline:
+        try:
+            stats = fresh_get(base_url, "/metrics/caches").json()
+            seen[stats["pid"]] = stats
+            if len(seen) >= workers:
+                return seen
+        except httpx.TransportError:
+            pass
+        time.sleep(0.05)
+    raise SystemExit(f"only {len(seen)} of {workers} workers answered within {timeout:.0f}s")
+
+
+def fresh_get(base_url: str, path: str, **kwargs):
+    # No keep-alive: each request is a new connection the kernel may hand to any worker
+    return httpx.get(base_url + path, headers={"Connection": "close"}, timeout=10, **kwargs)
+
+
+def login(client: httpx.Client):
+    email = f"check-{uuid.uuid4().hex[:8]}@example.com"
+    client.post("/users/", json={"email": email, "password": PASSWORD}).raise_for_status()
+    response = client.post("/auth/token", data={"username": email, "password": PASSWORD})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def suggested_ids(base_url: str, query: str):
+    return {s["id"] for s in fresh_get(base_url, "/suggest", params={"q": query, "type": "post"}).json()}
+
+
+def post_title(base_url: str, post_id: int):
+    return fresh_get(base_url, f"/posts/{post_id}").json()["title"]
+
+
+def blog_bootstrap(base_url: str):
+    page = fresh_get(base_url, "/bootstrap/blog").json()
+    titles = {post["id"]: post["title"] for post in page["posts"]}
+    return titles, page["total"], {category["name"] for category in page["categories"]}
+
+
+def run_checks(base_url: str, rounds: int, reads: int):
+    stale = []
+    client = httpx.Client(base_url=base_url, timeout=10)
+    headers = login(client)
+    expected_total = fresh_get(base_url, "/posts/facets").json()["total"]
+
+    for n in range(rounds):
+        word = f"zq{uuid.uuid4().hex[:10]}"
+        category = f"check {word}"
+        client.post("/post-categories/", json={"name": category}, headers=headers).raise_for_status()
+        post = client.post("/posts/", json={"title": f"{word} round {n}", "content": "check"}, headers=headers)
+        post.raise_for_status()
+        post_id = post.json()["id"]
+        expected_total += 1
+        for _ in range(reads):
+            if post_id not in suggested_ids(base_url, word):
+                stale.append(f"round {n}: /suggest missed new post {post_id}")
+            total = fresh_get(base_url, "/posts/facets").json()["total"]
+            if total != expected_total:
+                stale.append(f"round {n}: /posts/facets total {total}, expected {expected_total}")
+            # Also puts the post in the workers' entity caches, so the PUT below has something to invalidate
+            post_title(base_url, post_id)
+            titles, total, categories = blog_bootstrap(base_url)
+            if post_id not in titles or total != expected_total:
+                stale.append(f"round {n}: /bootstrap/blog missed new post {post_id} (total {total})")
+            if category not in categories:
+                stale.append(f"round {n}: /bootstrap/blog missed new category {category!r}")
+
+        renamed = f"zr{uuid.uuid4().hex[:10]}"
+        client.put(f"/posts/{post_id}", json={"title": renamed, "content": "check"}, headers=headers).raise_for_status()
+        for _ in range(reads):
+            if post_id in suggested_ids(base_url, word):
+                stale.append(f"round {n}: /suggest still has the old title of post {post_id}")
+            if post_id not in suggested_ids(base_url, renamed):
+                stale.append(f"round {n}: /suggest missed the new title of post {post_id}")
+            if post_title(base_url, post_id) != renamed:
+                stale.append(f"round {n}: /posts/{post_id} still has the old title")
+            if blog_bootstrap(base_url)[0].get(post_id) != renamed:
+                stale.append(f"round {n}: /bootstrap/blog still has the old title of post {post_id}")
+    client.close()
+    return stale
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--reads", type=int, default=8, help="reads per write")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--no-bus", action="store_true", help="run the workers without the invalidation bus")
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix="check-workers-")
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{scratch}/check.db",
+        "JWT_SECRET_KEY": os.getenv("JWT_SECRET_KEY", "check-workers-secret"),
+        "WORKER_BUS_DIR": "" if args.no_bus else os.path.join(scratch, "bus"),
+        "RELATED_SNAPSHOT_PATH": os.path.join(scratch, "related.npz"),
+        "SIGNUP_IP_LIMIT": "1000/60",
+        "LOGIN_IP_LIMIT": "1000/60",
+    }
+    server = subprocess.Popen(
+        [sys.executable, "-m", "api", "--workers", str(args.workers), "--port", str(args.port)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        workers = wait_for_workers(base_url, args.workers, timeout=60)
+        print(f"{len(workers)} workers up: {sorted(workers)}")
+        stale = run_checks(base_url, args.rounds, args.reads)
+        received, dropped = {}, {}
+        for pid, stats in wait_for_workers(base_url, args.workers, timeout=10).items():
+            received[pid] = sum(c["received"] for c in stats["caches"].values())
+            dropped[pid] = stats["bus_dropped"]
+        print(f"invalidations received per worker: {received}")
+        print(f"bus messages dropped per worker: {dropped}")
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    reads = args.rounds * args.reads * 8
+    print(f"{reads} reads after {args.rounds * 3} writes, {len(stale)} stale")
+    for line in stale[:20]:
+        print("  " + line)
+    return 1 if stale or any(dropped.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,15 +6,53 @@ const api = axios.create({
   baseURL: import.meta.env.VITE_API_URL || '/api', // Your backend API base URL
 });
 
+const clearTokens = () => {
+  localStorage.removeItem('access_token');
+  localStorage.removeItem('token_type');
+  localStorage.removeItem('refresh_token');
+};
+
+// Shared between concurrent 401s so a refresh token is only ever used once
+let refreshPromise: Promise<string> | null = null;
+
+const refreshAccessToken = (): Promise<string> => {
+  if (!refreshPromise) {
+    const refreshToken = localStorage.getItem('refresh_token');
+    refreshPromise = (refreshToken
+      ? api.post('/auth/refresh', { refresh_token: refreshToken }).then((response) => {
+          localStorage.setItem('access_token', response.data.access_token);
+          localStorage.setItem('token_type', response.data.token_type);
+          localStorage.setItem('refresh_token', response.data.refresh_token);
+          return response.data.access_token as string;
+        })
+      : Promise.reject(new Error('No refresh token'))
+    ).finally(() => {
+      refreshPromise = null;
+    });
+  }
+  return refreshPromise;
+};
+
 api.interceptors.response.use(
   (response) => response,
-  (error) => {
+  async (error) => {
+    const original = error.config;
     if (error.response && error.response.status === 401) {
+      // Try a silent refresh once before sending the user back to the login page
+      if (original && !original._retried && !original.url?.startsWith('/auth/')) {
+        original._retried = true;
+        try {
+          const accessToken = await refreshAccessToken();
+          original.headers = { ...original.headers, Authorization: `Bearer ${accessToken}` };
+          return api(original);
+        } catch {
+          // fall through to the logout below
+        }
+      }
       // Unauthorized, token might be expired or invalid
-      localStorage.removeItem('access_token');
-      localStorage.removeItem('token_type');
+      clearTokens();
       // Redirect to login page
-      window.location.href = '/login'; 
+      window.location.href = '/login';
     }
     return Promise.reject(error);
   }
@@ -46,6 +46,7 @@ const AuthCallBack = () => {
           // Store the token in localStorage
           localStorage.setItem('access_token', response.data.access_token)
           localStorage.setItem('token_type', response.data.token_type)
+          localStorage.setItem('refresh_token', response.data.refresh_token)
           
           console.log('Authentication successful')
           
@@ -95,6 +96,7 @@ const AuthCallBack = () => {
         <button onClick={() => {
           localStorage.removeItem('access_token')
           localStorage.removeItem('token_type')
+          localStorage.removeItem('refresh_token')
           navigate('/')
         }}>
           Go Home
@@ -103,6 +105,7 @@ const AuthCallBack = () => {
         <button onClick={() => {
           localStorage.removeItem('access_token')
           localStorage.removeItem('token_type')
+          localStorage.removeItem('refresh_token')
           window.location.href = `${import.meta.env.VITE_API_URL || 'http://localhost:8000'}/auth/google/login`
         }} style={{ marginTop: '10px' }}>
           Try Login Again
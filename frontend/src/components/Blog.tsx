@@ -115,7 +115,7 @@ const Blog = () => {
         { content: commentText, post_id: selectedPost.id },
         { headers: { Authorization: `Bearer ${token}` } }
       );
-      setComments([response.data, ...comments]);
+      setComments(prev => prev.some(c => c.id === response.data.id) ? prev : [response.data, ...prev]);
       setCommentText('');
     } catch (error) {
       console.error("Error posting comment:", error);
@@ -138,6 +138,23 @@ const Blog = () => {
     }
   };
 
+  // Live comment updates for the open post instead of refetching the whole list
+  useEffect(() => {
+    if (!selectedPost) return;
+
+    const source = new EventSource(`${api.defaults.baseURL}/posts/${selectedPost.id}/comments/stream`);
+    source.addEventListener('comment_created', (event) => {
+      const comment: Comment = JSON.parse((event as MessageEvent).data);
+      setComments(prev => prev.some(c => c.id === comment.id) ? prev : [comment, ...prev]);
+    });
+    source.addEventListener('comment_deleted', (event) => {
+      const { id } = JSON.parse((event as MessageEvent).data);
+      setComments(prev => prev.filter(c => c.id !== id));
+    });
+
+    return () => source.close();
+  }, [selectedPost]);
+
   useEffect(() => {
     if (!isDateFilterOpen) return;
 
@@ -157,7 +174,7 @@ const Blog = () => {
     const token = localStorage.getItem('access_token');
     setIsLoggedIn(!!token);
 
-    let postsUrl = `/posts/`;
+    let bootstrapUrl = `/bootstrap/blog`;
     const params = new URLSearchParams();
     if (selectedCategory !== null) {
       params.append('category_id', selectedCategory.toString());
@@ -172,22 +189,15 @@ const Blog = () => {
       params.append('search', searchTerm);
     }
     if (params.toString()) {
-      postsUrl += `?${params.toString()}`;
+      bootstrapUrl += `?${params.toString()}`;
     }
 
-    const fetchPosts = api.get(postsUrl);
-    const fetchBookmarks = token ? api.get('/bookmarks/', {
-      headers: {
-        Authorization: `Bearer ${token}`
-      }
-    }) : Promise.resolve({ data: [] });
-    const fetchCategories = api.get('/post-categories/');
-
-    Promise.all([fetchPosts, fetchBookmarks, fetchCategories])
-      .then(([postsResponse, bookmarksResponse, categoriesResponse]) => {
-        let fetchedPosts: Post[] = postsResponse.data;
-        const fetchedBookmarks: Bookmark[] = bookmarksResponse.data;
-        const fetchedCategories: Category[] = categoriesResponse.data;
+    // Posts, categories and the viewer's bookmarks in one request
+    api.get(bootstrapUrl, token ? { headers: { Authorization: `Bearer ${token}` } } : {})
+      .then((response) => {
+        let fetchedPosts: Post[] = response.data.posts;
+        const fetchedBookmarks: Bookmark[] = response.data.bookmarks;
+        const fetchedCategories: Category[] = response.data.categories;
 
         setUserBookmarks(fetchedBookmarks);
         setCategories(fetchedCategories);
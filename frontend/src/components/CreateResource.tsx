@@ -1,5 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
+import { uploadImage } from '../utils';
 
 interface Category {
     id: number;
@@ -65,27 +66,11 @@ const CreateResource: React.FC = () => {
 
         // If a file is selected, upload it first
         if (selectedFile) {
-            const formData = new FormData();
-            formData.append('file', selectedFile);
-
             try {
-                const uploadResponse = await fetch(`${import.meta.env.VITE_API_URL || 'http://localhost:8000'}/uploadfile/`, {
-                    method: 'POST',
-                    body: formData,
-                });
-
-                if (uploadResponse.ok) {
-                    const uploadData = await uploadResponse.json();
-                    imageUrl = uploadData.url;
-                } else {
-                    const uploadErrorData = await uploadResponse.json();
-                    alert(`Error uploading image: ${uploadErrorData.detail || 'Unknown error'}`);
-                    setIsSubmitting(false);
-                    return;
-                }
+                imageUrl = await uploadImage(selectedFile, token);
             } catch (error) {
                 console.error('Failed to upload image:', error);
-                alert('Failed to upload image. See console for details.');
+                alert(`Error uploading image: ${(error as Error).message}`);
                 setIsSubmitting(false);
                 return;
             }
@@ -1,7 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { useNavigate, useParams } from 'react-router-dom';
 import api from '../api';
-import { getImageUrl } from "../utils";
+import { getImageUrl, uploadImage } from "../utils";
  
 
 interface Category {
@@ -85,26 +85,11 @@ const EditPost: React.FC = () => {
         let imageUrlToSave: string | null = currentImageUrl;
 
         if (selectedFile) {
-            const formData = new FormData();
-            formData.append('file', selectedFile);
-
             try {
-                const uploadResponse = await fetch(`${import.meta.env.VITE_API_URL || 'http://localhost:8000'}/uploadfile/`, {
-                    method: 'POST',
-                    body: formData,
-                });
-
-                if (uploadResponse.ok) {
-                    const uploadData = await uploadResponse.json();
-                    imageUrlToSave = uploadData.url;
-                } else {
-                    const errorData = await uploadResponse.json();
-                    alert(`Error uploading new image: ${errorData.detail || 'Unknown error'}`);
-                    return;
-                }
+                imageUrlToSave = await uploadImage(selectedFile, token);
             } catch (error) {
                 console.error('Failed to upload new image:', error);
-                alert('Failed to upload new image. See console for details.');
+                alert(`Error uploading new image: ${(error as Error).message}`);
                 return;
             }
         }
@@ -32,6 +32,7 @@ const Login = () => {
       
       localStorage.setItem("access_token", response.data.access_token);
       localStorage.setItem("token_type", response.data.token_type);
+      localStorage.setItem("refresh_token", response.data.refresh_token);
       setMessage("Login successful!");
       navigate("/");
       window.location.reload();
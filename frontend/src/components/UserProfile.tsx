@@ -149,8 +149,13 @@ const UserProfile = () => {
   };
 
   const handleLogout = () => {
+    const refreshToken = localStorage.getItem("refresh_token");
+    if (refreshToken) {
+      api.post("/auth/logout", { refresh_token: refreshToken }).catch(() => {});
+    }
     localStorage.removeItem("access_token");
     localStorage.removeItem("token_type");
+    localStorage.removeItem("refresh_token");
     window.dispatchEvent(new Event("logoutEvent"));
     navigate("/login");
   };
@@ -80,7 +80,7 @@ const Clubs = () => {
     const token = localStorage.getItem('access_token');
     setIsLoggedIn(!!token);
 
-    let clubsUrl = `/clubs/`;
+    let clubsUrl = `/bootstrap/clubs`;
     const params = new URLSearchParams();
     if (selectedCategory !== null) {
       params.append('category_id', selectedCategory.toString());
@@ -98,13 +98,11 @@ const Clubs = () => {
       clubsUrl += `?${params.toString()}`;
     }
 
-    const fetchClubs = api.get(clubsUrl);
-    const fetchCategories = api.get('/club-categories/');
-
-    Promise.all([fetchClubs, fetchCategories])
-      .then(([clubsResponse, categoriesResponse]) => {
-        let fetchedClubs: Club[] = clubsResponse.data;
-        const fetchedCategories: Category[] = categoriesResponse.data;
+    // List and categories in one request
+    api.get(clubsUrl)
+      .then((response) => {
+        let fetchedClubs: Club[] = response.data.clubs;
+        const fetchedCategories: Category[] = response.data.categories;
 
         setCategories(fetchedCategories);
 
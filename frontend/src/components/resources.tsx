@@ -83,7 +83,7 @@ const Resources = () => {
     const token = localStorage.getItem('access_token');
     setIsLoggedIn(!!token);
 
-    let resourcesUrl = `/resources/`;
+    let resourcesUrl = `/bootstrap/resources`;
     const params = new URLSearchParams();
     if (selectedCategory !== null) {
       params.append('category_id', selectedCategory.toString());
@@ -101,13 +101,11 @@ const Resources = () => {
       resourcesUrl += `?${params.toString()}`;
     }
 
-    const fetchResources = api.get(resourcesUrl);
-    const fetchCategories = api.get('/resource-categories/');
-
-    Promise.all([fetchResources, fetchCategories])
-      .then(([resourcesResponse, categoriesResponse]) => {
-        let fetchedResources: Resource[] = resourcesResponse.data;
-        const fetchedCategories: Category[] = categoriesResponse.data;
+    // List and categories in one request
+    api.get(resourcesUrl)
+      .then((response) => {
+        let fetchedResources: Resource[] = response.data.resources;
+        const fetchedCategories: Category[] = response.data.categories;
 
         setCategories(fetchedCategories);
 
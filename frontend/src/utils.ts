@@ -8,3 +8,40 @@ export const getImageUrl = (url?: string): string => {
   const baseUrl = import.meta.env.VITE_API_URL || 'http://localhost:8000';
   return `${baseUrl}${url}`;
 };
+
+// Direct upload: the API signs a form, the file goes straight to storage, then the API
+// records the result. Returns the image URL to save on the post/resource/club.
+export const uploadImage = async (file: File, token: string): Promise<string> => {
+  const baseUrl = import.meta.env.VITE_API_URL || 'http://localhost:8000';
+  const headers = { 'Content-Type': 'application/json', Authorization: `Bearer ${token}` };
+  const detail = async (response: Response) => (await response.json().catch(() => ({}))).detail || response.statusText;
+
+  const presignResponse = await fetch(`${baseUrl}/uploads/presign`, {
+    method: 'POST',
+    headers,
+    body: JSON.stringify({ filename: file.name, content_type: file.type, size: file.size }),
+  });
+  if (!presignResponse.ok) {
+    throw new Error(await detail(presignResponse));
+  }
+  const presigned = await presignResponse.json();
+
+  const form = new FormData();
+  Object.entries(presigned.fields as Record<string, string>).forEach(([name, value]) => form.append(name, value));
+  form.append(presigned.file_field, file);
+  const storageUrl = presigned.url.startsWith('http') ? presigned.url : `${baseUrl}${presigned.url}`;
+  const storageResponse = await fetch(storageUrl, { method: presigned.method, body: form });
+  if (!storageResponse.ok) {
+    throw new Error(await detail(storageResponse));
+  }
+
+  const completeResponse = await fetch(`${baseUrl}/uploads/${presigned.upload_id}/complete`, {
+    method: 'POST',
+    headers,
+    body: JSON.stringify(await storageResponse.json()),
+  });
+  if (!completeResponse.ok) {
+    throw new Error(await detail(completeResponse));
+  }
+  return (await completeResponse.json()).url;
+};